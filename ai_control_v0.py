@@ -36,6 +36,7 @@ from scipy import interpolate
 from common.model_structure import *
 from common.wall import *
 from common.setting import *
+from common.server import model_client
 
 # Setting
 base_path = os.path.abspath(os.path.dirname(sys.argv[0]))
@@ -55,6 +56,7 @@ plot_length = 165
 t_delay = 0.002
 steady_model = False
 bavg = 0.0
+server_address = None # Socket of a running model_server.py to share its models instead of loading them
 
 # Fixed setting
 year_in = 2021
@@ -121,16 +123,17 @@ class KSTARWidget(QDialog):
             self.targets[target_param] = [target_init[i],target_init[i]]
 
         # Load models
-        self.k2rz = k2rz(model_path=k2rz_model_path, n_models=max_shape_models)
+        load = model_client(server_address).load if server_address is not None else lambda cls, **kwargs: cls(**kwargs)
+        self.k2rz = load(k2rz, model_path=k2rz_model_path, n_models=max_shape_models)
         if steady_model:
-            self.kstar_nn = kstar_nn(model_path=nn_model_path, n_models=max_models)
+            self.kstar_nn = load(kstar_nn, model_path=nn_model_path, n_models=max_models)
         else:
-            self.kstar_nn = kstar_nn(model_path=nn_model_path, n_models=1)
-            self.kstar_lstm = kstar_lstm(model_path=lstm_model_path, n_models=max_models)
-        self.bpw_nn = bpw_nn(model_path=bpw_model_path, n_models=max_models)
+            self.kstar_nn = load(kstar_nn, model_path=nn_model_path, n_models=1)
+            self.kstar_lstm = load(kstar_lstm, model_path=lstm_model_path, n_models=max_models)
+        self.bpw_nn = load(bpw_nn, model_path=bpw_model_path, n_models=max_models)
         
         # Load agents
-        self.designer = SB2_model(
+        self.designer = load(SB2_model,
             model_path = rl_designer_model_path, 
             low_state = low_state, 
             high_state = high_state, 
@@ -141,7 +144,7 @@ class KSTARWidget(QDialog):
             norm=True, 
             bavg=bavg
         )
-        self.rl_k2x = SB2_model(
+        self.rl_k2x = load(SB2_model,
             model_path = rl_k2x_model_path,
             low_state = low_state_k2x, 
             high_state = high_state_k2x, 
@@ -36,10 +36,15 @@ from scipy import interpolate
 from common.model_structure import *
 from common.wall import *
 from common.setting import *
+from common.server import model_client
+from common.atlas import load_atlas, infeasible_spans
+from common.simulator import designer_plasma, linear_ramp
+from common.cem import cem_designer
 
 # Setting
 base_path = os.path.abspath(os.path.dirname(sys.argv[0]))
 background_path   = base_path + '/images/insideKSTAR.jpg'
+atlas_path        = base_path + '/atlas/ai_control_v1.npz' # Made by feasibility_atlas.py, shades unreachable targets
 lstm_model_path   = base_path + '/weights/lstm/'
 nn_model_path     = base_path + '/weights/nn/'
 bpw_model_path    = base_path + '/weights/bpw/'
@@ -56,6 +61,10 @@ plot_length = 165
 t_delay = 0.002
 steady_model = False
 bavg = 0.0
+server_address = None # Socket of a running model_server.py to share its models instead of loading them
+cem_samples = 256 # Sampled ramps per iteration of the CEM designer
+cem_knots = 2
+cem_time_budget = 5.0 # [s] per design
 
 # Fixed setting
 year_in = 2021
@@ -120,18 +129,20 @@ class KSTARWidget(QDialog):
         self.targets = {}
         for i,target_param in enumerate(target_params):
             self.targets[target_param] = [target_init[i],target_init[i]]
+        self.atlas = load_atlas(atlas_path) if os.path.exists(atlas_path) else None
 
         # Load models
-        self.k2rz = k2rz(model_path=k2rz_model_path, n_models=max_shape_models)
+        load = model_client(server_address).load if server_address is not None else lambda cls, **kwargs: cls(**kwargs)
+        self.k2rz = load(k2rz, model_path=k2rz_model_path, n_models=max_shape_models)
         if steady_model:
-            self.kstar_nn = kstar_nn(model_path=nn_model_path, n_models=max_models)
+            self.kstar_nn = load(kstar_nn, model_path=nn_model_path, n_models=max_models)
         else:
-            self.kstar_nn = kstar_nn(model_path=nn_model_path, n_models=1)
-            self.kstar_lstm = kstar_lstm(model_path=lstm_model_path, n_models=max_models)
-        self.bpw_nn = bpw_nn(model_path=bpw_model_path, n_models=max_models)
+            self.kstar_nn = load(kstar_nn, model_path=nn_model_path, n_models=1)
+            self.kstar_lstm = load(kstar_lstm, model_path=lstm_model_path, n_models=max_models)
+        self.bpw_nn = load(bpw_nn, model_path=bpw_model_path, n_models=max_models)
         
         # Load agents
-        self.designer_1s = SB2_model(
+        self.designer_1s = load(SB2_model,
             model_path = rl_1s_model_path, 
             low_state = low_state, 
             high_state = high_state, 
@@ -142,7 +153,7 @@ class KSTARWidget(QDialog):
             norm=True, 
             bavg=bavg
         )
-        self.designer_2s = SB2_model(
+        self.designer_2s = load(SB2_model,
             model_path = rl_2s_model_path,      
             low_state = low_state,
             high_state = high_state,
@@ -153,7 +164,7 @@ class KSTARWidget(QDialog):
             norm=True,
             bavg=bavg
         )
-        self.rl_k2x = SB2_model(
+        self.rl_k2x = load(SB2_model,
             model_path = rl_k2x_model_path,
             low_state = low_state_k2x, 
             high_state = high_state_k2x, 
@@ -165,6 +176,13 @@ class KSTARWidget(QDialog):
             bavg=bavg
         )
 
+        # Cross-entropy-method designer on the same surrogates, as an alternative to the RL designers
+        if not steady_model:
+            self.cem = cem_designer(designer_plasma(self.kstar_lstm, self.bpw_nn, self.kstar_nn, interval=interval),
+                low_action, high_action, target_mins, target_maxs, target_params,
+                n_knots=cem_knots, n_samples=cem_samples, time_budget=cem_time_budget
+            )
+
         # Top layout
         topLayout = QHBoxLayout()
         
@@ -204,6 +222,10 @@ class KSTARWidget(QDialog):
         self.overplotCheckBox.setChecked(True)
         self.overplotCheckBox.stateChanged.connect(self.rePlotOutputBox)
 
+        self.cemCheckBox = QCheckBox('CEM designer')
+        self.cemCheckBox.setChecked(False)
+        self.cemCheckBox.setEnabled(not steady_model)
+
         self.showInputCheckBox = QCheckBox('Show input panel')
         self.showInputCheckBox.setChecked(False)
 
@@ -216,6 +238,7 @@ class KSTARWidget(QDialog):
         topLayout.addWidget(self.plotHeatingCheckBox)
         topLayout.addWidget(self.plotHeatLoadCheckBox)
         topLayout.addWidget(self.overplotCheckBox)
+        topLayout.addWidget(self.cemCheckBox)
         #topLayout.addWidget(self.showInputCheckBox)
 
         # Middle layout
@@ -266,6 +289,8 @@ class KSTARWidget(QDialog):
     def resetInterval(self):
         self.interval = self.intervalBox.value()
         self.designer = self.designer_1s if self.interval < 15 else self.designer_2s
+        if not steady_model:
+            self.cem.plasma.interval = self.interval
 
     def createInputBox(self):
         self.inputBox = QGroupBox('Input parameters')
@@ -385,12 +410,15 @@ class KSTARWidget(QDialog):
         new_action = self.designer.predict(observation)
 
         current_action = [i2f(self.inputSliderDict[input_params[i]].value()) for i in idx_convert]
-        daction = (new_action - current_action) / self.interval
+        if self.cemCheckBox.isChecked() and not self.first:
+            t0 = time.time()
+            ramp, _ = self.cem.design(self.controlState(observation[12:]), init=new_action)
+            print(f'CEM design: {self.cem.iterations} iterations in {time.time() - t0:.1f} s, cost {self.cem.best_cost:.3g}')
+        else:
+            ramp = linear_ramp(current_action, new_action, self.interval)
         for i in range(self.interval): # Control phase
-            current_action += daction
-            current_action[6:] = new_action[6:] # Step function for NBIs
-            for i, idx in enumerate(idx_convert):
-                self.inputSliderDict[input_params[idx]].setValue(f2i(current_action[i]))
+            for j, idx in enumerate(idx_convert):
+                self.inputSliderDict[input_params[idx]].setValue(f2i(ramp[i][j]))
             time.sleep(t_delay)
         for i in range(self.interval): # Relaxation phase
             #self.reCreateOutputBox()
@@ -400,6 +428,15 @@ class KSTARWidget(QDialog):
             else:
                 self.reCreateOutputBox()
 
+    def controlState(self, targets):
+        return {
+            'x': self.x,
+            'u': [i2f(self.inputSliderDict[p].value()) for p in input_params],
+            'outputs': {p: self.outputs[p][-1] for p in output_params2},
+            'targets': targets,
+            'time': 0.,
+        }
+
     def plotPlasma(self,predict=True):
         # Predict plasma
         if predict:
@@ -476,6 +513,7 @@ class KSTARWidget(QDialog):
         for i in range(int((max(ts) - min(ts)) / period) + 1):
             label = 'Target' if i == 0 else None
             plt.plot(ts[::-1][2 * i * self.interval + 1 : (2 * i + 1) * self.interval], self.targets['βp'][::-1][2 * i * self.interval + 1: (2 * i + 1) * self.interval], 'b', alpha=alpha, linewidth=4*(100/dpi), label=label)
+        self.shadeInfeasible(target_params.index('βp'))
         plt.grid(linewidth=0.5*(100/dpi))
         plt.legend(loc='upper left',fontsize=7.5*(100/dpi),frameon=False)
         plt.xlim([-0.1*plot_length-0.2,0.2])
@@ -489,6 +527,7 @@ class KSTARWidget(QDialog):
         for i in range(int((max(ts) - min(ts)) / period) + 1):
             label = 'Target' if i == 0 else None
             plt.plot(ts[::-1][2 * i * self.interval + 1: (2 * i + 1) * self.interval], self.targets['q95'][::-1][2 * i * self.interval + 1: (2 * i + 1) * self.interval], 'b', alpha=alpha, linewidth=4*(100/dpi), label=label)
+        self.shadeInfeasible(target_params.index('q95'))
         plt.grid(linewidth=0.5*(100/dpi))
         plt.legend(loc='upper left',fontsize=7.5*(100/dpi),frameon=False)
         plt.xlim([-0.1*plot_length-0.2,0.2])
@@ -502,6 +541,7 @@ class KSTARWidget(QDialog):
         for i in range(int((max(ts) - min(ts)) / period) + 1):
             label = 'Target' if i == 0 else None
             plt.plot(ts[::-1][2 * i * self.interval + 1: (2 * i + 1) * self.interval], self.targets['li'][::-1][2 * i * self.interval + 1: (2 * i + 1) * self.interval], 'b', alpha=alpha, linewidth=4*(100/dpi), label=label)
+        self.shadeInfeasible(target_params.index('li'))
         plt.grid(linewidth=0.5*(100/dpi))
         plt.legend(loc='upper left',fontsize=7.5*(100/dpi),frameon=False)
         plt.xlim([-0.1*plot_length-0.2,0.2])
@@ -513,6 +553,13 @@ class KSTARWidget(QDialog):
 
         self.first = False
 
+    def shadeInfeasible(self, i):
+        if self.atlas is None:
+            return
+        targets = [i2f(self.targetSliderDict[p].value()) for p in target_params]
+        for j, (lo, hi) in enumerate(infeasible_spans(self.atlas, i, targets)):
+            plt.axhspan(lo, hi, color='r', alpha=0.1, linewidth=0, label='Infeasible' if j == 0 else None)
+
     def predictBoundary(self):
         ip = self.inputSliderDict[input_params[0]].value()/10**decimals
         bt = self.inputSliderDict[input_params[1]].value()/10**decimals
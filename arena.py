@@ -0,0 +1,51 @@
+#!/usr/bin/env python
+
+import os, sys, glob, time
+import numpy as np
+from common.simulator import *
+from common.scenario import load_scenario, run_scenarios, run_arena, arena_scenarios, restrict
+from common.metrics import metric_names, metrics_table
+
+# Setting
+base_path = os.path.abspath(os.path.dirname(sys.argv[0]))
+scenario_path = base_path + '/scenarios/'
+out_path = base_path + '/scenarios/results/'
+max_models = 10
+policies = ['3frame', '3frame_wide', 'single', 'single_wide', 'bp_q95'] # Variants of weights/rl/rt_control (rt_policy_variants in common/simulator.py)
+bavg = 0.0
+record = False # One .rec per policy and scenario in out_path, readable by replay.py
+time_sequential = False # Also run the policies one after another, for the cost of the arena against separate runs
+
+if __name__ == '__main__':
+    paths = sys.argv[1:] or sorted(glob.glob(scenario_path + '*.json') + glob.glob(scenario_path + '*.y*ml'))
+    scenarios = [load_scenario(p) for p in paths]
+    models = rt_control_models(base_path, n_models=max_models)
+    lanes = [variant_plasma(p, models, base_path, bavg=bavg) for p in policies]
+    arena = arena_plasma(lanes)
+
+    os.makedirs(out_path, exist_ok=True)
+    t0 = time.time()
+    results = run_arena(arena, scenarios, names=policies, record_path=out_path if record else None)
+    print(f'{len(policies)} policies x {len(scenarios)} scenarios in {time.time() - t0:.1f} s')
+    if time_sequential:
+        t0 = time.time()
+        merged = arena_scenarios(lanes, scenarios)[1] # The arena's initial targets, and the part of each scenario that applies
+        for lane in lanes:
+            run_scenarios(lane, [restrict(s, lane) for s in merged])
+        print(f'One after another: {time.time() - t0:.1f} s')
+
+    # Side by side per scenario: one row per policy, metrics averaged over its target changes (IAE summed)
+    signals = list(dict.fromkeys(p for lane in lanes for p in lane.target_params))
+    lines = ['scenario,policy,signal,' + ','.join(metric_names)]
+    for k in range(len(scenarios)):
+        summary = {m: np.full((len(policies), 1, len(signals)), np.nan) for m in metric_names}
+        for i, (policy, lane) in enumerate(zip(policies, lanes)):
+            for j, p in enumerate(lane.target_params):
+                for m in metric_names:
+                    v = results[i][k]['metrics'][m][:, 0, j]
+                    summary[m][i, 0, signals.index(p)] = np.sum(v) if m == 'iae' else np.nanmean(v) if np.any(~np.isnan(v)) else np.nan
+                lines.append(f'{results[i][k]["name"]},{policy},{p},' + ','.join(f'{summary[m][i, 0, signals.index(p)]:.6g}' for m in metric_names))
+        print(f'\n{results[0][k]["name"]}\n' + metrics_table(summary, signals, rows=policies, width=16))
+    with open(out_path + 'arena.csv', 'w') as f:
+        f.write('\n'.join(lines) + '\n')
+    print(f'\nSaved to {out_path}arena.csv')
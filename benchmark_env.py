@@ -0,0 +1,47 @@
+#!/usr/bin/env python
+
+import os, sys, time
+import numpy as np
+from common.simulator import *
+from common.env import rt_control_env, ai_control_env
+from common.jacobian import jacobian_model
+
+# Setting
+base_path = os.path.abspath(os.path.dirname(sys.argv[0]))
+gui = 'rt_control_v3' # or 'ai_control_v1'
+max_models = 10
+n_envs = 256
+n_steps = 300
+numpy_twins = True # Surrogates as NumPy twins, without the per-call overhead of Keras predict
+interval = 20
+seed = 0
+
+# Path of weights
+rl_model_path = base_path + '/weights/rl/rt_control/bp_q95/best_model.zip'
+rl_1s_model_path = base_path + '/weights/rl/nbi_control/interval_1s/best_model0.zip'
+rl_2s_model_path = base_path + '/weights/rl/nbi_control/interval_2s/best_model0.zip'
+
+if __name__ == '__main__':
+    if gui == 'rt_control_v3':
+        models = rt_control_models(base_path, n_models=max_models)
+        policy = rt_policy(rl_model_path)
+    else:
+        models = ai_control_models(base_path, n_models=max_models)
+        policy = ai_designer(rl_1s_model_path if interval < 15 else rl_2s_model_path)
+    if numpy_twins:
+        models = {k: jacobian_model(m) for k, m in models.items()}
+    env = rt_control_env(models, n_envs, seed=seed) if gui == 'rt_control_v3' else ai_control_env(models, n_envs, interval=interval, seed=seed)
+
+    # The pretrained policy acts on the normalized observations directly
+    obs = env.reset()
+    returns, episode_return = [], np.zeros(n_envs)
+    t0 = time.time()
+    for _ in range(n_steps):
+        obs, rewards, dones, infos = env.step(policy.forward(obs))
+        episode_return += rewards
+        if dones[0]:
+            returns.append(episode_return.mean())
+            episode_return = np.zeros(n_envs)
+    elapsed = time.time() - t0
+    print(f'{n_envs * n_steps / elapsed:.0f} environment steps/s ({n_envs} environments, {n_steps} steps in {elapsed:.1f} s)')
+    print(f'Mean episode return of the pretrained policy: {np.mean(returns):.3f} over {len(returns)} episodes')
@@ -0,0 +1,49 @@
+import numpy as np
+
+# Achievable-target atlas: a regular grid over the target box with the tracking
+# error the controller reached at every point, saved as a plain npz so the
+# GUIs can look up feasibility without running anything.
+
+def target_grid(low, high, n):
+    axes = [np.linspace(l, h, n) for l, h in zip(low, high)]
+    grid = np.stack(np.meshgrid(*axes, indexing='ij'), axis=-1).reshape(-1, len(axes))
+    return axes, grid
+
+def reached_error(outputs, targets, low, high, n_avg=10):
+    # outputs (ticks, batch, n_targets); error normalized by the target box, worst target
+    reached = np.mean(outputs[-n_avg:], axis=0)
+    error = np.max(np.abs(reached - targets) / np.subtract(high, low), axis=1)
+    return reached, error
+
+def save_atlas(path, axes, target_params, error, success, reached, tolerance, min_success=0.5):
+    arrays = {f'axis{i}': a for i, a in enumerate(axes)}
+    np.savez(path, target_params=np.array(target_params), error=error, success=success, reached=reached,
+             tolerance=tolerance, min_success=min_success, **arrays)
+
+def load_atlas(path):
+    with np.load(path) as f:
+        atlas = {k: f[k] for k in f.files}
+    atlas['axes'] = [atlas.pop(f'axis{i}') for i in range(len(atlas['target_params']))]
+    atlas['target_params'] = list(atlas['target_params'])
+    atlas['feasible'] = atlas['success'] >= atlas['min_success']
+    return atlas
+
+def nearest_index(atlas, targets):
+    return tuple(int(np.argmin(np.abs(a - t))) for a, t in zip(atlas['axes'], targets))
+
+def is_feasible(atlas, targets):
+    return bool(atlas['feasible'][nearest_index(atlas, targets)])
+
+def infeasible_spans(atlas, i, targets):
+    # Infeasible intervals of target i with the other targets at their nearest grid values
+    idx = list(nearest_index(atlas, targets))
+    idx[i] = slice(None)
+    feasible, a = atlas['feasible'][tuple(idx)], atlas['axes'][i]
+    edges = np.concatenate([[a[0]], 0.5 * (a[1:] + a[:-1]), [a[-1]]])
+    spans = []
+    for j in np.flatnonzero(~feasible):
+        if spans and spans[-1][1] == edges[j]:
+            spans[-1] = (spans[-1][0], edges[j + 1])
+        else:
+            spans.append((edges[j], edges[j + 1]))
+    return spans
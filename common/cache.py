@@ -0,0 +1,86 @@
+import hashlib, json, os, time
+import numpy as np
+
+# Content-addressed store of simulation results. The key hashes the checksums
+# of the weight files, the controller configuration and the scenario, so any
+# change of those misses; entries are single npz files, and the least recently
+# used ones are evicted when the store outgrows max_bytes.
+
+checksums = {}
+
+def file_checksum(path):
+    # sha256 of a file, memoized while its size and mtime stay the same
+    stat = os.stat(path)
+    key = (path, stat.st_size, stat.st_mtime)
+    if key not in checksums:
+        h = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                h.update(block)
+        checksums[key] = h.hexdigest()
+    return checksums[key]
+
+def weights_checksum(*paths):
+    # One checksum over weight files and directories (every file below them, in sorted order)
+    h = hashlib.sha256()
+    for path in paths:
+        files = [path] if os.path.isfile(path) else sorted(os.path.join(d, f) for d, _, fs in os.walk(path) for f in fs)
+        for f in files:
+            h.update(os.path.relpath(f, path).encode('utf-8') + file_checksum(f).encode('utf-8'))
+    return h.hexdigest()
+
+def cache_key(*parts):
+    return hashlib.sha256(json.dumps(parts, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+class result_cache():
+    def __init__(self, path, max_bytes=2**30):
+        self.path, self.max_bytes = path, max_bytes
+        os.makedirs(path, exist_ok=True)
+        self.hits = self.misses = 0
+
+    def file(self, key):
+        return os.path.join(self.path, key[:2], key + '.npz')
+
+    def get(self, key):
+        # dict of arrays, or None; a hit refreshes the entry for eviction
+        path = self.file(key)
+        try:
+            with np.load(path, allow_pickle=False) as f:
+                entry = {k: f[k] for k in f.files}
+            os.utime(path)
+        except (OSError, ValueError, EOFError): # Missing, being written or evicted meanwhile
+            self.misses += 1
+            return None
+        self.hits += 1
+        return entry
+
+    def put(self, key, **arrays):
+        path = self.file(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f'{path}.{os.getpid()}.tmp.npz'
+        np.savez(tmp, **arrays)
+        os.replace(tmp, path) # Readers never see a partial entry
+        self.evict()
+
+    def evict(self):
+        entries = []
+        for d, _, fs in os.walk(self.path):
+            for f in fs:
+                if f.endswith('.npz') and '.tmp' not in f:
+                    try:
+                        stat = os.stat(os.path.join(d, f))
+                    except OSError: # Evicted by another process
+                        continue
+                    entries.append((stat.st_mtime, stat.st_size, os.path.join(d, f)))
+        total = sum(e[1] for e in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            total -= size
+
+    def size(self):
+        return sum(os.path.getsize(os.path.join(d, f)) for d, _, fs in os.walk(self.path) for f in fs)
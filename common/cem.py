@@ -0,0 +1,67 @@
+import time
+import numpy as np
+from common.simulator import ai_action_idx
+
+# Cross-entropy-method trajectory designer for ai_control_v1. The control-phase
+# actuator ramp is parametrized by n_knots waypoints; every iteration rolls all
+# sampled ramps through the control and relaxation phases in one batch and
+# refits the sampling distribution to the elite.
+
+class cem_designer():
+    def __init__(self, plasma, low_action, high_action, low_target, high_target, target_params=['βp', 'q95', 'li'],
+                 n_knots=2, n_samples=256, n_elite=25, max_iters=10, time_budget=5.0, alpha=0.7, init_std=0.25, min_std=0.01, seed=None):
+        self.plasma = plasma
+        self.low_action, self.high_action = np.array(low_action), np.array(high_action)
+        self.target_scale = np.subtract(high_target, low_target)
+        self.target_params = target_params
+        self.n_knots, self.n_samples, self.n_elite = n_knots, n_samples, n_elite
+        self.max_iters, self.time_budget = max_iters, time_budget # Iterations that would overrun the budget [s] are skipped
+        self.alpha, self.init_std, self.min_std = alpha, init_std, min_std # Relative to the action bounds
+        self.rng = np.random.default_rng(seed)
+
+    def ramp(self, current, knots):
+        # Piecewise-linear through evenly spaced knots; NBIs step to the knot value at the start of each segment
+        interval = self.plasma.interval
+        points = np.concatenate([np.broadcast_to(current, knots[:, :1].shape), knots], axis=1)
+        t = np.arange(1, interval + 1) / interval * self.n_knots
+        j = np.clip(np.ceil(t).astype(int) - 1, 0, self.n_knots - 1)
+        w = (t - j)[None, :, None]
+        ramp = points[:, j] * (1 - w) + points[:, j + 1] * w
+        ramp[:, :, 6:] = points[:, j + 1, 6:]
+        return ramp
+
+    def cost(self, state, knots):
+        current = np.asarray(state['u'], dtype=float)[ai_action_idx]
+        self.plasma.set_state(state, repeat=len(knots))
+        self.plasma.control_phase(self.ramp(current, knots))
+        self.plasma.relaxation_phase()
+        err = (self.plasma.output(self.target_params) - np.asarray(state['targets'])) / self.target_scale
+        return np.sum(err**2, axis=1)
+
+    def design(self, state, init=None):
+        # Returns the best control-phase ramp (interval, 9) and its knots; init (e.g. the RL designer action) seeds the mean
+        current = np.asarray(state['u'], dtype=float)[ai_action_idx]
+        scale = self.high_action - self.low_action
+        if init is None:
+            mean = np.tile(current, (self.n_knots, 1))
+        else: # Knots on the linear ramp to init, so the first candidate is the RL design itself
+            mean = current + (np.asarray(init) - current) * (np.arange(1, self.n_knots + 1) / self.n_knots)[:, None]
+            mean[:, 6:] = init[6:]
+        std = np.tile(self.init_std * scale, (self.n_knots, 1))
+        best, best_cost = mean, np.inf
+        t0 = time.time()
+        for it in range(self.max_iters):
+            knots = mean + std * self.rng.standard_normal((self.n_samples, self.n_knots, len(scale)))
+            knots[0] = mean
+            knots = np.clip(knots, self.low_action, self.high_action)
+            cost = self.cost(state, knots)
+            elite = knots[np.argsort(cost)[:self.n_elite]]
+            if cost.min() < best_cost:
+                best, best_cost = knots[np.argmin(cost)], cost.min()
+            mean = self.alpha * elite.mean(axis=0) + (1 - self.alpha) * mean
+            std = np.maximum(self.alpha * elite.std(axis=0) + (1 - self.alpha) * std, self.min_std * scale)
+            elapsed = time.time() - t0
+            if elapsed * (it + 2) / (it + 1) > self.time_budget:
+                break
+        self.iterations, self.best_cost = it + 1, best_cost
+        return self.ramp(current, best[None])[0], best
@@ -0,0 +1,71 @@
+import os, time
+import numpy as np
+from tensorflow.keras import models
+from common.simulator import *
+
+# Distillation of a surrogate ensemble into one student network of the same
+# architecture as a member, trained on the normalized ensemble mean (and, as a
+# second student, the member spread) over closed-loop samples of the operating
+# envelope. Students load with the original wrappers and n_models=1.
+
+def envelope_samples(models, n_envs=256, n_ticks=200, spread=1.0, sigma=0.05, seed=None):
+    # Inputs of kstar_lstm, bpw_nn and x2k along rt_control_v3 rollouts with random operating points and random-walk actions
+    rng = np.random.default_rng(seed)
+    sim = rt_plasma(models['kstar_lstm'], models['bpw_nn'], models['kstar_nn'], models['x2k'])
+    u = sample_inputs(n_envs, rt_input_init, rt_input_mins, rt_input_maxs, list(range(n_inputs)), spread, rng)
+    sim.reset(u, np.zeros([n_envs, 2]), action=rng.uniform(rt_low_action, rt_high_action, size=(n_envs, 6)))
+    scale = np.subtract(rt_high_action, rt_low_action)
+    samples = {'kstar_lstm': [], 'bpw_nn': [], 'x2k': []}
+    for _ in range(n_ticks):
+        action = np.clip(sim.action + sigma * scale * rng.standard_normal(sim.action.shape), rt_low_action, rt_high_action)
+        samples['x2k'].append(x2k_features(action, sim.u[:, 1], sim.outputs['βp']))
+        sim.control(action)
+        x = sim.x.copy()
+        x[:, :-1, len(output_params0):] = x[:, 1:, len(output_params0):]
+        x[:, -1, len(output_params0):] = sim.features(sim.u)
+        samples['kstar_lstm'].append(x)
+        sim.predict0d()
+        samples['bpw_nn'].append(bpw_features(sim.u, sim.outputs['βn']))
+    return {k: np.concatenate(v) for k, v in samples.items()}
+
+def teacher_targets(teacher, x, batch_size=4096):
+    # Normalized ensemble mean and member spread
+    ys = np.array([np.concatenate([m.predict(x[i:i + batch_size]) for i in range(0, len(x), batch_size)]) for m in teacher.models])
+    return ys.mean(axis=0), ys.std(axis=0)
+
+def train_student(teacher, x, y, epochs=50, batch_size=256, validation_split=0.1, patience=5, verbose=2):
+    from tensorflow.keras.callbacks import EarlyStopping
+    student = models.clone_model(teacher.models[0])
+    student.compile(optimizer='adam', loss='mse')
+    student.fit(x, y, epochs=epochs, batch_size=batch_size, validation_split=validation_split, shuffle=True, verbose=verbose,
+                callbacks=[EarlyStopping(patience=patience, restore_best_weights=True)])
+    return student
+
+def save_student(teacher, student, path):
+    # Same file layout as the members: LSTM wrappers rebuild the model and load weights, dense wrappers load the model
+    os.makedirs(path, exist_ok=True)
+    if isinstance(teacher, (kstar_lstm, kstar_v220505)):
+        student.save_weights(path + '/best_model0', save_format='h5')
+    else:
+        student.save(path + '/best_model0', save_format='h5')
+
+def latency(model, x, repeats=20):
+    # Median of single-sample predict_batch calls, as in one GUI tick
+    times = []
+    for _ in range(repeats):
+        t0 = time.time()
+        model.predict_batch(x[:1])
+        times.append(time.time() - t0)
+    return np.median(times)
+
+def compare(teacher, student, x, batch_size=4096):
+    # Error of the student against the teacher ensemble in physical units, and single-sample latency of both
+    y_teacher = np.concatenate([teacher.predict_batch(x[i:i + batch_size]) for i in range(0, len(x), batch_size)])
+    y_student = np.concatenate([student.predict_batch(x[i:i + batch_size]) for i in range(0, len(x), batch_size)])
+    err = y_student - y_teacher
+    return {
+        'rmse': np.sqrt(np.mean(err**2, axis=0)),
+        'max': np.max(np.abs(err), axis=0),
+        'teacher_latency': latency(teacher, x),
+        'student_latency': latency(student, x),
+    }
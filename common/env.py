@@ -0,0 +1,78 @@
+import numpy as np
+from common.simulator import *
+
+# Vectorized Gym-style environments on the batched surrogate plasmas, for
+# retraining or fine-tuning the SB2 policies. Observations and actions are
+# normalized to [-1, 1] with the bounds SB2_model uses, and all environments
+# run their episodes in lockstep (reset together, Stable Baselines VecEnv API).
+
+def normalize(x, low, high):
+    return 2 * (np.asarray(x, dtype=float) - low) / np.subtract(high, low) - 1
+
+def denormalize(y, low, high):
+    return 0.5 * np.subtract(high, low) * (np.asarray(y, dtype=float) + 1) + low
+
+class vector_env():
+    def __init__(self, plasma, n_envs, low_state, high_state, low_action, high_action, low_target, high_target, target_params,
+                 input_init, input_mins, input_maxs, random_inputs, episode_length, spread=0.1, bavg=0., seed=None):
+        self.plasma, self.num_envs = plasma, n_envs
+        self.low_state, self.high_state = np.array(low_state), np.array(high_state)
+        self.low_action, self.high_action = np.array(low_action), np.array(high_action)
+        self.low_target, self.high_target = np.array(low_target), np.array(high_target)
+        self.target_params = target_params
+        self.input_init, self.input_mins, self.input_maxs = input_init, input_mins, input_maxs
+        self.random_inputs, self.spread = random_inputs, spread # Uncontrolled inputs perturbed at every reset
+        self.episode_length, self.bavg = episode_length, bavg
+        self.observation_shape, self.action_shape = self.low_state.shape, self.low_action.shape
+        self.rng = np.random.default_rng(seed)
+
+    def reset(self):
+        u = sample_inputs(self.num_envs, self.input_init, self.input_mins, self.input_maxs, self.random_inputs, self.spread, self.rng)
+        self.targets = self.rng.uniform(self.low_target, self.high_target, size=(self.num_envs, len(self.low_target)))
+        self.plasma.reset(u, self.targets)
+        self.steps = 0
+        return normalize(self.plasma.observation(), self.low_state, self.high_state)
+
+    def step(self, actions):
+        # actions (n_envs, n_actions) in [-1, 1], i.e. the tanh output of the policy
+        action = denormalize(np.clip(actions, -1, 1), self.low_action, self.high_action)
+        action = self.bavg * self.current_action() + (1 - self.bavg) * action
+        self.act(action)
+        self.steps += 1
+        err = (self.plasma.output(self.target_params) - self.targets) / (self.high_target - self.low_target)
+        rewards = -np.sum(err**2, axis=1)
+        obs = normalize(self.plasma.observation(), self.low_state, self.high_state)
+        infos = [{} for _ in range(self.num_envs)]
+        done = self.steps >= self.episode_length
+        if done:
+            for info, o in zip(infos, obs):
+                info['terminal_observation'] = o
+            obs = self.reset()
+        return obs, rewards, np.full(self.num_envs, done), infos
+
+class rt_control_env(vector_env):
+    # rt_control_v3: one 0.1 s tick per step, observation of the lookback histories and the targets
+    def __init__(self, models, n_envs, lookback=rt_lookback, episode_length=100, **kwargs):
+        plasma = rt_plasma(models['kstar_lstm'], models['bpw_nn'], models['kstar_nn'], models['x2k'], lookback=lookback)
+        low_state, high_state = rt_state_bounds(lookback)
+        super().__init__(plasma, n_envs, low_state, high_state, rt_low_action, rt_high_action, rt_low_target, rt_high_target,
+                         rt_target_params, rt_input_init, rt_input_mins, rt_input_maxs, [1, 2, 3, 4, 5, 6, 7], episode_length, **kwargs)
+
+    def current_action(self):
+        return self.plasma.action
+
+    def act(self, action):
+        self.plasma.step(action)
+
+class ai_control_env(vector_env):
+    # ai_control_v1: one designer interval (control and relaxation phases) per step, 15-dim state
+    def __init__(self, models, n_envs, interval=ai_interval, episode_length=3, **kwargs):
+        plasma = designer_plasma(models['kstar_lstm'], models['bpw_nn'], models['kstar_nn'], interval=interval)
+        super().__init__(plasma, n_envs, ai_low_state, ai_high_state, ai_low_action, ai_high_action, ai_low_target, ai_high_target,
+                         ai_target_params, ai_input_init, ai_input_mins, ai_input_maxs, [1, 2, 6, 7], episode_length, **kwargs)
+
+    def current_action(self):
+        return self.plasma.u[:, ai_action_idx]
+
+    def act(self, action):
+        self.plasma.design(action)
@@ -0,0 +1,80 @@
+import numpy as np
+
+# Vectorized versions of the input assembly done in the GUIs' predict0d,
+# predictBoundary and autoControl. u holds the input panel values in
+# input_params order (Ip, Bt, GW.frac., Pnb1a, Pnb1b, Pnb1c, Pec2, Pec3,
+# Zec2, Zec3, In.Mid., Out.Mid., Elon., Up.Tri., Lo.Tri.) along the last axis.
+
+n_inputs = 15
+year_in = 2021
+
+def limited(rin):
+    # Inner-wall limited flag
+    return (rin > 1.265 + 1.e-4).astype(float)
+
+def nn_features(u, year=year_in):
+    # kstar_nn inputs (17), also the last 17 columns of the kstar_lstm window
+    u = np.asarray(u, dtype=float)
+    x = np.zeros(u.shape[:-1] + (17,))
+    x[..., :16] = u[..., [0, 1, 3, 4, 5, 6, 7, 8, 9, 10, 11, 12, 13, 14, 10, 2]]
+    x[..., 9], x[..., 10] = 0.5 * (u[..., 10] + u[..., 11]), 0.5 * (u[..., 11] - u[..., 10])
+    x[..., 14] = limited(u[..., 10])
+    x[..., 16] = year
+    return x
+
+def v220505_features(u, year=year_in):
+    # Actuator columns (14) of the kstar_v220505 window, after the 4 0D outputs
+    u = np.asarray(u, dtype=float)
+    x = np.zeros(u.shape[:-1] + (14,))
+    x[..., :13] = u[..., [0, 1, 2, 12, 13, 14, 10, 11, 3, 4, 5, 6, 10]]
+    x[..., 11] += u[..., 7]
+    x[..., 12] = limited(u[..., 10])
+    x[..., 13] = year
+    return x
+
+def lstm_features(u, y0d, v220505=True, year=year_in):
+    # One window row per sample: previous 0D outputs (βn, q95, q0, li) and current actuators
+    f = v220505_features(u, year) if v220505 else nn_features(u, year)
+    return np.concatenate([np.asarray(y0d, dtype=float), f], axis=-1)
+
+def bpw_features(u, βn):
+    u = np.asarray(u, dtype=float)
+    x = np.zeros(u.shape[:-1] + (8,))
+    x[..., 0] = βn
+    x[..., 1:] = u[..., [0, 1, 10, 11, 12, 13, 14]]
+    x[..., 3], x[..., 4] = 0.5 * (u[..., 10] + u[..., 11]), 0.5 * (u[..., 11] - u[..., 10])
+    return x
+
+def x2k_features(action, bt, βp):
+    # rt_control_v3 action: Ip, Rx, |Zx|, dRsep, In.Mid., Out.Mid.
+    a = np.asarray(action, dtype=float)
+    x = np.zeros(a.shape[:-1] + (10,))
+    x[..., 0], x[..., 1], x[..., 2] = a[..., 0], bt, βp
+    x[..., 3], x[..., 4], x[..., 5], x[..., 6] = a[..., 1], -a[..., 2], a[..., 1], a[..., 2]
+    x[..., 7], x[..., 8], x[..., 9] = a[..., 3], a[..., 4], a[..., 5]
+    return x
+
+def x2rz_features(u, action, βp):
+    # As predictBoundary in rt_control_v3: Ip, Bt, Rin, Rout from the inputs, X-points from the action
+    u, a = np.asarray(u, dtype=float), np.asarray(action, dtype=float)
+    x = x2k_features(a, u[..., 1], βp)
+    x[..., 0], x[..., 8], x[..., 9] = u[..., 0], u[..., 10], u[..., 11]
+    return x
+
+def k2rz_features(u, βp):
+    u = np.asarray(u, dtype=float)
+    x = np.zeros(u.shape[:-1] + (8,))
+    x[..., [0, 1, 3, 4, 5, 6, 7]] = u[..., [0, 1, 10, 11, 12, 13, 14]]
+    x[..., 2] = βp
+    return x
+
+def h_factors(u, wmhd, m=2.0):
+    u = np.asarray(u, dtype=float)
+    ip, bt, fgw = u[..., 0], u[..., 1], u[..., 2]
+    ptot = np.maximum(u[..., 3] + u[..., 4] + u[..., 5] + u[..., 6] + u[..., 7], 1.e-1) # Not to diverge
+    rin, rout, k = u[..., 10], u[..., 11], u[..., 12]
+    rgeo, amin = 0.5 * (rin + rout), 0.5 * (rout - rin)
+    ne = fgw * 10 * (ip / (np.pi * amin**2))
+    tau89 = 0.038*ip**0.85*bt**0.2*ne**0.1*ptot**-0.5*rgeo**1.5*k**0.5*(amin/rgeo)**0.3*m**0.5
+    tau98 = 0.0562*ip**0.93*bt**0.15*ne**0.41*ptot**-0.69*rgeo**1.97*k**0.78*(amin/rgeo)**0.58*m**0.19
+    return 1.e-6 * wmhd / ptot / tau89, 1.e-6 * wmhd / ptot / tau98
@@ -0,0 +1,94 @@
+import numpy as np
+
+# Unbounded multi-resolution history of a few channels sampled every tick. Level 0
+# keeps every sample; level k keeps the min and max of each block of factor**k
+# samples, filled in as the blocks complete. A window of any span is read from the
+# coarsest level that still gives max_points entries in it (the incomplete blocks
+# at the end come from finer levels), so drawing it costs the same after a minute
+# or an hour, and a shorter span pulls finer levels down to the raw samples.
+
+class trace_history():
+    def __init__(self, channels, dt=0.1, factor=8, capacity=1024):
+        self.channels, self.dt, self.factor = list(channels), dt, factor
+        self.lo, self.hi, self.counts = [], [], []
+        self.capacity = capacity
+        self.n = 0
+
+    def __len__(self):
+        return self.n
+
+    def append(self, values):
+        self.push(0, np.asarray(values, dtype=float), None)
+        self.n += 1
+
+    def push(self, k, lo, hi):
+        # Level 0 stores the samples once (hi is lo); every factor entries of level k make one of level k + 1
+        if k == len(self.lo):
+            self.lo.append(np.zeros((self.capacity, len(self.channels))))
+            self.hi.append(self.lo[0] if k == 0 else np.zeros((self.capacity, len(self.channels))))
+            self.counts.append(0)
+        if self.counts[k] == len(self.lo[k]):
+            self.lo[k] = np.concatenate([self.lo[k], np.zeros_like(self.lo[k])])
+            self.hi[k] = self.lo[k] if k == 0 else np.concatenate([self.hi[k], np.zeros_like(self.hi[k])])
+        self.lo[k][self.counts[k]] = lo
+        if k > 0:
+            self.hi[k][self.counts[k]] = hi
+        self.counts[k] += 1
+        if self.counts[k] % self.factor == 0:
+            block = slice(self.counts[k] - self.factor, self.counts[k])
+            self.push(k + 1, self.lo[k][block].min(axis=0), self.hi[k][block].max(axis=0))
+
+    def samples(self, first=0, channels=None):
+        # Raw samples (ticks, channels) from tick first on
+        idx = [self.channels.index(c) for c in channels or self.channels]
+        return self.lo[0][first:self.n, idx] if self.n > 0 else np.zeros((0, len(idx)))
+
+    def window(self, span=None, max_points=200):
+        # (times [s] relative to the last sample, lows, highs) over the last span [s], everything if None;
+        # times are the centres of the blocks, and lows equal highs where the samples are raw
+        if self.n == 0:
+            return np.zeros(0), np.zeros((0, len(self.channels))), np.zeros((0, len(self.channels)))
+        first = 0 if span is None else max(self.n - 1 - int(round(span / self.dt)), 0)
+        k = 0
+        while k + 1 < len(self.counts) and self.counts[k] - first // self.factor**k > max_points:
+            k += 1
+        idx, lo, hi = [], [], []
+        start = first // self.factor**k
+        for j in range(k, -1, -1): # Whole blocks of level k, then the rest of each finer level
+            start = max(start, first // self.factor**j)
+            size = self.factor**j
+            idx.append((np.arange(start, self.counts[j]) + 0.5) * size - 0.5)
+            lo.append(self.lo[j][start:self.counts[j]])
+            hi.append(self.hi[j][start:self.counts[j]])
+            start = self.counts[j] * self.factor
+        return self.dt * (np.concatenate(idx) - (self.n - 1)), np.concatenate(lo), np.concatenate(hi)
+
+    def lines(self, span=None, max_points=200, method='minmax'):
+        # {channel: (t, y)} to draw. 'minmax' draws the low and high of every block in turn, which keeps
+        # every peak; 'lttb' reads a finer level and thins each line to max_points by lttb()
+        t, lo, hi = self.window(span, max_points // 2 if method == 'minmax' else 4 * max_points)
+        lines = {}
+        for i, c in enumerate(self.channels):
+            keep = np.ones(2 * len(t), dtype=bool)
+            keep[1::2] = hi[:, i] != lo[:, i] # Raw samples once
+            x, y = np.repeat(t, 2)[keep], np.stack([lo[:, i], hi[:, i]], axis=1).ravel()[keep]
+            lines[c] = lttb(x, y, max_points) if method == 'lttb' else (x, y)
+        return lines
+
+def lttb(x, y, n):
+    # Largest-triangle-three-buckets: n of the points (x, y) that keep the shape of the line. Between
+    # the first and the last point, every bucket keeps the point that makes the largest triangle with
+    # the one kept before it and the mean of the next bucket.
+    if n >= len(x) or n < 3:
+        return x, y
+    edges = np.linspace(1, len(x) - 1, n - 1).astype(int)
+    keep = [0]
+    for i in range(n - 2):
+        a, b = edges[i], edges[i + 1]
+        c = edges[i + 2] if i + 2 < n - 1 else len(x)
+        ax, ay = x[keep[-1]], y[keep[-1]]
+        cx, cy = x[b:c].mean(), y[b:c].mean()
+        area = np.abs((ax - cx) * (y[a:b] - ay) - (ax - x[a:b]) * (cy - ay))
+        keep.append(a + np.argmax(area))
+    keep.append(len(x) - 1)
+    return x[keep], y[keep]
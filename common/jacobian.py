@@ -0,0 +1,189 @@
+import numpy as np
+from common.features import *
+
+# NumPy twins of the Keras surrogates with reverse-mode differentiation. The
+# layers are read from the loaded members (Dense, BatchNormalization, LSTM),
+# and the backward pass carries one leading axis per output, so the full
+# output-to-input Jacobian of a batch comes out of a single sweep.
+
+sigmoid = lambda z: 1 / (1 + np.exp(-z))
+activations = {
+    'linear': (lambda z: z, lambda z: np.ones_like(z)),
+    'relu': (lambda z: np.maximum(z, 0), lambda z: (z > 0).astype(float)),
+    'tanh': (np.tanh, lambda z: 1 - np.tanh(z)**2),
+    'sigmoid': (sigmoid, lambda z: sigmoid(z) * (1 - sigmoid(z))),
+    'hard_sigmoid': (lambda z: np.clip(0.2 * z + 0.5, 0, 1), lambda z: 0.2 * (np.abs(z) < 2.5)),
+    'elu': (lambda z: np.where(z > 0, z, np.expm1(np.minimum(z, 0))), lambda z: np.where(z > 0, 1., np.exp(np.minimum(z, 0)))),
+    'softplus': (lambda z: np.logaddexp(0, z), sigmoid),
+    'swish': (lambda z: z * sigmoid(z), lambda z: sigmoid(z) * (1 + z * (1 - sigmoid(z)))),
+}
+
+class dense_layer():
+    def __init__(self, kernel, bias, activation='linear'):
+        self.kernel, self.bias, self.activation = kernel, bias, activation
+
+    def forward(self, x):
+        z = x @ self.kernel + self.bias
+        return activations[self.activation][0](z), (z,)
+
+    def backward(self, cache, g):
+        z, = cache
+        return (g * activations[self.activation][1](z)) @ self.kernel.T
+
+class activation_layer():
+    def __init__(self, activation):
+        self.activation = activation
+
+    def forward(self, x):
+        return activations[self.activation][0](x), (x,)
+
+    def backward(self, cache, g):
+        return g * activations[self.activation][1](cache[0])
+
+class batch_norm_layer():
+    # Inference mode: a per-feature affine map
+    def __init__(self, gamma, beta, mean, var, epsilon=1.e-3):
+        self.scale = gamma / np.sqrt(var + epsilon)
+        self.shift = beta - mean * self.scale
+
+    def forward(self, x):
+        return x * self.scale + self.shift, ()
+
+    def backward(self, cache, g):
+        return g * self.scale
+
+class lstm_layer():
+    # Keras gate order i, f, c, o
+    def __init__(self, kernel, recurrent_kernel, bias, return_sequences=False, activation='tanh', recurrent_activation='sigmoid'):
+        self.kernel, self.recurrent_kernel, self.bias = kernel, recurrent_kernel, bias
+        self.units = recurrent_kernel.shape[0]
+        self.return_sequences = return_sequences
+        self.activation, self.recurrent_activation = activation, recurrent_activation
+
+    def forward(self, x):
+        act, ract = activations[self.activation][0], activations[self.recurrent_activation][0]
+        n, u = len(x), self.units
+        h, c = np.zeros([n, u]), np.zeros([n, u])
+        hs, cache = [], []
+        xw = x @ self.kernel + self.bias
+        for t in range(x.shape[1]):
+            z = xw[:, t] + h @ self.recurrent_kernel
+            i, f, g, o = ract(z[:, :u]), ract(z[:, u:2*u]), act(z[:, 2*u:3*u]), ract(z[:, 3*u:])
+            c_prev, c = c, f * c + i * g
+            h = o * act(c)
+            cache.append((z, c_prev, c, i, f, g, o))
+            hs.append(h)
+        return (np.stack(hs, axis=1) if self.return_sequences else h), cache
+
+    def backward(self, cache, gy):
+        dact, dract = activations[self.activation][1], activations[self.recurrent_activation][1]
+        act = activations[self.activation][0]
+        u, T = self.units, len(cache)
+        gh = np.zeros(gy.shape[:-2] + gy.shape[-1:]) if self.return_sequences else gy
+        dc = np.zeros_like(gh)
+        gx = []
+        for t in reversed(range(T)):
+            z, c_prev, c, i, f, g, o = cache[t]
+            if self.return_sequences:
+                gh = gh + gy[..., t, :]
+            do = gh * act(c)
+            dc = dc + gh * o * dact(c)
+            di, df, dg = dc * g, dc * c_prev, dc * i
+            dz = np.concatenate([di * dract(z[:, :u]), df * dract(z[:, u:2*u]), dg * dact(z[:, 2*u:3*u]), do * dract(z[:, 3*u:])], axis=-1)
+            gx.append(dz @ self.kernel.T)
+            gh, dc = dz @ self.recurrent_kernel.T, dc * f
+        return np.stack(gx[::-1], axis=-2)
+
+def layers_from_keras(model):
+    layers = []
+    for layer in model.layers:
+        kind, config, weights = type(layer).__name__, layer.get_config(), layer.get_weights()
+        if kind == 'Dense':
+            layers.append(dense_layer(weights[0], weights[1] if config['use_bias'] else 0., config['activation']))
+        elif kind == 'BatchNormalization':
+            weights = list(weights)
+            gamma = weights.pop(0) if config['scale'] else 1.
+            beta = weights.pop(0) if config['center'] else 0.
+            layers.append(batch_norm_layer(gamma, beta, weights[0], weights[1], config['epsilon']))
+        elif kind == 'LSTM':
+            layers.append(lstm_layer(weights[0], weights[1], weights[2] if config['use_bias'] else 0., config['return_sequences'],
+                                     config['activation'], config['recurrent_activation']))
+        elif kind == 'Activation':
+            layers.append(activation_layer(config['activation']))
+        elif kind not in ['InputLayer', 'Dropout']:
+            raise NotImplementedError(f'{kind} layer has no NumPy twin')
+    return layers
+
+class numpy_network():
+    def __init__(self, layers):
+        self.layers = layers
+
+    def forward(self, x):
+        caches = []
+        for layer in self.layers:
+            x, cache = layer.forward(x)
+            caches.append(cache)
+        return x, caches
+
+    def backward(self, caches, g):
+        # g (..., batch, outputs) -> (..., batch, *input shape)
+        for layer, cache in zip(self.layers[::-1], caches[::-1]):
+            g = layer.backward(cache, g)
+        return g
+
+    def jacobian(self, x):
+        y, caches = self.forward(x)
+        nout = y.shape[-1]
+        g = np.broadcast_to(np.eye(nout)[:, None, :], (nout, len(x), nout))
+        return y, np.moveaxis(self.backward(caches, g), 0, 1)
+
+class jacobian_model():
+    # Twin of a loaded wrapper (kstar_nn, bpw_nn, tf_dense_model, kstar_lstm, kstar_v220505) with the same scaling
+    def __init__(self, model):
+        self.members = [numpy_network(layers_from_keras(m)) for m in model.models]
+        self.nmodels = model.nmodels
+        self.ymean, self.ystd = np.asarray(model.ymean, dtype=float), np.asarray(model.ystd, dtype=float)
+
+    def predict_batch(self, x, nmodels=None):
+        return self.forward(x, nmodels)[0]
+
+    def forward(self, x, nmodels=None):
+        ys, caches = zip(*[m.forward(np.asarray(x, dtype=float)) for m in self.members[:nmodels or self.nmodels]])
+        return np.mean(ys, axis=0) * self.ystd + self.ymean, caches
+
+    def backward(self, caches, gy):
+        # Vector-Jacobian product through the ensemble mean and output scaling
+        g = gy * self.ystd / len(caches)
+        return sum(m.backward(c, g) for m, c in zip(self.members, caches))
+
+    def jacobian(self, x, nmodels=None):
+        # y (batch, outputs) and dy/dx (batch, outputs, *input shape)
+        x = np.asarray(x, dtype=float)
+        ys, js = zip(*[m.jacobian(x) for m in self.members[:nmodels or self.nmodels]])
+        scale = self.ystd.reshape((-1,) + (1,) * (x.ndim - 1)) if self.ystd.ndim else self.ystd
+        return np.mean(ys, axis=0) * self.ystd + self.ymean, np.mean(js, axis=0) * scale
+
+def linear_map(fn, n_inputs=n_inputs, **kwargs):
+    # Matrix of an affine feature map of the input panel (the limiter flag is piecewise constant)
+    return (fn(np.eye(n_inputs), **kwargs) - fn(np.zeros(n_inputs), **kwargs)).T
+
+def steady_sensitivity(kstar_nn, bpw_nn, u, nmodels=None):
+    # d(βn, q95, q0, li, βp, wmhd)/d(input panel) at steady state: kstar_nn, then bpw_nn on its βn
+    u = np.atleast_2d(u)
+    y0, j0 = kstar_nn.jacobian(nn_features(u), nmodels)
+    j0 = j0 @ linear_map(nn_features)
+    y1, j1 = bpw_nn.jacobian(bpw_features(u, y0[:, 0]), nmodels)
+    j1 = j1[:, :, :1] * j0[:, None, 0] + j1[:, :, 1:] @ linear_map(bpw_features, βn=0.)[1:]
+    return np.concatenate([y0, y1], axis=1), np.concatenate([j0, j1], axis=1)
+
+def lstm_sensitivity(kstar_lstm, x, nmodels=None):
+    # dy/d(window) of kstar_v220505, and the response to a step of the input panel held over the whole window
+    y, j = kstar_lstm.jacobian(x, nmodels)
+    return y, j, j[..., 4:].sum(axis=2) @ linear_map(v220505_features)
+
+def x2k_sensitivity(x2k, action, bt, βp, nmodels=None):
+    # d(k, du, dl)/d(Ip, Rx, |Zx|, dRsep, In.Mid., Out.Mid.)
+    action = np.atleast_2d(action)
+    y, j = x2k.jacobian(x2k_features(action, bt, βp), nmodels)
+    m = (x2k_features(np.eye(6), 0., 0.) - x2k_features(np.zeros(6), 0., 0.)).T
+    return y, j @ m
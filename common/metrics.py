@@ -0,0 +1,57 @@
+import warnings
+import numpy as np
+
+# Closed-loop tracking metrics of batched target and response histories
+# (ticks, batch, signals), e.g. simulator.trajectory() outputs. Every metric
+# comes out per run and signal in one vectorized pass; staircases are split
+# at the target changes and scored segment by segment.
+
+metric_names = ['rise_time', 'settling_time', 'overshoot', 'steady_state_error', 'iae']
+
+def first_index(mask):
+    # Index of the first True along the time axis, -1 where there is none
+    return np.where(np.any(mask, axis=0), np.argmax(mask, axis=0), -1)
+
+def step_metrics(outputs, targets, initial=None, dt=0.1, scale=1., rise=(0.1, 0.9), band=0.05, n_ss=10, min_step=0.01):
+    # Response to a change toward the final target; times from the first tick, band and min_step relative to scale (e.g. the target range)
+    y, r = np.asarray(outputs, dtype=float), np.asarray(targets, dtype=float)
+    y0 = y[0] if initial is None else np.asarray(initial, dtype=float)
+    step = r[-1] - y0
+    valid = np.abs(step) >= min_step * np.asarray(scale)
+    p = (y - y0) / np.where(valid, step, 1.)
+    i_lo, i_hi = first_index(p >= rise[0]), first_index(p >= rise[1])
+    last_out = len(y) - 1 - first_index((np.abs(y - r[-1]) > band * np.asarray(scale))[::-1])
+    last_out = np.where(last_out == len(y), -1, last_out)
+    return {
+        'rise_time': np.where(valid & (i_hi >= 0), (i_hi - i_lo) * dt, np.nan),
+        'settling_time': np.where(last_out < len(y) - 1, (last_out + 1) * dt, np.nan), # NaN if still outside the band at the end
+        'overshoot': np.where(valid, np.maximum(p.max(axis=0) - 1, 0), np.nan), # Fraction of the step
+        'steady_state_error': np.mean(y[-n_ss:] - r[-n_ss:], axis=0),
+        'iae': np.sum(np.abs(y - r), axis=0) * dt,
+    }
+
+def target_segments(targets, tol=1.e-9):
+    # Tick bounds of the segments; consecutive changing ticks (a ramp) start one segment
+    changing = np.any(np.abs(np.diff(targets, axis=0)) > tol, axis=tuple(range(1, np.ndim(targets))))
+    starts = np.flatnonzero(changing & ~np.r_[False, changing[:-1]]) + 1
+    return np.unique(np.r_[0, starts, len(targets)])
+
+def staircase_metrics(outputs, targets, **kwargs):
+    # Start ticks and metrics (segments, batch, signals) of a target staircase shared by the batch
+    outputs, targets = np.asarray(outputs, dtype=float), np.asarray(targets, dtype=float)
+    bounds = target_segments(targets)
+    metrics = [step_metrics(outputs[a:b], targets[a:b], initial=outputs[a - 1] if a > 0 else None, **kwargs)
+               for a, b in zip(bounds[:-1], bounds[1:])]
+    return bounds[:-1], {k: np.stack([m[k] for m in metrics]) for k in metric_names}
+
+def metrics_table(metrics, signal_params, rows=None, width=8):
+    # Batch means (NaN-aware) of metrics (batch, signals), or of (segments, batch, signals) with one label per segment in rows
+    if rows is None:
+        metrics, rows = {k: v[None] for k, v in metrics.items()}, ['']
+    lines = [f'{"":>{width}}{"signal":>8}' + ''.join(f'{k:>20}' for k in metric_names)]
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning) # All-NaN columns (no step, never settled)
+        for i, row in enumerate(rows):
+            for j, p in enumerate(signal_params):
+                lines.append(f'{row:>{width}}{p:>8}' + ''.join(f'{np.nanmean(metrics[k][i, :, j]):20.4g}' for k in metric_names))
+    return '\n'.join(lines)
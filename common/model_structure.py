@@ -1,69 +1,86 @@
-import json, zipfile
+import json, time, zipfile
 import numpy as np
 from tensorflow.keras import models, layers
 
 class k2rz():
-    def __init__(self, model_path, n_models=1, ntheta=64, closed_surface=True, xpt_correction=True):
+    def __init__(self, model_path, n_models=1, ntheta=64, closed_surface=True, xpt_correction=True, members=None):
         self.nmodels, self.ntheta = n_models, ntheta
         self.closed_surface, self.xpt_correction = closed_surface, xpt_correction
-        self.models = [models.load_model(model_path + f'/best_model{i}', compile=False) for i in range(self.nmodels)]
+        members = range(self.nmodels) if members is None else members
+        self.models = [models.load_model(model_path + f'/best_model{i}', compile=False) for i in members]
 
     def set_inputs(self, ip, bt, βp, rin, rout, k, du, dl):
         self.x = np.array([ip, bt, βp, rin, rout, k, du, dl])
 
     def predict(self, post=True):
-        self.y = np.mean([m.predict(np.array([self.x]))[0] for m in self.models[:self.nmodels]], axis=0)
-        rbdry, zbdry = self.y[:self.ntheta], self.y[self.ntheta:]
+        self.y = self.ensemble(np.array([self.x]))[0]
+        rbdry, zbdry = self.boundary(np.array([self.x]), np.array([self.y]), post=post)
+        return rbdry[0], zbdry[0]
+
+    def predict_batch(self, x, post=True, nmodels=None):
+        x = np.atleast_2d(x)
+        return self.boundary(x, self.ensemble(x, nmodels), post=post)
+
+    def boundary(self, x, y, post=True):
+        rbdry, zbdry = np.array(y[:, :self.ntheta]), np.array(y[:, self.ntheta:])
         if post:
             if self.xpt_correction:
-                rgeo, amin = 0.5 * (max(rbdry) + min(rbdry)), 0.5 * (max(rbdry) - min(rbdry))
-                if self.x[6] <= self.x[7]:
-                    rx = rgeo - amin * self.x[7]
-                    zx = max(zbdry) - 2 * self.x[5] * amin
-                    rx2 = rgeo - amin * self.x[6]
-                    rbdry[np.argmin(zbdry)] = rx
-                    zbdry[np.argmin(zbdry)] = zx
-                    rbdry[np.argmax(zbdry)] = rx2
-                else:
-                    rx = rgeo - amin * self.x[6]
-                    zx = min(zbdry) + 2 * self.x[5] * amin
-                    rx2 = rgeo - amin * self.x[7]
-                    rbdry[np.argmax(zbdry)] = rx
-                    zbdry[np.argmax(zbdry)] = zx
-                    rbdry[np.argmin(zbdry)] = rx2
-            
+                rows = np.arange(len(x))
+                rgeo, amin = 0.5 * (rbdry.max(axis=1) + rbdry.min(axis=1)), 0.5 * (rbdry.max(axis=1) - rbdry.min(axis=1))
+                lower = x[:, 6] <= x[:, 7]
+                ix = np.where(lower, np.argmin(zbdry, axis=1), np.argmax(zbdry, axis=1)) # Active X-point
+                io = np.where(lower, np.argmax(zbdry, axis=1), np.argmin(zbdry, axis=1)) # Opposite side
+                rx = rgeo - amin * np.where(lower, x[:, 7], x[:, 6])
+                zx = np.where(lower, zbdry.max(axis=1) - 2 * x[:, 5] * amin, zbdry.min(axis=1) + 2 * x[:, 5] * amin)
+                rx2 = rgeo - amin * np.where(lower, x[:, 6], x[:, 7])
+                rbdry[rows, ix], zbdry[rows, ix] = rx, zx
+                rbdry[rows, io] = rx2
+
             if self.closed_surface:
-                rbdry, zbdry = np.append(rbdry, rbdry[0]), np.append(zbdry, zbdry[0])
+                rbdry, zbdry = np.append(rbdry, rbdry[:, :1], axis=1), np.append(zbdry, zbdry[:, :1], axis=1)
 
         return rbdry, zbdry
 
+    def ensemble(self, x, nmodels=None):
+        return np.mean([m.predict(x) for m in self.models[:nmodels or self.nmodels]], axis=0)
+
 class x2rz():
-    def __init__(self, model_path, n_models=1, ntheta=64, closed_surface=True, xpt_correction=True):
+    def __init__(self, model_path, n_models=1, ntheta=64, closed_surface=True, xpt_correction=True, members=None):
         self.nmodels, self.ntheta = n_models, ntheta
         self.closed_surface, self.xpt_correction = closed_surface, xpt_correction
-        self.models = [models.load_model(model_path + f'/best_model{i}', compile=False) for i in range(self.nmodels)]
+        members = range(self.nmodels) if members is None else members
+        self.models = [models.load_model(model_path + f'/best_model{i}', compile=False) for i in members]
 
     def set_inputs(self, ip, bt, βp, rx1, zx1, rx2, zx2, drsep, rin, rout):
         self.x = np.array([ip, bt, βp, rx1, zx1, rx2, zx2, drsep, rin, rout])
 
     def predict(self, post=True):
-        self.y = np.mean([m.predict(np.array([self.x]))[0] for m in self.models[:self.nmodels]], axis=0)
-        rbdry, zbdry = self.y[:self.ntheta], self.y[self.ntheta:]
+        self.y = self.ensemble(np.array([self.x]))[0]
+        rbdry, zbdry = self.boundary(np.array([self.x]), np.array([self.y]), post=post)
+        return rbdry[0], zbdry[0]
+
+    def predict_batch(self, x, post=True, nmodels=None):
+        x = np.atleast_2d(x)
+        return self.boundary(x, self.ensemble(x, nmodels), post=post)
+
+    def boundary(self, x, y, post=True):
+        rbdry, zbdry = np.array(y[:, :self.ntheta]), np.array(y[:, self.ntheta:])
         if post:
             if self.xpt_correction:
-                rgeo, amin = 0.5 * (max(rbdry) + min(rbdry)), 0.5 * (max(rbdry) - min(rbdry))
-                if self.x[7] <= 0: # LSN
-                    rbdry[np.argmin(zbdry)] = self.x[3]
-                    zbdry[np.argmin(zbdry)] = self.x[4]
-                else: # USN
-                    rbdry[np.argmax(zbdry)] = self.x[5]
-                    zbdry[np.argmax(zbdry)] = self.x[6]
+                rows = np.arange(len(x))
+                lsn = x[:, 7] <= 0 # LSN, otherwise USN
+                ix = np.where(lsn, np.argmin(zbdry, axis=1), np.argmax(zbdry, axis=1))
+                rbdry[rows, ix] = np.where(lsn, x[:, 3], x[:, 5])
+                zbdry[rows, ix] = np.where(lsn, x[:, 4], x[:, 6])
 
             if self.closed_surface:
-                rbdry, zbdry = np.append(rbdry, rbdry[0]), np.append(zbdry, zbdry[0])
+                rbdry, zbdry = np.append(rbdry, rbdry[:, :1], axis=1), np.append(zbdry, zbdry[:, :1], axis=1)
 
         return rbdry, zbdry
 
+    def ensemble(self, x, nmodels=None):
+        return np.mean([m.predict(x) for m in self.models[:nmodels or self.nmodels]], axis=0)
+
 def load_custom_model(input_shape, lstms, denses, model_path):
     model = models.Sequential()
     model.add(layers.BatchNormalization(input_shape = input_shape))
@@ -79,14 +96,15 @@ def load_custom_model(input_shape, lstms, denses, model_path):
     return model
 
 class kstar_lstm():
-    def __init__(self, model_path, n_models=1, ymean=None, ystd=None):
+    def __init__(self, model_path, n_models=1, ymean=None, ystd=None, members=None):
         self.nmodels = n_models
         if ymean is None:
             self.ymean = [1.30934765, 5.20082444, 1.47538417, 1.14439883]
             self.ystd  = [0.74135689, 1.44731883, 0.56747578, 0.23018484]
         else:
             self.ymean, self.ystd = ymean, ystd
-        self.models = [load_custom_model((10, 21), [200, 200], [200, 4], model_path + f'/best_model{i}') for i in range(self.nmodels)]
+        members = range(self.nmodels) if members is None else members
+        self.models = [load_custom_model((10, 21), [200, 200], [200, 4], model_path + f'/best_model{i}') for i in members]
 
     def set_inputs(self, x):
         self.x = np.array(x) if len(np.shape(x)) == 3 else np.array([x])
@@ -94,18 +112,26 @@ class kstar_lstm():
     def predict(self, x=None):
         if type(x) == type(np.zeros(1)):
             self.set_inputs(x)
-        self.y = np.mean([m.predict(self.x)[0] * self.ystd + self.ymean for m in self.models[:self.nmodels]], axis=0)
+        self.y = self.predict_batch(self.x)[0]
         return self.y
 
+    def predict_batch(self, x, nmodels=None):
+        x = np.asarray(x) if len(np.shape(x)) == 3 else np.array([x])
+        return self.ensemble(x, nmodels) * self.ystd + self.ymean
+
+    def ensemble(self, x, nmodels=None):
+        return np.mean([m.predict(x) for m in self.models[:nmodels or self.nmodels]], axis=0)
+
 class kstar_v220505():
-    def __init__(self, model_path, n_models=1, ymean=None, ystd=None, length=10):
+    def __init__(self, model_path, n_models=1, ymean=None, ystd=None, length=10, members=None):
         if ymean is None or ystd is None:
             self.ymean = [1.4361666, 5.275876, 1.534538, 1.1268075]
             self.ystd = [0.7294007, 1.5010427, 0.6472052, 0.2331879]
         else:
             self.ymean, self.ystd = ymean, ystd
         self.nmodels = n_models
-        self.models = [load_custom_model((length, 18), [100, 100], [50, 4], model_path + f'/best_model{i}') for i in range(self.nmodels)]
+        members = range(self.nmodels) if members is None else members
+        self.models = [load_custom_model((length, 18), [100, 100], [50, 4], model_path + f'/best_model{i}') for i in members]
 
     def set_inputs(self, x):
         self.x = np.array(x) if len(np.shape(x)) == 3 else np.array([x])
@@ -113,18 +139,26 @@ class kstar_v220505():
     def predict(self, x=None):
         if type(x) == type(np.zeros(1)):
             self.set_inputs(x)
-        self.y = np.mean([m.predict(self.x)[0] * self.ystd + self.ymean for m in self.models[:self.nmodels]], axis=0)
+        self.y = self.predict_batch(self.x)[0]
         return self.y
 
+    def predict_batch(self, x, nmodels=None):
+        x = np.asarray(x) if len(np.shape(x)) == 3 else np.array([x])
+        return self.ensemble(x, nmodels) * self.ystd + self.ymean
+
+    def ensemble(self, x, nmodels=None):
+        return np.mean([m.predict(x) for m in self.models[:nmodels or self.nmodels]], axis=0)
+
 class kstar_nn():
-    def __init__(self, model_path, n_models=1, ymean=None, ystd=None):
+    def __init__(self, model_path, n_models=1, ymean=None, ystd=None, members=None):
         self.nmodels = n_models
         if ymean is None:
             self.ymean = [1.22379703, 5.2361062,  1.64438005, 1.12040048]
             self.ystd  = [0.72255576, 1.5622809,  0.96563557, 0.23868018]
         else:
             self.ymean, self.ystd = ymean, ystd
-        self.models = [models.load_model(model_path + f'/best_model{i}', compile=False) for i in range(self.nmodels)]
+        members = range(self.nmodels) if members is None else members
+        self.models = [models.load_model(model_path + f'/best_model{i}', compile=False) for i in members]
 
     def set_inputs(self, x):
         self.x = np.array(x) if len(np.shape(x)) == 2 else np.array([x])
@@ -132,15 +166,23 @@ class kstar_nn():
     def predict(self, x=None):
         if type(x) == type(np.zeros(1)):
             self.set_inputs(x)
-        self.y = np.mean([m.predict(self.x)[0] * self.ystd + self.ymean for m in self.models[:self.nmodels]], axis=0)
+        self.y = self.predict_batch(self.x)[0]
         return self.y
 
+    def predict_batch(self, x, nmodels=None):
+        x = np.array(x) if len(np.shape(x)) == 2 else np.array([x])
+        return self.ensemble(x, nmodels) * self.ystd + self.ymean
+
+    def ensemble(self, x, nmodels=None):
+        return np.mean([m.predict(x) for m in self.models[:nmodels or self.nmodels]], axis=0)
+
 class bpw_nn():
-    def __init__(self, model_path, n_models=1):
+    def __init__(self, model_path, n_models=1, members=None):
         self.nmodels = n_models
         self.ymean = np.array([1.02158800e+00, 1.87408512e+05])
         self.ystd  = np.array([6.43390272e-01, 1.22543529e+05])
-        self.models = [models.load_model(model_path + f'/best_model{i}', compile=False) for i in range(self.nmodels)]
+        members = range(self.nmodels) if members is None else members
+        self.models = [models.load_model(model_path + f'/best_model{i}', compile=False) for i in members]
 
     def set_inputs(self, x):
         self.x = np.array(x) if len(np.shape(x)) == 2 else np.array([x])
@@ -148,23 +190,48 @@ class bpw_nn():
     def predict(self, x=None):
         if type(x) == type(np.zeros(1)):
             self.set_inputs(x)
-        self.y = np.mean([m.predict(self.x)[0] * self.ystd + self.ymean for m in self.models[:self.nmodels]], axis=0)
+        self.y = self.predict_batch(self.x)[0]
         return self.y
 
+    def predict_batch(self, x, nmodels=None):
+        x = np.array(x) if len(np.shape(x)) == 2 else np.array([x])
+        return self.ensemble(x, nmodels) * self.ystd + self.ymean
+
+    def ensemble(self, x, nmodels=None):
+        return np.mean([m.predict(x) for m in self.models[:nmodels or self.nmodels]], axis=0)
+
 class tf_dense_model():
-    def __init__(self, model_path, n_models=1, ymean=0, ystd=1):
+    def __init__(self, model_path, n_models=1, ymean=0, ystd=1, members=None):
         self.nmodels = n_models
         self.ymean, self.ystd = ymean, ystd
-        self.models = [models.load_model(model_path + f'/best_model{i}', compile=False) for i in range(n_models)]
+        members = range(n_models) if members is None else members
+        self.models = [models.load_model(model_path + f'/best_model{i}', compile=False) for i in members]
 
     def set_inputs(self, x):
         self.x = np.array(x) if len(np.shape(x)) == 2 else np.array([x])
 
     def predict(self, x):
         self.set_inputs(x)
-        self.y = np.mean([m.predict(self.x)[0] * self.ystd + self.ymean for m in self.models[:self.nmodels]], axis=0)
+        self.y = self.predict_batch(self.x)[0]
         return self.y
 
+    def predict_batch(self, x, nmodels=None):
+        x = np.array(x) if len(np.shape(x)) == 2 else np.array([x])
+        return self.ensemble(x, nmodels) * self.ystd + self.ymean
+
+    def ensemble(self, x, nmodels=None):
+        return np.mean([m.predict(x) for m in self.models[:nmodels or self.nmodels]], axis=0)
+
+def warmup(model, repeats=2):
+    # Trace the predict function of every loaded member with its run-time input shape
+    t0 = time.time()
+    for m in model.models:
+        if hasattr(m, 'input_shape'): # Proxies warm up their members where they live
+            x = np.zeros([1 if n is None else n for n in m.input_shape])
+            for _ in range(repeats):
+                m.predict(x)
+    return time.time() - t0
+
 def actv(x, method):
     if method == 'relu':
         return np.max([np.zeros_like(x), x], axis=0)
@@ -180,7 +247,7 @@ class SB2_model():
         zf = zipfile.ZipFile(model_path)
         data = json.loads(zf.read('data').decode("utf-8"))
         self.parameter_list = json.loads(zf.read('parameter_list').decode("utf-8"))
-        self.parameters = np.load(zf.open('parameters'))
+        self.parameters = dict(np.load(zf.open('parameters'))) # Decompressed once; NpzFile reads are neither cheap nor thread-safe
         self.layers = data['policy_kwargs']['layers'] if 'layers' in data['policy_kwargs'].keys() else [64, 64]
         self.low_state, self.high_state = low_state, high_state
         self.low_action, self.high_action = low_action, high_action
@@ -189,19 +256,27 @@ class SB2_model():
         self.bavg = bavg
 
     def predict(self, x, yold=None):
+        y = self.predict_batch(np.atleast_2d(x), yold=None if yold is None else np.atleast_2d(yold))
+        return y[0] if np.ndim(x) == 1 else y
+
+    def predict_batch(self, x, yold=None, bavg=None):
+        x = np.atleast_2d(x)
         xnorm = 2 * (x - self.low_state) / np.subtract(self.high_state, self.low_state) - 1 if self.norm else x
+        ynorm = self.forward(xnorm)
+
+        y = 0.5 * np.subtract(self.high_action, self.low_action) * (ynorm + 1) + self.low_action if self.norm else ynorm
+        if yold is None:
+            yold = x[:, :y.shape[-1]]
+        bavg = self.bavg if bavg is None else bavg
+        return bavg * yold + (1 - bavg) * y
+
+    def forward(self, xnorm):
         ynorm = xnorm
         for i, layer in enumerate(self.layers):
             w, b = self.parameters[f'model/pi/fc{i}/kernel:0'], self.parameters[f'model/pi/fc{i}/bias:0']
             ynorm = actv(np.matmul(ynorm, w) + b, self.activation)
         w, b = self.parameters[f'model/pi/dense/kernel:0'], self.parameters[f'model/pi/dense/bias:0']
-        ynorm = actv(np.matmul(ynorm, w) + b, self.last_actv)
-
-        y = 0.5 * np.subtract(self.high_action, self.low_action) * (ynorm + 1) + self.low_action if self.norm else ynorm
-        if yold is None:
-            yold = x[:len(y)]
-        y =  self.bavg * yold + (1 - self.bavg) * y
-        return y
+        return actv(np.matmul(ynorm, w) + b, self.last_actv)
 
 class SB2_ensemble():
     def __init__(self, model_list, low_state, high_state, low_action, high_action, activation='relu', last_actv='tanh', norm=True, bavg=0.):
@@ -211,4 +286,7 @@ class SB2_ensemble():
         ys = [m.predict(x, yold=yold) for m in self.models]
         return np.mean(ys, axis=0)
 
+    def predict_batch(self, x, yold=None, bavg=None):
+        return np.mean([m.predict_batch(x, yold=yold, bavg=bavg) for m in self.models], axis=0)
+
 
@@ -0,0 +1,52 @@
+import time
+import numpy as np
+
+# Sampling-based model-predictive control for rt_control_v3. Candidate action
+# sequences are rolled forward together on a batched rt_plasma, one batched
+# call per surrogate and step, and the first action of the cheapest is applied.
+
+class mpc_controller():
+    def __init__(self, plasma, low_action, high_action, low_target, high_target, target_params=['βp', 'q95'],
+                 n_samples=64, horizon=5, sigma=0.1, smooth=0.1, time_budget=0.08, seed=None):
+        self.plasma = plasma
+        self.low_action, self.high_action = np.array(low_action), np.array(high_action)
+        self.target_scale = np.subtract(high_target, low_target)
+        self.target_params = target_params
+        self.n_samples, self.horizon = n_samples, horizon
+        self.sigma, self.smooth = sigma, smooth # Sampling spread and action-change penalty, relative to the bounds
+        self.time_budget = time_budget # Rollout steps that would overrun the control period are skipped
+        self.rng = np.random.default_rng(seed)
+        self.plan = None
+
+    def sample(self, action):
+        # Previous plan shifted by one tick (warm start), plus a hold-the-action candidate and perturbed copies
+        if self.plan is None:
+            self.plan = np.tile(action, (self.horizon, 1))
+        mean = np.concatenate([self.plan[1:], self.plan[-1:]])
+        noise = self.sigma * (self.high_action - self.low_action) * self.rng.standard_normal((self.n_samples, self.horizon, len(action)))
+        noise[0], noise[1] = 0., 0.
+        seqs = mean + np.cumsum(noise, axis=1) / np.sqrt(np.arange(1, self.horizon + 1))[:, None]
+        seqs[1] = action
+        return np.clip(seqs, self.low_action, self.high_action)
+
+    def predict(self, state):
+        action = np.asarray(state['action'], dtype=float)
+        targets = np.asarray(state['targets'], dtype=float)
+        seqs = self.sample(action)
+        self.plasma.set_state(state, repeat=self.n_samples)
+        cost, prev = np.zeros(self.n_samples), np.tile(action, (self.n_samples, 1))
+        t0 = time.time()
+        for k in range(self.horizon):
+            self.plasma.step(seqs[:, k])
+            err = (self.plasma.output(self.target_params) - targets) / self.target_scale
+            cost += np.sum(err**2, axis=1) + self.smooth * np.sum(((seqs[:, k] - prev) / (self.high_action - self.low_action))**2, axis=1)
+            prev = seqs[:, k]
+            elapsed = time.time() - t0
+            if elapsed * (k + 2) / (k + 1) > self.time_budget:
+                break
+        self.steps = k + 1
+        self.plan = seqs[np.argmin(cost)]
+        return self.plan[0]
+
+    def reset(self):
+        self.plan = None
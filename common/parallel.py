@@ -0,0 +1,118 @@
+import os, atexit, threading
+import multiprocessing as mp
+from multiprocessing import shared_memory
+import numpy as np
+from common.model_structure import warmup
+
+# Ensemble members are split into shards, one worker process per shard.
+# Each tick the inputs go through shared memory, every worker writes the
+# partial sum of its active members and the parent reduces them to the mean.
+
+def _shard_worker(conn, model_class, model_kwargs, members, core):
+    if core is not None and hasattr(os, 'sched_setaffinity'):
+        os.sched_setaffinity(0, [core])
+    model = model_class(members=members, **model_kwargs)
+    warmup(model)
+    conn.send(model.models[0].output_shape[-1])
+    shm_in, shm_out = None, None
+    while True:
+        msg = conn.recv()
+        if msg is None:
+            break
+        elif msg[0] == 'buffers':
+            for shm in [shm_in, shm_out]:
+                if shm is not None:
+                    shm.close()
+            shm_in, shm_out = shared_memory.SharedMemory(name=msg[1]), shared_memory.SharedMemory(name=msg[2])
+        elif msg[0] == 'predict':
+            _, shape, active, offset = msg
+            x = np.ndarray(shape, dtype=np.float64, buffer=shm_in.buf)
+            ms = [m for i, m in zip(members, model.models) if i in active]
+            if ms:
+                y = np.ndarray((shape[0], model.models[0].output_shape[-1]), dtype=np.float64, buffer=shm_out.buf, offset=offset)
+                y[:] = np.sum([m.predict(x) for m in ms], axis=0)
+                del y
+            del x # Views must be released before the buffers can be swapped
+            conn.send(len(ms))
+    for shm in [shm_in, shm_out]:
+        if shm is not None:
+            shm.close()
+
+class ensemble_proxy():
+    # Weightless instance of an ensemble class whose member-mean step is evaluated elsewhere
+    def __init__(self, model_class, **kwargs):
+        self.nmodels = kwargs.get('n_models', 1)
+        self.models = list(range(self.nmodels)) # Member order, shuffled in place like the in-process ensembles
+        self.shell = model_class(members=[], **kwargs)
+        self.shell.ensemble = self.ensemble
+
+    def __getattr__(self, name):
+        if name == 'shell':
+            raise AttributeError(name)
+        return getattr(self.shell, name)
+
+    def set_inputs(self, *args, **kwargs):
+        return self.shell.set_inputs(*args, **kwargs)
+
+    def predict(self, *args, **kwargs):
+        return self.shell.predict(*args, **kwargs)
+
+class sharded_ensemble(ensemble_proxy):
+    def __init__(self, model_class, n_workers=None, cores=None, **kwargs):
+        super().__init__(model_class, **kwargs)
+        self.n_workers = max(1, min(n_workers or os.cpu_count(), self.nmodels))
+
+        ctx = mp.get_context('spawn')
+        self.conns, self.workers = [], []
+        for w in range(self.n_workers):
+            parent_conn, child_conn = ctx.Pipe()
+            members = list(range(w, self.nmodels, self.n_workers))
+            core = None if cores is None else sorted(cores)[w % len(cores)]
+            p = ctx.Process(target=_shard_worker, args=(child_conn, model_class, kwargs, members, core), daemon=True)
+            p.start()
+            self.conns.append(parent_conn)
+            self.workers.append(p)
+        self.nout = [conn.recv() for conn in self.conns][0]
+        self.shm_in, self.shm_out, self.capacity = None, None, 0
+        self.lock = threading.Lock() # The shared buffers serve one call at a time
+        atexit.register(self.close)
+
+    def allocate(self, x):
+        self.release()
+        # Grow geometrically for more rows; a new row shape alone keeps the capacity, so alternating shapes do not grow it
+        self.capacity = max(x.shape[0], 2 * self.capacity) if x.shape[0] > self.capacity else self.capacity
+        nin = int(np.prod(x.shape[1:]))
+        self.shm_in = shared_memory.SharedMemory(create=True, size=8 * self.capacity * nin)
+        self.shm_out = shared_memory.SharedMemory(create=True, size=8 * self.capacity * self.nout * self.n_workers)
+        self.row_shape = x.shape[1:]
+        for conn in self.conns:
+            conn.send(('buffers', self.shm_in.name, self.shm_out.name))
+
+    def ensemble(self, x, nmodels=None):
+        x = np.asarray(x, dtype=np.float64)
+        active = set(self.models[:nmodels or self.nmodels])
+        with self.lock:
+            if self.shm_in is None or x.shape[0] > self.capacity or x.shape[1:] != self.row_shape:
+                self.allocate(x)
+            np.ndarray(x.shape, dtype=np.float64, buffer=self.shm_in.buf)[:] = x
+            stride = 8 * self.capacity * self.nout
+            for w, conn in enumerate(self.conns):
+                conn.send(('predict', x.shape, active, w * stride))
+            counts = [conn.recv() for conn in self.conns]
+            ys = np.ndarray((self.n_workers, self.capacity, self.nout), dtype=np.float64, buffer=self.shm_out.buf)
+            return np.sum([ys[w, :x.shape[0]] for w in range(self.n_workers) if counts[w] > 0], axis=0) / sum(counts)
+
+    def release(self):
+        for shm in [self.shm_in, self.shm_out]:
+            if shm is not None:
+                shm.close()
+                shm.unlink()
+        self.shm_in, self.shm_out = None, None
+
+    def close(self):
+        for conn, p in zip(self.conns, self.workers):
+            if p.is_alive():
+                conn.send(None)
+                p.join(timeout=5)
+        self.conns, self.workers = [], []
+        self.release()
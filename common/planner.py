@@ -0,0 +1,123 @@
+import time
+import numpy as np
+from common.features import *
+from common.jacobian import linear_map
+
+# Offline trajectory optimization through the differentiable surrogate chain of
+# rt_control_v3 (x2k -> kstar_v220505 -> bpw). The actuator waveform is rolled
+# out on the NumPy twins, the βp/q95/li error against a target schedule is
+# backpropagated through time, and projected Adam keeps it within the bounds.
+
+plan_params = ['βp', 'q95', 'li']
+
+def arrival_schedule(n_ticks, targets, arrival):
+    # ai_control style: free until the arrival tick, then hold the targets
+    schedule = np.full([n_ticks, len(targets)], np.nan)
+    schedule[arrival:] = targets
+    return schedule
+
+class trajectory_optimizer():
+    def __init__(self, kstar_lstm, bpw_nn, x2k, low_action, high_action, low_target, high_target,
+                 lr=0.05, max_iters=300, time_budget=10., smooth=0.01, tol=1.e-6, nmodels=None):
+        # kstar_lstm, bpw_nn, x2k: jacobian_model twins of the loaded ensembles
+        self.kstar_lstm, self.bpw_nn, self.x2k = kstar_lstm, bpw_nn, x2k
+        self.low_action, self.high_action = np.array(low_action), np.array(high_action)
+        self.span = self.high_action - self.low_action
+        self.target_scale = np.subtract(high_target, low_target)
+        self.lr, self.max_iters, self.time_budget = lr, max_iters, time_budget
+        self.smooth, self.tol, self.nmodels = smooth, tol, nmodels
+        self.f_map = linear_map(v220505_features)
+        self.b_map = linear_map(bpw_features, βn=0.)[1:]
+        self.a_map = (x2k_features(np.eye(6), 0., 0.) - x2k_features(np.zeros(6), 0., 0.)).T
+
+    def rollout(self, state, actions, keep=False):
+        # actions (batch, ticks, 6) from a GUI or single-plasma simulator state (x, u, outputs['βp'])
+        x0 = np.asarray(state['x'], dtype=float).reshape(np.shape(state['x'])[-2:])
+        u0 = np.ravel(state['u']).astype(float)
+        n, T, L = len(actions), actions.shape[1], len(x0)
+        ys = np.zeros([n, L + T, 4])
+        fs = np.zeros([n, L + T, 14])
+        ys[:, :L], fs[:, :L] = x0[:, :4], x0[:, 4:]
+        βp = np.full(n, np.ravel(state['outputs']['βp'])[0])
+        out, caches = np.zeros([n, T, len(plan_params)]), []
+        for t in range(1, T + 1):
+            k = t + L - 1
+            a = actions[:, t - 1]
+            kdd, cx = self.x2k.forward(x2k_features(a, u0[1], βp), self.nmodels)
+            u = np.tile(u0, (n, 1))
+            u[:, [0, 10, 11]] = a[:, [0, 4, 5]]
+            u[:, 12:15] = kdd
+            fs[:, k] = v220505_features(u)
+            y, cl = self.kstar_lstm.forward(np.concatenate([ys[:, t - 1:t - 1 + L], fs[:, t:t + L]], axis=-1), self.nmodels)
+            ys[:, k] = y
+            b, cb = self.bpw_nn.forward(bpw_features(u, y[:, 0]), self.nmodels)
+            βp = b[:, 0]
+            out[:, t - 1] = np.stack([βp, y[:, 1], y[:, 3]], axis=1)
+            if keep:
+                caches.append((cx, cl, cb))
+        return out, caches
+
+    def loss_grad(self, state, p, schedule):
+        # p: actions normalized to [0, 1]; schedule (ticks, 3) with NaN where free
+        n, T = p.shape[:2]
+        L = np.shape(state['x'])[-2]
+        actions = self.low_action + self.span * p
+        out, caches = self.rollout(state, actions, keep=True)
+        w = ~np.isnan(schedule)
+        err = np.where(w, (out - np.nan_to_num(schedule)) / self.target_scale, 0.)
+        norm = max(w.sum(), 1)
+        dp = np.diff(np.concatenate([np.tile((np.ravel(state['action']) - self.low_action) / self.span, (n, 1, 1)), p], axis=1), axis=1)
+        loss = np.sum(err**2, axis=(1, 2)) / norm + self.smooth * np.sum(dp**2, axis=(1, 2)) / T
+        gout = 2 * err / self.target_scale / norm
+
+        # Backpropagation through time
+        gys, gfs = np.zeros([n, L + T, 4]), np.zeros([n, L + T, 14])
+        gβp, ga = np.zeros([n, T + 1]), np.zeros([n, T, 6])
+        for t in range(T, 0, -1):
+            k = t + L - 1
+            cx, cl, cb = caches[t - 1]
+            gb = np.zeros([n, 2])
+            gb[:, 0] = gβp[:, t] + gout[:, t - 1, 0]
+            gxb = self.bpw_nn.backward(cb, gb)
+            gys[:, k, 0] += gxb[:, 0]
+            gys[:, k, 1] += gout[:, t - 1, 1]
+            gys[:, k, 3] += gout[:, t - 1, 2]
+            gw = self.kstar_lstm.backward(cl, gys[:, k])
+            gys[:, t - 1:t - 1 + L] += gw[..., :4]
+            gfs[:, t:t + L] += gw[..., 4:]
+            gu = gxb[:, 1:] @ self.b_map + gfs[:, k] @ self.f_map
+            gs = self.x2k.backward(cx, gu[:, 12:15])
+            ga[:, t - 1] += gs @ self.a_map
+            ga[:, t - 1, [0, 4, 5]] += gu[:, [0, 10, 11]]
+            gβp[:, t - 1] += gs[:, 2]
+        gp = ga * self.span
+        gsmooth = 2 * self.smooth * dp / T
+        gp += gsmooth
+        gp[:, :-1] -= gsmooth[:, 1:]
+        return loss, gp, out
+
+    def optimize(self, state, schedule, init=None, n_starts=1, seed=None):
+        # Projected Adam from the held action (plus random starts); returns the best actions (ticks, 6) and its outputs
+        schedule = np.asarray(schedule, dtype=float)
+        T = len(schedule)
+        init = np.ravel(state['action']) if init is None else np.asarray(init, dtype=float)
+        p0 = np.clip((init - self.low_action) / self.span, 0, 1)
+        p = np.broadcast_to(p0, (n_starts, T, len(self.span))).copy()
+        p[1:] = np.random.default_rng(seed).uniform(0, 1, size=p[1:].shape)
+        m, v = np.zeros_like(p), np.zeros_like(p)
+        self.losses, prev = [], np.inf
+        t0 = time.time()
+        for it in range(1, self.max_iters + 1):
+            loss, g, out = self.loss_grad(state, p, schedule)
+            self.losses.append(loss.min())
+            m = 0.9 * m + 0.1 * g
+            v = 0.999 * v + 0.001 * g**2
+            p = np.clip(p - self.lr * (m / (1 - 0.9**it)) / (np.sqrt(v / (1 - 0.999**it)) + 1.e-8), 0, 1)
+            elapsed = time.time() - t0
+            if abs(prev - loss.min()) < self.tol or elapsed * (it + 1) / it > self.time_budget:
+                break
+            prev = loss.min()
+        self.iterations = it
+        loss, _, out = self.loss_grad(state, p, schedule)
+        best = np.argmin(loss)
+        return self.low_action + self.span * p[best], out[best]
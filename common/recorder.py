@@ -0,0 +1,71 @@
+import json, queue, threading
+import numpy as np
+
+# Append-only chunked column file. Every chunk is a small header with the
+# column names followed by one .npy array per column, so a session can be
+# cut off at any point and everything up to the last whole chunk still loads.
+
+class trajectory_recorder():
+    def __init__(self, path, meta=None, chunk_size=100, max_queue=10000):
+        self.path, self.chunk_size = path, chunk_size
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.dropped = 0
+        self.file = open(path, 'ab')
+        if meta is not None:
+            self.write_chunk({'meta': np.array(json.dumps(meta))})
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def record(self, **row):
+        # Never blocks the control loop; rows are dropped (and counted) if the writer falls behind
+        try:
+            self.queue.put_nowait(row)
+        except queue.Full:
+            self.dropped += 1
+
+    def run(self):
+        rows = []
+        while True:
+            row = self.queue.get()
+            if row is not None:
+                rows.append(row)
+            if len(rows) >= self.chunk_size or (row is None and rows):
+                self.write_chunk({k: np.array([r[k] for r in rows]) for k in rows[0]})
+                rows = []
+            if row is None:
+                break
+        self.file.close()
+
+    def write_chunk(self, columns):
+        header = json.dumps(list(columns)).encode('utf-8')
+        self.file.write(len(header).to_bytes(4, 'little') + header)
+        for v in columns.values():
+            np.lib.format.write_array(self.file, v, allow_pickle=False)
+        self.file.flush()
+
+    def close(self):
+        self.queue.put(None)
+        self.thread.join()
+        if self.dropped > 0:
+            print(f'{self.dropped} rows dropped while recording {self.path}')
+
+def load_recording(path):
+    columns, meta = {}, {}
+    with open(path, 'rb') as f:
+        while True:
+            n = f.read(4)
+            if len(n) < 4:
+                break
+            try:
+                names = json.loads(f.read(int.from_bytes(n, 'little')).decode('utf-8'))
+                chunk = [np.lib.format.read_array(f, allow_pickle=False) for _ in names]
+            except (ValueError, EOFError): # Last chunk cut off
+                break
+            if names == ['meta']:
+                meta.update(json.loads(str(chunk[0])))
+                continue
+            for k, v in zip(names, chunk):
+                columns.setdefault(k, []).append(v)
+    recording = {k: np.concatenate(v) for k, v in columns.items()}
+    recording['meta'] = meta
+    return recording
@@ -0,0 +1,87 @@
+import os, glob, threading
+from common.model_structure import warmup
+from common.simulator import surrogate_variants, rt_policy_variants, rt_policy, v2_policy
+
+# Index of the weight variants under weights/: surrogate versions (with their
+# distilled students, named '<variant>/student') and the rt_control policies.
+# Variants load on first use, or all at once in the background by preload().
+# A GUI requests a variant with swap() and takes the pending swaps with apply()
+# between two ticks, so a tick never mixes variants and loading never blocks it.
+
+class model_registry():
+    def __init__(self, base_path, n_models=10, load=None, load_ensemble=None, warm=False):
+        # warm: trace the surrogates when they load, so that their first tick after a swap is not slow
+        self.base_path, self.n_models, self.warm = base_path, n_models, warm
+        self.load = load or (lambda cls, **kwargs: cls(**kwargs))
+        self.load_ensemble = load_ensemble or self.load
+        self.models, self.locks, self.pending, self.requested = {}, {}, {}, {}
+        self.lock = threading.Lock()
+        self.variants = self.index()
+
+    def index(self):
+        # Variants whose weights exist, per kind ('kstar_lstm', 'bpw_nn', 'x2k', 'policy')
+        exists = lambda path: len(glob.glob(self.base_path + '/weights/' + path + 'best_model0*')) > 0
+        variants = {}
+        for kind, table in surrogate_variants.items():
+            variants[kind] = []
+            for name, (cls, path, kwargs) in table.items():
+                variants[kind] += [name] * exists(path) + [name + '/student'] * exists(path + 'student/')
+        variants['policy'] = [name for name, v in rt_policy_variants.items() if os.path.exists(self.base_path + '/weights/rl/rt_control/' + v[0])]
+        return variants
+
+    def build(self, kind, name):
+        if kind == 'policy':
+            path, family, lookback, wide = rt_policy_variants[name]
+            model_path = self.base_path + '/weights/rl/rt_control/' + path
+            if family == 'v3':
+                return rt_policy(model_path, lookback, load=self.load)
+            return v2_policy(model_path, lookback, wide, load=self.load)
+        variant, student = name.split('/')[0], name.endswith('/student')
+        cls, path, kwargs = surrogate_variants[kind][variant]
+        return self.load_ensemble(cls, model_path=self.base_path + '/weights/' + path + 'student/' * student,
+                                  n_models=1 if student else self.n_models, **kwargs)
+
+    def get(self, kind, name):
+        # Loaded once; concurrent requests of the same variant wait for the first
+        with self.lock:
+            lock = self.locks.setdefault((kind, name), threading.Lock())
+        with lock:
+            if (kind, name) not in self.models:
+                model = self.build(kind, name)
+                if self.warm and kind != 'policy':
+                    warmup(model)
+                self.models[(kind, name)] = model
+        return self.models[(kind, name)]
+
+    def loaded(self, kind, name):
+        return (kind, name) in self.models
+
+    def preload(self, variants=None, background=True):
+        # variants: {kind: [names]}, by default every indexed one
+        jobs = [(kind, name) for kind, names in (variants or self.variants).items() for name in names]
+        run = lambda: [self.get(kind, name) for kind, name in jobs]
+        if background:
+            threading.Thread(target=run, daemon=True).start()
+        else:
+            run()
+
+    def swap(self, kind, name):
+        # Queue a swap; a variant that is not loaded yet loads in the background and is queued when ready,
+        # unless another one of its kind was requested meanwhile
+        with self.lock:
+            self.requested[kind] = name
+        def run():
+            model = self.get(kind, name)
+            with self.lock:
+                if self.requested[kind] == name:
+                    self.pending[kind] = (name, model)
+        if self.loaded(kind, name):
+            run()
+        else:
+            threading.Thread(target=run, daemon=True).start()
+
+    def apply(self):
+        # {kind: (name, model)} of the swaps ready since the last call
+        with self.lock:
+            pending, self.pending = self.pending, {}
+        return pending
@@ -0,0 +1,94 @@
+import numpy as np
+from numpy.lib.stride_tricks import as_strided
+from common.features import *
+
+# Re-runs a recorded rt_control_v3 session through the surrogates without the
+# GUI. The LSTM windows of every tick are strided views over one padded feature
+# array, so a whole recording goes through in a few large batched calls.
+
+lstm_params = ['βn', 'q95', 'q0', 'li']
+bpw_params = ['βp', 'wmhd']
+replay_params = ['βn', 'βp', 'h89', 'h98', 'q95', 'q0', 'li', 'wmhd'] # output_params2 of rt_control_v3
+
+def sliding_windows(x, length):
+    # Zero-copy view of all length-long windows along the first axis
+    n = len(x) - length + 1
+    return as_strided(x, shape=(n, length) + x.shape[1:], strides=(x.strides[0],) + x.strides, writeable=False)
+
+def session_windows(u, y0d, seq_len=10, year=year_in, v220505=True, x0=None):
+    # Window of tick t as predict0d builds it: actuators of ticks t-seq_len+1..t with the 0D outputs
+    # one tick behind. Rows before the first tick come from x0, the GUI window when the recording
+    # started (outputs and actuators of the same tick), or else repeat the steady-state initialization.
+    prev = np.concatenate([y0d[:1], y0d[:-1]])
+    width = len(lstm_params) + (14 if v220505 else 17)
+    seeded = x0 is not None and np.shape(x0) == (seq_len, width)
+    if seeded:
+        x0 = np.asarray(x0, dtype=float)
+        prev[0] = x0[-1, :len(lstm_params)]
+    f = lstm_features(u, prev, v220505=v220505, year=year)
+    if seeded:
+        pad = np.concatenate([x0[:-1, :len(lstm_params)], x0[1:, len(lstm_params):]], axis=1)
+    else:
+        pad = np.repeat(f[:1], seq_len - 1, axis=0)
+    f = np.concatenate([pad, f])
+    return sliding_windows(f, seq_len)
+
+def batched(fn, x, batch_size):
+    return np.concatenate([fn(x[i:i + batch_size]) for i in range(0, len(x), batch_size)])
+
+def error_stats(pred, true):
+    err = np.asarray(pred) - np.asarray(true)
+    return {'rmse': np.sqrt(np.mean(err**2)), 'mae': np.mean(np.abs(err)), 'max': np.max(np.abs(err)), 'bias': np.mean(err)}
+
+class replay_engine():
+    def __init__(self, kstar_lstm, bpw_nn, x2rz=None, seq_len=10, year=year_in, batch_size=4096):
+        self.kstar_lstm, self.bpw_nn, self.x2rz = kstar_lstm, bpw_nn, x2rz
+        self.seq_len, self.year, self.batch_size = seq_len, year, batch_size
+
+    def run(self, recording, free_run=False):
+        u, actions = recording['inputs'], recording['actions']
+        recorded = dict(zip(recording['meta'].get('output_params', replay_params), recording['outputs'].T))
+        y0d = np.stack([recorded[p] for p in lstm_params], axis=1)
+
+        # βn, q95, q0, li: teacher-forced by the recorded outputs, or fed back as in the GUI
+        if free_run:
+            y = self.free_run(u, y0d[0])
+        else:
+            y = np.array(y0d)
+            y[1:] = batched(self.kstar_lstm.predict_batch, session_windows(u, y0d, self.seq_len, self.year, x0=recording['meta'].get('x0'))[1:], self.batch_size)
+        out = dict(zip(lstm_params, y.T))
+
+        # βp, wmhd and H factors
+        y = batched(self.bpw_nn.predict_batch, bpw_features(u, out['βn']), self.batch_size)
+        out.update(zip(bpw_params, y.T))
+        out['h89'], out['h98'] = h_factors(u, out['wmhd'])
+
+        # Boundary from the X-point actions, with βp one tick behind as in predictBoundary
+        if self.x2rz is not None:
+            βp = np.concatenate([out['βp'][:1], out['βp'][:-1]])
+            x = x2rz_features(u, actions, βp)
+            rz = [self.x2rz.predict_batch(x[i:i + self.batch_size]) for i in range(0, len(x), self.batch_size)]
+            out['rbdry'], out['zbdry'] = np.concatenate([r for r, z in rz]), np.concatenate([z for r, z in rz])
+
+        result = {'time': recording['time'], 'predicted': out, 'recorded': recorded}
+        # Without the starting window in the meta (older recordings), the first windows are guessed and left out
+        first = 1 if 'x0' in recording['meta'] else self.seq_len
+        result['errors'] = {p: error_stats(out[p][first:], recorded[p][first:]) for p in replay_params if p in recorded}
+        if 'rbdry' in out and 'rbdry' in recording:
+            result['errors']['boundary'] = error_stats(np.hypot(out['rbdry'] - recording['rbdry'], out['zbdry'] - recording['zbdry']), 0.)
+        return result
+
+    def free_run(self, u, y0):
+        # Tick-by-tick rollout on the surrogate's own outputs (drift over the whole session)
+        y = np.zeros([len(u), len(lstm_params)])
+        y[0] = y0
+        f = lstm_features(u, np.zeros_like(y), year=self.year)
+        x = np.repeat(f[:1], self.seq_len, axis=0)
+        x[:, :len(lstm_params)] = y0
+        for t in range(1, len(u)):
+            x[:-1, len(lstm_params):] = x[1:, len(lstm_params):]
+            x[-1, len(lstm_params):] = f[t, len(lstm_params):]
+            y[t] = self.kstar_lstm.predict_batch(x)[0]
+            x[:-1, :len(lstm_params)] = x[1:, :len(lstm_params)]
+            x[-1, :len(lstm_params)] = y[t]
+        return y
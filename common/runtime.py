@@ -0,0 +1,156 @@
+import os, time
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+try:
+    from threadpoolctl import threadpool_limits
+except ImportError:
+    threadpool_limits = None
+
+blas_env = ['OMP_NUM_THREADS', 'OPENBLAS_NUM_THREADS', 'MKL_NUM_THREADS', 'BLIS_NUM_THREADS']
+
+def configure_threads(tf_intra=None, tf_inter=None, blas=None):
+    # TF pools are fixed once the runtime starts, so call this before any model is loaded
+    if blas is not None:
+        for k in blas_env:
+            os.environ[k] = str(blas) # Spawned workers read these at start-up
+        if threadpool_limits is not None:
+            threadpool_limits(limits=blas)
+        else:
+            print('threadpoolctl not found; BLAS threads of this process stay as they are')
+    if tf_intra is not None or tf_inter is not None:
+        import tensorflow as tf
+        if tf_intra is not None:
+            tf.config.threading.set_intra_op_parallelism_threads(tf_intra)
+        if tf_inter is not None:
+            tf.config.threading.set_inter_op_parallelism_threads(tf_inter)
+
+def pin_thread(cores):
+    # On Linux this binds only the calling thread; threads it starts afterwards inherit the mask
+    if cores is not None and hasattr(os, 'sched_setaffinity'):
+        os.sched_setaffinity(0, cores)
+
+class tick_timer():
+    def __init__(self, length=1000):
+        self.length = length
+        self.durations = []
+
+    def start(self):
+        self.t0 = time.perf_counter()
+
+    def stop(self):
+        self.durations.append(time.perf_counter() - self.t0)
+        if len(self.durations) > self.length:
+            del self.durations[0]
+
+    def stats(self):
+        return tick_stats(self.durations)
+
+def tick_stats(durations):
+    d = 1.e3 * np.array(durations)
+    if len(d) == 0:
+        return {}
+    return {'n': len(d), 'mean [ms]': d.mean(), 'std [ms]': d.std(), 'p50 [ms]': np.percentile(d, 50),
+            'p99 [ms]': np.percentile(d, 99), 'max [ms]': d.max(), 'jitter [ms]': np.percentile(d, 99) - np.percentile(d, 50)}
+
+def measure_jitter(fn, n=100):
+    timer = tick_timer(length=n)
+    for _ in range(n):
+        timer.start()
+        fn()
+        timer.stop()
+    return timer.stats()
+
+def format_stats(stats):
+    return ', '.join(f'{k} {v:.3g}' if k != 'n' else f'{k} {v}' for k, v in stats.items())
+
+class tick_graph():
+    # One tick as a dataflow graph. A node runs once its dependencies are done: pool nodes on a thread
+    # pool, the others on the calling thread (Qt widgets, matplotlib), so independent stages overlap and
+    # the tick takes its critical path. Nodes are added after their dependencies, which keeps it acyclic.
+    def __init__(self, n_threads=1, cores=None):
+        self.nodes, self.timers = {}, {}
+        self.executor = ThreadPoolExecutor(n_threads, initializer=pin_thread, initargs=(cores,)) if n_threads > 0 else None
+
+    def add(self, name, fn, deps=(), pool=False):
+        # fn(results) gets the results of the dependencies by name
+        for d in deps:
+            if d not in self.nodes:
+                raise ValueError(f'Unknown dependency {d!r} of {name!r}')
+        self.nodes[name] = (fn, list(deps), pool and self.executor is not None)
+        self.timers[name] = tick_timer()
+
+    def call(self, name, results):
+        fn, deps, pool = self.nodes[name]
+        self.timers[name].start()
+        result = fn({d: results.get(d) for d in deps})
+        self.timers[name].stop()
+        return result
+
+    def run(self, skip=()):
+        # Results by node name; skipped nodes count as done. Without threads the nodes run in insertion order.
+        results, running = {}, {}
+        pending = [n for n in self.nodes if n not in skip]
+        done = lambda n: n in results or n in skip
+        while pending or running:
+            ready = [n for n in pending if all(done(d) for d in self.nodes[n][1])]
+            for name in [n for n in ready if self.nodes[n][2]]:
+                running[self.executor.submit(self.call, name, results)] = name
+                pending.remove(name)
+            local = [n for n in ready if not self.nodes[n][2]]
+            if local: # One at a time, so that pool nodes it unblocks start before the next
+                results[local[0]] = self.call(local[0], results)
+                pending.remove(local[0])
+                finished = [f for f in running if f.done()]
+            elif running:
+                finished = wait(running, return_when=FIRST_COMPLETED).done
+            else:
+                raise RuntimeError(f'Unreachable nodes {pending}')
+            for f in finished:
+                results[running.pop(f)] = f.result()
+        return results
+
+    def stats(self):
+        return {name: timer.stats() for name, timer in self.timers.items()}
+
+class lazy_values():
+    # Derived quantities that are only computed on demand. A value is fn(*sources) over named inputs set
+    # by the tick (or other values); get() reuses the last result while its sources are unchanged, and
+    # consumers (panels, the recorder) subscribe to what they show, so that wanted() tells a tick what to skip.
+    def __init__(self):
+        self.values, self.state, self.versions, self.results, self.subscribers = {}, {}, {}, {}, {}
+        self.computed = self.reused = 0
+
+    def add(self, name, fn, sources):
+        # sources: names of set() inputs or of values added before
+        self.values[name] = (fn, list(sources))
+        self.subscribers[name] = set()
+
+    def set(self, **sources):
+        # A source whose value did not change keeps its version, so the values on it stay clean
+        for name, value in sources.items():
+            if name not in self.state or not np.array_equal(self.state[name], value):
+                self.state[name] = value
+                self.versions[name] = self.versions.get(name, 0) + 1
+
+    def get(self, name):
+        fn, sources = self.values[name]
+        args = [self.get(s) if s in self.values else self.state[s] for s in sources]
+        stamp = tuple(self.versions.get(s, 0) for s in sources)
+        if name in self.results and self.results[name][0] == stamp:
+            self.reused += 1
+        else:
+            self.results[name] = (stamp, fn(*args))
+            self.versions[name] = self.versions.get(name, 0) + 1
+            self.computed += 1
+        return self.results[name][1]
+
+    def subscribe(self, name, consumer):
+        self.subscribers[name].add(consumer)
+
+    def unsubscribe(self, name, consumer):
+        self.subscribers[name].discard(consumer)
+
+    def wanted(self, name):
+        # Subscribed, directly or through a value computed from it
+        return bool(self.subscribers[name]) or any(name in sources and self.wanted(v) for v, (fn, sources) in self.values.items())
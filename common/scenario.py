@@ -0,0 +1,192 @@
+import json, os
+import numpy as np
+from common.simulator import *
+from common.recorder import trajectory_recorder
+from common.metrics import metric_names, staircase_metrics
+from common.cache import cache_key
+
+try:
+    import yaml
+except ImportError:
+    yaml = None
+
+# Headless target-schedule scenarios for the rt_control plasmas. A scenario is a JSON
+# (or YAML) dict of initial values and timed events; every event ramps targets,
+# uncontrolled inputs or actuator overrides linearly to new values:
+#
+#   {"name": "bt_step", "duration": 4.0,
+#    "inputs": {"Bt [T]": 1.8}, "targets": {"βp": 1.5, "q95": 5.5},
+#    "events": [{"time": 1.0, "ramp": 1.0, "targets": {"βp": 2.0}},
+#               {"time": 2.0, "inputs": {"Bt [T]": 2.0}},
+#               {"time": 3.0, "actions": {"Ip [MA]": 0.6}},
+#               {"time": 3.5, "actions": {"Ip [MA]": null}}]}
+#
+# An action override replaces that component of the policy action until it is
+# released with null. Targets, actions and the inputs written by the control
+# follow the plasma class (rt_plasma or v2_plasma). All scenarios of a run
+# advance in lockstep on one batch. run_arena puts several controllers (the
+# lanes of an arena_plasma) on the same scenarios in that batch, each given
+# the part of a scenario that applies to it.
+
+def load_scenario(path):
+    with open(path) as f:
+        if path.endswith(('.yaml', '.yml')):
+            if yaml is None:
+                raise ImportError(f'PyYAML is needed to read {path}')
+            scenario = yaml.safe_load(f)
+        else:
+            scenario = json.load(f)
+    scenario.setdefault('name', os.path.splitext(os.path.basename(path))[0])
+    return scenario
+
+def channel(init, events, key, name, times):
+    # Value of one channel at every tick; NaN where unset (released overrides)
+    v = np.full(len(times), np.nan if init is None else float(init))
+    for e in events:
+        if name not in e.get(key, {}):
+            continue
+        new = np.nan if e[key][name] is None else float(e[key][name])
+        after = times >= e['time'] - 1.e-9
+        if not np.any(after):
+            continue
+        prev = v[np.argmax(after)]
+        frac = np.clip((times[after] - e['time']) / e['ramp'], 0, 1) if e.get('ramp', 0) > 0 else 1.
+        v[after] = np.where(np.isnan(prev) | np.isnan(new), new, prev + (new - prev) * frac)
+    return v
+
+def compile_scenario(scenario, plasma=rt_plasma):
+    # Per-tick schedules (ticks, ...) of the targets, the input panel and the action overrides; tick 0 is the reset
+    times = dt * np.arange(int(round(scenario['duration'] / dt)) + 1)
+    events = sorted(scenario.get('events', []), key=lambda e: e['time'])
+    for e in [scenario] + events:
+        for key, names in [('inputs', input_params), ('targets', plasma.target_params), ('actions', plasma.action_params)]:
+            for name in e.get(key, {}):
+                if name not in names:
+                    raise ValueError(f'Unknown {key[:-1]} {name!r} in scenario {scenario["name"]!r}')
+                if key == 'inputs' and input_params.index(name) in plasma.controlled_inputs:
+                    raise ValueError(f'{name} is set by the control; override it in "actions"')
+    inputs = dict(zip(input_params, rt_input_init), **scenario.get('inputs', {}))
+    targets = dict(zip(plasma.target_params, np.mean([plasma.low_target, plasma.high_target], axis=0)), **scenario.get('targets', {}))
+    return {
+        'name': scenario['name'],
+        'time': times,
+        'inputs': np.stack([channel(inputs[p], events, 'inputs', p, times) for p in input_params], axis=1),
+        'targets': np.stack([channel(targets[p], events, 'targets', p, times) for p in plasma.target_params], axis=1),
+        'overrides': np.stack([channel(scenario.get('actions', {}).get(p), events, 'actions', p, times) for p in plasma.action_params], axis=1),
+    }
+
+def schedules(sim, scenarios):
+    # Compiled scenarios and their (ticks, scenarios, ...) schedules, padded to the longest
+    compiled = [compile_scenario(s, sim) for s in scenarios]
+    n_ticks = max(len(c['time']) for c in compiled)
+    pad = lambda c, k: np.concatenate([c[k], np.repeat(c[k][-1:], n_ticks - len(c[k]), axis=0)])
+    return [compiled] + [np.stack([pad(c, k) for c in compiled], axis=1) for k in ['inputs', 'targets', 'overrides']]
+
+def drive(sim, inputs, targets, overrides, t):
+    # Scenario channels of tick t onto the plasma, then its (overridden) policy action
+    sim.targets = targets[t]
+    uncontrolled = [i for i in range(n_inputs) if i not in sim.controlled_inputs]
+    sim.u[:, uncontrolled] = inputs[t][:, uncontrolled]
+    action = sim.policy.predict_batch(sim.observation(), yold=sim.action)
+    sim.control(np.where(np.isnan(overrides[t]), action, overrides[t]))
+
+def snapshot(sim):
+    return sim.u.copy(), sim.output(), sim.action.copy()
+
+def score(sim, compiled, trace, targets, record_path=None, meta=None, scale=None, **metric_kwargs):
+    # Per scenario its trajectory and staircase metrics, from the snapshots of every tick; scale defaults to the target ranges
+    us, outputs, actions = [np.array(v) for v in zip(*trace)]
+    results = []
+    scale = np.subtract(sim.high_target, sim.low_target) if scale is None else scale
+    idx = [output_params2.index(p) for p in sim.target_params]
+    for i, c in enumerate(compiled):
+        T = len(c['time'])
+        result = {'name': c['name'], 'time': c['time'], 'inputs': us[:T, i], 'actions': actions[:T, i], 'outputs': outputs[:T, i], 'targets': targets[:T, i]}
+        result['starts'], result['metrics'] = staircase_metrics(outputs[:T, i:i + 1, idx], targets[:T, i:i + 1], scale=scale, **metric_kwargs)
+        if record_path is not None:
+            write_recording(record_path + c['name'] + '.rec', result, dict(meta or {}, scenario=c['name']), sim)
+        results.append(result)
+    return results
+
+def run_scenarios(sim, scenarios, record_path=None, meta=None, **metric_kwargs):
+    # sim: rt_plasma or v2_plasma with a policy; returns per scenario its trajectory and staircase metrics
+    compiled, inputs, targets, overrides = schedules(sim, scenarios)
+    sim.reset(inputs[0], targets[0])
+    trace = [snapshot(sim)]
+    for t in range(1, len(inputs)):
+        drive(sim, inputs, targets, overrides, t)
+        sim.predict0d()
+        trace.append(snapshot(sim))
+    return score(sim, compiled, trace, targets, record_path, meta, **metric_kwargs)
+
+def restrict(scenario, plasma):
+    # The part of a scenario that applies to a plasma class: targets it does not track (li for rt_plasma),
+    # inputs its control sets and overrides of other actions are dropped
+    names = {'targets': plasma.target_params, 'actions': plasma.action_params,
+             'inputs': [p for i, p in enumerate(input_params) if i not in plasma.controlled_inputs]}
+    keep = lambda e: dict(e, **{key: {k: v for k, v in e.get(key, {}).items() if k in names[key]} for key in names})
+    return dict(keep(scenario), events=[keep(e) for e in scenario.get('events', [])])
+
+def arena_scenarios(lanes, scenarios):
+    # Union of the lanes' target ranges, and the scenarios with their unset initial targets at its middle
+    ranges = {}
+    for lane in lanes:
+        for p, low, high in zip(lane.target_params, lane.low_target, lane.high_target):
+            ranges[p] = (min(low, ranges.get(p, (low, high))[0]), max(high, ranges.get(p, (low, high))[1]))
+    return ranges, [dict(s, targets=dict({p: float(np.mean(r)) for p, r in ranges.items()}, **s.get('targets', {}))) for s in scenarios]
+
+def run_arena(arena, scenarios, names=None, record_path=None, meta=None, **metric_kwargs):
+    # Every lane of an arena_plasma on the same scenarios; returns the results of run_scenarios per lane.
+    # Unset initial targets and the metric scales come from the union of the lanes' target ranges, so that
+    # wide and narrow policies get the same targets and are scored alike.
+    ranges, scenarios = arena_scenarios(arena.lanes, scenarios)
+    plans = [schedules(lane, [restrict(s, lane) for s in scenarios]) for lane in arena.lanes]
+    arena.reset([p[1][0] for p in plans], [p[2][0] for p in plans])
+    traces = [[snapshot(lane)] for lane in arena.lanes]
+    for t in range(1, len(plans[0][1])):
+        for lane, p in zip(arena.lanes, plans):
+            drive(lane, *p[1:], t)
+        arena.predict0d()
+        for lane, trace in zip(arena.lanes, traces):
+            trace.append(snapshot(lane))
+    names = names or [str(i) for i in range(len(arena.lanes))] # Recordings are <record_path><name>_<scenario>.rec
+    return [score(lane, p[0], trace, p[2], None if record_path is None else f'{record_path}{name}_', dict(meta or {}, lane=name),
+                  scale=[ranges[q][1] - ranges[q][0] for q in lane.target_params], **metric_kwargs)
+            for name, lane, p, trace in zip(names, arena.lanes, plans, traces)]
+
+def write_recording(path, result, meta, sim):
+    # Same columns as a GUI session recording, so replay.py can read it
+    if os.path.exists(path):
+        os.remove(path) # The recorder appends
+    recorder = trajectory_recorder(path, meta=dict(meta, input_params=input_params, action_params=sim.action_params,
+                                                   output_params=output_params2, target_params=sim.target_params),
+                                   max_queue=len(result['time']) + 1)
+    for t in range(len(result['time'])):
+        recorder.record(time=result['time'][t], inputs=result['inputs'][t], actions=result['actions'][t],
+                        outputs=result['outputs'][t], targets=result['targets'][t])
+    recorder.close()
+
+def result_arrays(result):
+    arrays = {k: v for k, v in result.items() if k != 'metrics'}
+    arrays.update({'metric_' + k: v for k, v in result['metrics'].items()})
+    return arrays
+
+def result_from_arrays(arrays):
+    if arrays is None:
+        return None
+    result = {k: v for k, v in arrays.items() if not k.startswith('metric_')}
+    result['name'] = str(result['name'])
+    result['metrics'] = {k: arrays['metric_' + k] for k in metric_names}
+    return result
+
+def run_cached(make_sim, scenarios, cache, config, **kwargs):
+    # run_scenarios through a result_cache, keyed by config (weight checksums, controller settings) and the scenario;
+    # make_sim is only called if some scenario misses
+    keys = [cache_key(config, s, kwargs) for s in scenarios]
+    results = [result_from_arrays(cache.get(k)) for k in keys]
+    missing = [i for i, r in enumerate(results) if r is None]
+    if missing:
+        for i, r in zip(missing, run_scenarios(make_sim(), [scenarios[i] for i in missing], **kwargs)):
+            cache.put(keys[i], **result_arrays(r))
+            results[i] = r
+    return results
@@ -0,0 +1,203 @@
+import os, time, json, queue, atexit, threading
+from multiprocessing import shared_memory
+from multiprocessing.connection import Listener, Client
+import numpy as np
+from common import model_structure
+from common.model_structure import SB2_model, warmup
+from common.parallel import ensemble_proxy
+
+# One server process keeps the weights resident and evaluates them for any
+# number of clients. Requests arrive over a Unix domain socket, payloads go
+# through a shared memory block owned by each client, and concurrent requests
+# for the same model are concatenated into one batched call.
+
+servable = ['k2rz', 'x2rz', 'kstar_lstm', 'kstar_v220505', 'kstar_nn', 'bpw_nn', 'tf_dense_model', 'SB2_model']
+
+def model_spec(model_class, kwargs):
+    # Only what the server needs to load and run the network; scaling and post-processing stay on the client
+    if issubclass(model_class, SB2_model):
+        spec = {'activation': kwargs.get('activation', 'relu'), 'last_actv': kwargs.get('last_actv', 'tanh')}
+    else:
+        spec = {k: kwargs[k] for k in ['length'] if k in kwargs}
+    spec['model_path'] = os.path.normpath(kwargs['model_path'])
+    return spec
+
+class batcher():
+    def __init__(self, fn, batch_window=0.002):
+        self.fn, self.batch_window = fn, batch_window
+        self.queue = queue.Queue()
+        threading.Thread(target=self.run, daemon=True).start()
+
+    def submit(self, x, active=None):
+        item = {'x': x, 'active': active, 'done': threading.Event()}
+        self.queue.put(item)
+        item['done'].wait()
+        if isinstance(item['y'], Exception):
+            raise item['y']
+        return item['y']
+
+    def run(self):
+        while True:
+            items = [self.queue.get()]
+            deadline = time.time() + self.batch_window
+            while True:
+                try:
+                    items.append(self.queue.get(timeout=max(deadline - time.time(), 0)))
+                except queue.Empty:
+                    break
+
+            # Requests agree on row shape and active members to share a call
+            groups = {}
+            for item in items:
+                active = None if item['active'] is None else tuple(item['active'])
+                groups.setdefault((item['x'].shape[1:], active), []).append(item)
+            for (_, active), group in groups.items():
+                try:
+                    y = self.fn(np.concatenate([item['x'] for item in group]), active)
+                    i = 0
+                    for item in group:
+                        item['y'], i = y[i:i + len(item['x'])], i + len(item['x'])
+                except Exception as e:
+                    for item in group:
+                        item['y'] = e
+                for item in group:
+                    item['done'].set()
+
+class model_server():
+    def __init__(self, address, batch_window=0.002):
+        self.address, self.batch_window = address, batch_window
+        self.models, self.batchers = {}, {}
+        self.lock = threading.Lock()
+
+    def load(self, class_name, spec, n_models=1):
+        if class_name not in servable:
+            raise ValueError(f'{class_name} is not servable')
+        key = class_name + json.dumps(spec, sort_keys=True)
+        with self.lock:
+            if key in self.models and (class_name == 'SB2_model' or len(self.models[key].models) >= n_models):
+                return key
+            model_class = getattr(model_structure, class_name)
+            if model_class is SB2_model:
+                model = SB2_model(spec['model_path'], None, None, None, None, spec['activation'], spec['last_actv'], norm=False)
+                fn = lambda x, active, model=model: model.forward(x)
+            else:
+                model = model_class(n_models=n_models, **spec)
+                warmup(model)
+                fn = lambda x, active, model=model: np.mean([model.models[i].predict(x) for i in active], axis=0)
+            self.models[key] = model
+            self.batchers[key] = batcher(fn, self.batch_window)
+        print(f'Loaded {key}')
+        return key
+
+    def nout(self, key):
+        model = self.models[key]
+        if isinstance(model, SB2_model):
+            return len(model.parameters['model/pi/dense/bias:0'])
+        return model.models[0].output_shape[-1]
+
+    def handle(self, conn):
+        shm = None
+        try:
+            while True:
+                msg = conn.recv()
+                try:
+                    if msg[0] == 'load':
+                        key = self.load(*msg[1:])
+                        conn.send(('ok', key, self.nout(key)))
+                    elif msg[0] == 'buffer':
+                        if shm is not None:
+                            shm.close()
+                        shm = shared_memory.SharedMemory(name=msg[1])
+                        conn.send(('ok',))
+                    elif msg[0] == 'predict':
+                        _, key, shape, active = msg
+                        x = np.ndarray(shape, dtype=np.float64, buffer=shm.buf).copy()
+                        y = np.asarray(self.batchers[key].submit(x, active), dtype=np.float64)
+                        np.ndarray(y.shape, dtype=np.float64, buffer=shm.buf, offset=x.nbytes)[:] = y
+                        conn.send(('ok', y.shape))
+                    else:
+                        raise ValueError(f'Unknown request {msg[0]}')
+                except Exception as e:
+                    conn.send(('error', repr(e)))
+        except EOFError:
+            pass
+        finally:
+            if shm is not None:
+                shm.close()
+            conn.close()
+
+    def serve_forever(self):
+        if os.path.exists(self.address):
+            os.unlink(self.address)
+        with Listener(self.address, family='AF_UNIX') as listener:
+            print(f'Serving on {self.address}')
+            while True:
+                conn = listener.accept()
+                threading.Thread(target=self.handle, args=(conn,), daemon=True).start()
+
+class model_client():
+    def __init__(self, address):
+        self.conn = Client(address, family='AF_UNIX')
+        self.lock = threading.Lock()
+        self.shm, self.capacity = None, 0
+        atexit.register(self.close)
+
+    def request(self, msg):
+        self.conn.send(msg)
+        reply = self.conn.recv()
+        if reply[0] == 'error':
+            raise RuntimeError(reply[1])
+        return reply[1:]
+
+    def load(self, model_class, **kwargs):
+        with self.lock:
+            key, nout = self.request(('load', model_class.__name__, model_spec(model_class, kwargs), kwargs.get('n_models', 1)))
+        if issubclass(model_class, SB2_model):
+            return remote_policy(self, key, nout, **kwargs)
+        return remote_ensemble(self, key, nout, model_class, **kwargs)
+
+    def evaluate(self, key, nout, x, active=None):
+        x = np.asarray(x, dtype=np.float64)
+        size = x.nbytes + 8 * len(x) * nout
+        with self.lock:
+            if size > self.capacity:
+                self.release()
+                self.capacity = max(size, 2 * self.capacity)
+                self.shm = shared_memory.SharedMemory(create=True, size=self.capacity)
+                self.request(('buffer', self.shm.name))
+            np.ndarray(x.shape, dtype=np.float64, buffer=self.shm.buf)[:] = x
+            shape, = self.request(('predict', key, x.shape, active))
+            return np.ndarray(shape, dtype=np.float64, buffer=self.shm.buf, offset=x.nbytes).copy()
+
+    def release(self):
+        if self.shm is not None:
+            self.shm.close()
+            self.shm.unlink()
+        self.shm = None
+
+    def close(self):
+        self.conn.close()
+        self.release()
+
+class remote_ensemble(ensemble_proxy):
+    def __init__(self, client, key, nout, model_class, **kwargs):
+        super().__init__(model_class, **kwargs)
+        self.client, self.key, self.nout = client, key, nout
+
+    def ensemble(self, x, nmodels=None):
+        return self.client.evaluate(self.key, self.nout, x, sorted(self.models[:nmodels or self.nmodels]))
+
+class remote_policy(SB2_model):
+    def __init__(self, client, key, nout, model_path, low_state, high_state, low_action, high_action, activation='relu', last_actv='tanh', norm=True, bavg=0.):
+        self.client, self.key, self.nout = client, key, nout
+        self.model_path = model_path
+        self.low_state, self.high_state = low_state, high_state
+        self.low_action, self.high_action = low_action, high_action
+        self.activation, self.last_actv = activation, last_actv
+        self.norm = norm
+        self.bavg = bavg
+
+    def forward(self, xnorm):
+        xnorm = np.asarray(xnorm, dtype=np.float64)
+        ynorm = self.client.evaluate(self.key, self.nout, np.atleast_2d(xnorm))
+        return ynorm[0] if xnorm.ndim == 1 else ynorm
@@ -0,0 +1,63 @@
+import os, csv
+import numpy as np
+from common.features import *
+from common.replay import session_windows, error_stats, lstm_params
+
+# Offline validation of the LSTM surrogates against experimental discharges.
+# A shot is one CSV (header row) or npz file with a time base, the 15 actuator
+# waveforms and the measured βn, q95, q0, li, named as in shot_columns.
+
+input_columns = ['ip', 'bt', 'fgw', 'pnb1a', 'pnb1b', 'pnb1c', 'pec2', 'pec3', 'zec2', 'zec3', 'rin', 'rout', 'k', 'du', 'dl']
+output_columns = ['betan', 'q95', 'q0', 'li']
+shot_columns = ['time'] + input_columns + output_columns
+
+def load_shot(path, dt=0.1):
+    if path.endswith('.npz'):
+        with np.load(path) as f:
+            columns = {k: np.asarray(f[k], dtype=float) for k in shot_columns}
+    else:
+        with open(path, newline='') as f:
+            rows = list(csv.DictReader(f))
+        columns = {k: np.array([float(r[k]) for r in rows]) for k in shot_columns}
+
+    # Resample onto the surrogate time step
+    t = columns['time']
+    if dt is not None:
+        t = np.arange(t[0], t[-1] + 1.e-9, dt)
+        columns = {k: np.interp(t, columns['time'], v) for k, v in columns.items()}
+    u = np.stack([columns[k] for k in input_columns], axis=1)
+    y = np.stack([columns[k] for k in output_columns], axis=1)
+    return t, u, y
+
+def evaluate_shots(model, paths, seq_len=10, year=year_in, v220505=True, dt=0.1, batch_size=8192):
+    # Windows of several shots share one predict call; each shot keeps (time, predicted, measured, errors)
+    results, pending, n = {}, [], 0
+    for i, path in enumerate(paths):
+        t, u, y = load_shot(path, dt)
+        pending.append((path, t, y, session_windows(u, y, seq_len, year, v220505)[1:]))
+        n += len(t) - 1
+        if n >= batch_size or i == len(paths) - 1:
+            yp = model.predict_batch(np.concatenate([w for _, _, _, w in pending]))
+            j = 0
+            for path, t, y, w in pending:
+                pred = np.concatenate([y[:1], yp[j:j + len(w)]])
+                j += len(w)
+                results[path] = {
+                    'time': t, 'predicted': pred, 'measured': y,
+                    'errors': {p: error_stats(pred[1:, k], y[1:, k]) for k, p in enumerate(lstm_params)},
+                }
+            pending, n = [], 0
+    return results
+
+def write_results(results, out_path):
+    os.makedirs(out_path, exist_ok=True)
+    rows = []
+    for path, r in results.items():
+        shot = os.path.splitext(os.path.basename(path))[0]
+        np.savez(os.path.join(out_path, shot + '.npz'), time=r['time'], predicted=r['predicted'], measured=r['measured'], params=lstm_params)
+        for p, stats in r['errors'].items():
+            rows.append(dict(shot=shot, param=p, **stats))
+    with open(os.path.join(out_path, 'summary.csv'), 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=['shot', 'param', 'rmse', 'mae', 'max', 'bias'])
+        writer.writeheader()
+        writer.writerows(rows)
@@ -0,0 +1,428 @@
+import numpy as np
+from common.model_structure import *
+from common.features import *
+
+# Batched headless versions of the GUI plasmas. Every state array carries a
+# leading batch axis, so N plasmas advance in lockstep with one surrogate call
+# per model and tick. The update order follows predict0d/autoControl of the GUIs.
+
+dt = 0.1
+output_params0 = ['βn', 'q95', 'q0', 'li']
+output_params1 = ['βp', 'wmhd']
+output_params2 = ['βn', 'βp', 'h89', 'h98', 'q95', 'q0', 'li', 'wmhd']
+
+input_params = ['Ip [MA]','Bt [T]','GW.frac. [-]','Pnb1a [MW]','Pnb1b [MW]','Pnb1c [MW]','Pec2 [MW]','Pec3 [MW]',
+                'Zec2 [cm]','Zec3 [cm]','In.Mid. [m]','Out.Mid. [m]','Elon. [-]','Up.Tri. [-]','Lo.Tri. [-]']
+
+# rt_control_v3 (input panel in input_params order)
+rt_input_mins = [0.3, 1.5, 0.2, 0.0, 0.0, 0.0, 0.0, 0.0, -10, -10, 1.265, 2.18, 1.5, 0.0, 0.35]
+rt_input_maxs = [0.8, 2.7, 0.6, 1.75, 1.75, 1.5, 0.8, 0.8, 10, 10, 1.36, 2.30, 2.0, 0.6, 0.95]
+rt_input_init = [0.5, 1.8, 0.33, 1.5, 1.5, 0.6, 0.0, 0.0, 0.0, 0.0, 1.32, 2.22, 1.7, 0.3, 0.75]
+rt_lookback = 3
+rt_low_action  = [0.3, 1.36, 0.78, -0.050, 1.27, 2.18]
+rt_high_action = [0.8, 1.54, 1.01, -0.005, 1.34, 2.30]
+rt_low_target  = [1.0, 4.0]
+rt_high_target = [2.0, 7.0]
+rt_target_params = ['βp', 'q95']
+rt_action_params = ['Ip [MA]', 'Rx [m]', '|Zx| [m]', 'dRsep [m]', 'In.Mid. [m]', 'Out.Mid. [m]']
+
+# rt_control_v2 policies (weights/rl/rt_control except bp_q95): inputs set directly, βp/q95/li targets
+v2_low_action  = [0.35, 0.0, 0.0, 0.0, 1.65, 0.15, 0.5, 1.265, 2.18]
+v2_high_action = [0.75, 1.75, 1.75, 1.5, 1.95, 0.5, 0.85, 1.36, 2.29]
+v2_low_target  = [1.1, 3.8, 0.84]
+v2_high_target = [2.1, 6.2, 1.06]
+v2_wide_low_action  = [0.3, 0.0, 0.0, 0.0, 1.6, 0.15, 0.5, 1.265, 2.14]
+v2_wide_high_action = [0.8, 1.75, 1.75, 1.5, 1.95, 0.5, 0.85, 1.36, 2.3]
+v2_wide_low_target  = [0.8, 4.0, 0.80]
+v2_wide_high_target = [2.1, 7.0, 1.05]
+v2_target_params = ['βp', 'q95', 'li']
+v2_action_idx = [0, 3, 4, 5, 12, 13, 14, 10, 11] # Ip, Pnb1a, Pnb1b, Pnb1c, Elon., Up.Tri., Lo.Tri., In.Mid., Out.Mid.
+v2_action_params = [input_params[i] for i in v2_action_idx]
+
+# Policy variants of weights/rl/rt_control: path, GUI family, lookback and wide bounds
+rt_policy_variants = {
+    'bp_q95': ('bp_q95/best_model.zip', 'v3', 3, False),
+    '3frame': ('3frame/best_model1.zip', 'v2', 3, False),
+    '3frame_v220505': ('3frame_v220505/best_model.zip', 'v2', 3, True),
+    '3frame_wide': ('3frame_wide/best_model0.zip', 'v2', 3, True),
+    'single': ('single/best_model.zip', 'v2', 1, False),
+    'single_wide': ('single_wide/best_model.zip', 'v2', 1, True),
+}
+
+# Surrogate variants of weights/: class, directory and normalization of each version
+surrogate_variants = {
+    'kstar_lstm': {
+        'v220505': (kstar_v220505, 'lstm/v220505/', {}),
+        'efitrt': (kstar_v220505, 'lstm/efitrt/', {'ymean': [1.4647386, 5.3598804, 1.7585343, 1.0463847],
+                                                   'ystd': [0.71713614, 1.4992219, 0.718258, 0.21737464]}),
+    },
+    'bpw_nn': {
+        'v220505': (tf_dense_model, 'bpw/v220505/', {'ymean': [1.3630552066021155, 251779.19861710534],
+                                                     'ystd': [0.6252123013157276, 123097.77805034176]}),
+        'v0': (bpw_nn, 'bpw/', {}),
+    },
+    'x2k': {
+        'v0': (tf_dense_model, 'x2k/', {'ymean': [1.7393100417827367, 0.42079321602827713, 0.7240443011421216],
+                                        'ystd': [0.07815663915772043, 0.16808615658503132, 0.16303934837604867]}),
+    },
+}
+
+# ai_control_v1
+ai_input_mins = [0.3, 1.5, 0.2, 0.0, 0.0, 0.0, 0.0, 0.0, -10, -10, 1.265, 2.18, 1.6, 0.1, 0.5]
+ai_input_maxs = [0.8, 2.7, 0.6, 1.75, 1.75, 1.5, 0.8, 0.8, 10, 10, 1.36, 2.29, 2.0, 0.5, 0.9]
+ai_input_init = [0.5, 1.8, 0.3, 1.5, 1.5, 0.5, 0.0, 0.0, 0.0, 0.0, 1.32, 2.22, 1.7, 0.3, 0.75]
+ai_interval = 20
+ai_low_state  = [0.35, 1.65, 0.15, 0.5, 1.265, 2.18, 0.0, 0.0, 0.0, 1.1, 3.8, 0.84, 1.1, 3.8, 0.84]
+ai_high_state = [0.75, 1.9, 0.5, 0.85, 1.36, 2.29, 1.75, 1.75, 1.1, 2.1, 6.2, 1.06, 2.1, 6.2, 1.06]
+ai_low_action  = [0.35, 1.65, 0.15, 0.5, 1.265, 2.18, 0.0, 0.0, 0.0]
+ai_high_action = [0.75, 1.9, 0.5, 0.85, 1.36, 2.29, 1.75, 1.75, 1.1]
+ai_low_target  = [1.1, 3.8, 0.84]
+ai_high_target = [2.1, 6.2, 1.06]
+ai_target_params = ['βp', 'q95', 'li']
+ai_action_idx = [0, 12, 13, 14, 10, 11, 3, 4, 5] # Ip, Elon., Up.Tri., Lo.Tri., In.Mid., Out.Mid., Pnb1a, Pnb1b, Pnb1c
+
+def quantize(x, decimals=3):
+    # Slider resolution, as the f2i/i2f round trip of the GUIs
+    return np.trunc(np.asarray(x, dtype=float) * 10**decimals) / 10**decimals
+
+def slider_values(x, idx, mins, maxs):
+    # Columns idx of the input panel as the sliders take them: clamped to their range, then quantized
+    return quantize(np.clip(x, np.take(mins, idx), np.take(maxs, idx)))
+
+def sample_inputs(n, init, mins, maxs, idx, spread, rng):
+    # Operating points around init, idx columns perturbed by spread of their range
+    u = np.tile(init, (n, 1))
+    width = np.subtract(maxs, mins)[idx]
+    u[:, idx] += spread * width * rng.uniform(-1, 1, size=(n, len(idx)))
+    return quantize(np.clip(u, mins, maxs))
+
+def rt_state_bounds(lookback=rt_lookback):
+    low_state = (rt_low_action + rt_low_target) * lookback + rt_low_target
+    high_state = (rt_high_action + rt_high_target) * lookback + rt_high_target
+    return low_state, high_state
+
+def rt_control_models(base_path, n_models=10, efitrt=False, load=None, load_ensemble=None, distilled=False):
+    # Surrogates of rt_control_v3; load/load_ensemble default to in-process construction
+    load = load or (lambda cls, **kwargs: cls(**kwargs))
+    load_ensemble = load_ensemble or load
+    if distilled: # Students of distill.py in place of the LSTM, bpw and x2k ensembles
+        student = lambda cls, model_path, n_models, **kwargs: load_ensemble(cls, model_path=model_path + 'student/', n_models=1, **kwargs)
+        return rt_control_models(base_path, n_models, efitrt, load, student)
+    variants = {'kstar_lstm': 'efitrt' if efitrt else 'v220505', 'bpw_nn': 'v220505', 'x2k': 'v0'}
+    models = {}
+    for kind, variant in variants.items():
+        cls, path, kwargs = surrogate_variants[kind][variant]
+        models[kind] = load_ensemble(cls, model_path=base_path + '/weights/' + path, n_models=n_models, **kwargs)
+    models['kstar_nn'] = load(kstar_nn, model_path=base_path + '/weights/nn/', n_models=1)
+    return models
+
+def rt_policy(model_path, lookback=rt_lookback, bavg=0.0, load=None):
+    load = load or (lambda cls, **kwargs: cls(**kwargs))
+    low_state, high_state = rt_state_bounds(lookback)
+    return load(SB2_model,
+        model_path = model_path,
+        low_state = low_state,
+        high_state = high_state,
+        low_action = rt_low_action,
+        high_action = rt_high_action,
+        activation='relu',
+        last_actv='tanh',
+        norm=True,
+        bavg=bavg
+    )
+
+def v2_bounds(wide=False):
+    if wide:
+        return v2_wide_low_action, v2_wide_high_action, v2_wide_low_target, v2_wide_high_target
+    return v2_low_action, v2_high_action, v2_low_target, v2_high_target
+
+def v2_policy(model_path, lookback=3, wide=False, bavg=0.0, load=None):
+    load = load or (lambda cls, **kwargs: cls(**kwargs))
+    low_action, high_action, low_target, high_target = v2_bounds(wide)
+    return load(SB2_model,
+        model_path = model_path,
+        low_state = (low_action + low_target) * lookback + low_target,
+        high_state = (high_action + high_target) * lookback + high_target,
+        low_action = low_action,
+        high_action = high_action,
+        activation='relu',
+        last_actv='tanh',
+        norm=True,
+        bavg=bavg
+    )
+
+def variant_plasma(variant, models, base_path, bavg=0.0, load=None, **kwargs):
+    # Batched plasma of an rt_control policy variant with its policy attached
+    path, family, lookback, wide = rt_policy_variants[variant]
+    model_path = base_path + '/weights/rl/rt_control/' + path
+    if family == 'v3':
+        return rt_plasma(models['kstar_lstm'], models['bpw_nn'], models['kstar_nn'], models['x2k'],
+                         policy=rt_policy(model_path, lookback, bavg, load), lookback=lookback, **kwargs)
+    return v2_plasma(models['kstar_lstm'], models['bpw_nn'], models['kstar_nn'],
+                     policy=v2_policy(model_path, lookback, wide, bavg, load), lookback=lookback, wide=wide, **kwargs)
+
+def ai_control_models(base_path, n_models=10, load=None):
+    load = load or (lambda cls, **kwargs: cls(**kwargs))
+    return {
+        'kstar_lstm': load(kstar_lstm, model_path=base_path + '/weights/lstm/', n_models=n_models),
+        'kstar_nn': load(kstar_nn, model_path=base_path + '/weights/nn/', n_models=1),
+        'bpw_nn': load(bpw_nn, model_path=base_path + '/weights/bpw/', n_models=n_models),
+    }
+
+def ai_designer(model_path, bavg=0.0, load=None):
+    load = load or (lambda cls, **kwargs: cls(**kwargs))
+    return load(SB2_model,
+        model_path = model_path,
+        low_state = ai_low_state,
+        high_state = ai_high_state,
+        low_action = ai_low_action,
+        high_action = ai_high_action,
+        activation='relu',
+        last_actv='tanh',
+        norm=True,
+        bavg=bavg
+    )
+
+def linear_ramp(current, action, interval):
+    # Control phase of ai_control_v1: linear ramp to the action, step function for NBIs
+    ramp = np.zeros(np.shape(current)[:-1] + (interval, np.shape(current)[-1]))
+    current = np.array(current, dtype=float)
+    daction = (action - current) / interval
+    for i in range(interval):
+        current = current + daction
+        current[..., 6:] = action[..., 6:]
+        ramp[..., i, :] = current
+    return ramp
+
+class batched_plasma():
+    def __init__(self, kstar_lstm, bpw_nn, kstar_nn, seq_len=10, v220505=True, year=year_in, trace=False):
+        self.kstar_lstm, self.bpw_nn, self.kstar_nn = kstar_lstm, bpw_nn, kstar_nn
+        self.seq_len, self.v220505, self.year = seq_len, v220505, year
+        self.trace = trace
+
+    def reset(self, u, targets):
+        self.u = np.array(u, dtype=float)
+        self.targets = np.array(targets, dtype=float)
+        self.n, self.time, self.traces = len(self.u), 0., {}
+        self.predict0d(steady=True)
+
+    def features(self, u):
+        return v220505_features(u, self.year) if self.v220505 else nn_features(u, self.year)
+
+    def predict0d(self, steady=False):
+        n = len(output_params0)
+        if steady:
+            y = self.kstar_nn.predict_batch(nn_features(self.u, self.year))
+            self.x = np.repeat(lstm_features(self.u, y, self.v220505, self.year)[:, None], self.seq_len, axis=1)
+        else:
+            self.x[:, :-1, n:] = self.x[:, 1:, n:]
+            self.x[:, -1, n:] = self.features(self.u)
+            y = self.kstar_lstm.predict_batch(self.x)
+            self.x[:, :-1, :n] = self.x[:, 1:, :n]
+            self.x[:, -1, :n] = y
+        self.outputs = dict(zip(output_params0, y.T))
+        self.outputs.update(zip(output_params1, self.bpw_nn.predict_batch(bpw_features(self.u, y[:, 0])).T))
+        self.outputs['h89'], self.outputs['h98'] = h_factors(self.u, self.outputs['wmhd'])
+        if not steady:
+            self.time += dt
+        if self.trace:
+            self.record()
+
+    def state(self):
+        return {'x': self.x, 'u': self.u, 'outputs': self.outputs, 'targets': self.targets, 'time': self.time}
+
+    def set_state(self, state, repeat=1):
+        # Continue from a snapshot (of this simulator or of a GUI), each plasma repeated for rollouts
+        rep = lambda v: np.repeat(np.atleast_1d(np.asarray(v, dtype=float)), repeat, axis=0)
+        self.x = rep(np.asarray(state['x'], dtype=float).reshape((-1,) + np.shape(state['x'])[-2:]))
+        self.u = rep(np.atleast_2d(state['u']))
+        self.targets = rep(np.atleast_2d(state['targets']))
+        self.outputs = {k: rep(v) for k, v in state['outputs'].items()}
+        self.n, self.time, self.traces = len(self.u), state['time'], {}
+
+    def output(self, params=output_params2):
+        return np.stack([self.outputs[p] for p in params], axis=1)
+
+    def record(self):
+        row = {'time': np.full(self.n, self.time), 'inputs': self.u.copy(), 'outputs': self.output(), 'targets': self.targets.copy()}
+        for k, v in row.items():
+            self.traces.setdefault(k, []).append(v)
+
+    def trajectory(self):
+        # (ticks, batch, ...) arrays of everything recorded since reset
+        return {k: np.array(v) for k, v in self.traces.items()}
+
+class rt_plasma(batched_plasma):
+    # rt_control_v3: RL feedback on lookback histories, X-point actions converted to shape by x2k
+    target_params, action_params, controlled_inputs = rt_target_params, rt_action_params, [0, 10, 11, 12, 13, 14]
+    low_action, high_action, low_target, high_target = rt_low_action, rt_high_action, rt_low_target, rt_high_target
+    def __init__(self, kstar_lstm, bpw_nn, kstar_nn, x2k, policy=None, x2rz=None, lookback=rt_lookback, **kwargs):
+        super().__init__(kstar_lstm, bpw_nn, kstar_nn, **kwargs)
+        self.x2k, self.policy, self.x2rz = x2k, policy, x2rz
+        self.lookback = lookback
+
+    def reset(self, u, targets, action=None):
+        self.reset_control(len(u), action)
+        super().reset(u, targets)
+
+    def reset_control(self, n, action=None):
+        self.action = np.tile(rt_low_action, (n, 1)) if action is None else np.array(action, dtype=float)
+        target_init = np.mean([rt_low_target, rt_high_target], axis=0)
+        self.histories = np.tile(np.concatenate([self.action, np.tile(target_init, (n, 1))], axis=1)[:, None], (1, self.lookback, 1))
+
+    def predict0d(self, steady=False):
+        super().predict0d(steady)
+        self.update_histories()
+
+    def update_histories(self):
+        self.histories[:, :-1] = self.histories[:, 1:]
+        self.histories[:, -1] = np.concatenate([self.action, self.output(['βp', 'q95'])], axis=1)
+
+    def state(self):
+        return dict(super().state(), action=self.action, histories=self.histories)
+
+    def set_state(self, state, repeat=1):
+        super().set_state(state, repeat)
+        self.action = np.repeat(np.atleast_2d(state['action']).astype(float), repeat, axis=0)
+        histories = np.asarray(state['histories'], dtype=float)
+        self.histories = np.repeat(histories.reshape((-1,) + histories.shape[-2:]), repeat, axis=0)
+
+    def observation(self):
+        return np.concatenate([self.histories.reshape(self.n, -1), self.targets], axis=1)
+
+    def control(self, action=None):
+        if action is None:
+            action = self.policy.predict_batch(self.observation(), yold=self.action)
+        self.action = np.array(np.broadcast_to(action, self.action.shape), dtype=float)
+        k, du, dl = self.x2k.predict_batch(x2k_features(self.action, self.u[:, 1], self.outputs['βp'])).T
+        idx = [0, 10, 11, 12, 13, 14]
+        self.u[:, idx] = slider_values(np.array([self.action[:, 0], self.action[:, 4], self.action[:, 5], k, du, dl]).T, idx, rt_input_mins, rt_input_maxs)
+
+    def step(self, action=None):
+        self.control(action)
+        self.predict0d()
+
+    def boundary(self):
+        return self.x2rz.predict_batch(x2rz_features(self.u, self.action, self.outputs['βp']))
+
+    def record(self):
+        super().record()
+        self.traces.setdefault('actions', []).append(self.action.copy())
+
+class v2_plasma(batched_plasma):
+    # rt_control_v2: RL feedback on lookback histories, actions written to the input panel directly
+    target_params, action_params, controlled_inputs = v2_target_params, v2_action_params, v2_action_idx
+
+    def __init__(self, kstar_lstm, bpw_nn, kstar_nn, policy=None, lookback=3, wide=False, **kwargs):
+        super().__init__(kstar_lstm, bpw_nn, kstar_nn, **kwargs)
+        self.policy, self.lookback = policy, lookback
+        self.low_action, self.high_action, self.low_target, self.high_target = v2_bounds(wide)
+
+    def reset(self, u, targets, action=None):
+        self.reset_control(len(u), action)
+        super().reset(u, targets)
+
+    def reset_control(self, n, action=None):
+        self.action = np.tile(self.low_action, (n, 1)) if action is None else np.array(action, dtype=float)
+        target_init = np.mean([self.low_target, self.high_target], axis=0)
+        self.histories = np.tile(np.concatenate([self.action, np.tile(target_init, (n, 1))], axis=1)[:, None], (1, self.lookback, 1))
+
+    def predict0d(self, steady=False):
+        super().predict0d(steady)
+        self.update_histories()
+
+    def update_histories(self):
+        self.histories[:, :-1] = self.histories[:, 1:]
+        self.histories[:, -1] = np.concatenate([self.action, self.output(self.target_params)], axis=1)
+
+    def state(self):
+        return dict(super().state(), action=self.action, histories=self.histories)
+
+    def set_state(self, state, repeat=1):
+        super().set_state(state, repeat)
+        self.action = np.repeat(np.atleast_2d(state['action']).astype(float), repeat, axis=0)
+        histories = np.asarray(state['histories'], dtype=float)
+        self.histories = np.repeat(histories.reshape((-1,) + histories.shape[-2:]), repeat, axis=0)
+
+    def observation(self):
+        return np.concatenate([self.histories.reshape(self.n, -1), self.targets], axis=1)
+
+    def control(self, action=None):
+        if action is None:
+            action = self.policy.predict_batch(self.observation(), yold=self.action)
+        self.action = np.array(np.broadcast_to(action, self.action.shape), dtype=float)
+        self.u[:, v2_action_idx] = slider_values(self.action, v2_action_idx, ai_input_mins, ai_input_maxs) # rt_control_v2 has the ai_control sliders
+
+    def step(self, action=None):
+        self.control(action)
+        self.predict0d()
+
+    def record(self):
+        super().record()
+        self.traces.setdefault('actions', []).append(self.action.copy())
+
+class arena_plasma(batched_plasma):
+    # Several controllers head to head: every lane is an rt_plasma or v2_plasma with its own policy and
+    # plasmas, all on the same surrogates. Each tick the lanes write their inputs into slices of one batch,
+    # which then advances with a single call per surrogate.
+    def __init__(self, lanes, **kwargs):
+        if any(l.kstar_lstm is not lanes[0].kstar_lstm or l.bpw_nn is not lanes[0].bpw_nn or l.kstar_nn is not lanes[0].kstar_nn for l in lanes):
+            raise ValueError('The lanes of an arena must share their surrogates')
+        super().__init__(lanes[0].kstar_lstm, lanes[0].bpw_nn, lanes[0].kstar_nn, **kwargs)
+        self.lanes = lanes
+
+    def reset(self, inputs, targets, actions=None):
+        # inputs, targets, actions: one (n_lane, ...) array per lane
+        actions = actions or [None] * len(self.lanes)
+        sizes = np.cumsum([0] + [len(u) for u in inputs])
+        self.slices = [slice(a, b) for a, b in zip(sizes[:-1], sizes[1:])]
+        for lane, u, t, a in zip(self.lanes, inputs, targets, actions):
+            lane.reset_control(len(u), a)
+            lane.targets, lane.traces = np.array(t, dtype=float), {}
+        super().reset(np.concatenate(inputs), np.zeros((sizes[-1], 0)))
+
+    def predict0d(self, steady=False):
+        # Lane arrays are views into the batch, so that their control writes straight into it
+        super().predict0d(steady)
+        for lane, s in zip(self.lanes, self.slices):
+            lane.u, lane.x, lane.n, lane.time = self.u[s], self.x[s], s.stop - s.start, self.time
+            lane.outputs = {k: v[s] for k, v in self.outputs.items()}
+            lane.update_histories()
+
+    def step(self, actions=None):
+        for lane, action in zip(self.lanes, actions or [None] * len(self.lanes)):
+            lane.control(action)
+        self.predict0d()
+
+class designer_plasma(batched_plasma):
+    # ai_control_v1: one designer action per interval, ramped over the control phase then relaxed
+    def __init__(self, kstar_lstm, bpw_nn, kstar_nn, designer=None, k2rz=None, interval=ai_interval, **kwargs):
+        kwargs.setdefault('v220505', False)
+        super().__init__(kstar_lstm, bpw_nn, kstar_nn, **kwargs)
+        self.designer, self.k2rz = designer, k2rz
+        self.interval = interval
+
+    def observation(self):
+        return np.concatenate([self.u[:, ai_action_idx], self.output(['βp', 'q95', 'li']), self.targets], axis=1)
+
+    def design(self, action=None, relax=True):
+        if action is None:
+            action = self.designer.predict_batch(self.observation())
+        action = np.array(action, dtype=float)
+        self.control_phase(linear_ramp(self.u[:, ai_action_idx], action, self.interval))
+        if relax:
+            self.relaxation_phase()
+        return action
+
+    def control_phase(self, ramp):
+        # ramp (batch, ticks, 9): designer actuators at every control tick
+        for i in range(ramp.shape[1]):
+            self.u[:, ai_action_idx] = slider_values(ramp[:, i], ai_action_idx, ai_input_mins, ai_input_maxs)
+            self.predict0d()
+
+    def relaxation_phase(self, ticks=None):
+        for i in range(ticks or self.interval):
+            self.predict0d()
+
+    def boundary(self):
+        return self.k2rz.predict_batch(k2rz_features(self.u, self.outputs['βp']))
@@ -0,0 +1,95 @@
+import json, os, socket, sqlite3, time, traceback, itertools
+import multiprocessing as mp
+
+# Parameter sweeps over a task queue in one SQLite file. Every grid point is a
+# task row (pending -> running -> done/failed) whose result is stored with it,
+# so finished work survives interruptions and a rerun picks up the rest. Any
+# number of processes, here or on other hosts sharing the file, pull tasks.
+
+def expand_grid(grid):
+    return [dict(zip(grid, values)) for values in itertools.product(*grid.values())]
+
+def task_key(params):
+    return json.dumps(params, sort_keys=True)
+
+class task_queue():
+    def __init__(self, path, timeout=60.):
+        self.path = path
+        self.db = sqlite3.connect(path, timeout=timeout, isolation_level=None) # Transactions are explicit
+        self.db.execute('CREATE TABLE IF NOT EXISTS tasks (id INTEGER PRIMARY KEY, key TEXT UNIQUE, status TEXT, '
+                        'worker TEXT, started REAL, finished REAL, result TEXT)')
+
+    def add(self, tasks):
+        # Already known tasks keep their status and result
+        self.db.executemany("INSERT OR IGNORE INTO tasks (key, status) VALUES (?, 'pending')", [(task_key(t),) for t in tasks])
+
+    def claim(self, worker):
+        self.db.execute('BEGIN IMMEDIATE')
+        try:
+            row = self.db.execute("SELECT id, key FROM tasks WHERE status = 'pending' ORDER BY id LIMIT 1").fetchone()
+            if row is not None:
+                self.db.execute("UPDATE tasks SET status = 'running', worker = ?, started = ? WHERE id = ?", (worker, time.time(), row[0]))
+        finally:
+            self.db.execute('COMMIT')
+        return None if row is None else (row[0], json.loads(row[1]))
+
+    def finish(self, task_id, result, status='done'):
+        self.db.execute('UPDATE tasks SET status = ?, finished = ?, result = ? WHERE id = ?', (status, time.time(), json.dumps(result), task_id))
+
+    def requeue(self, stale_after=None, failed=False):
+        # Running tasks older than stale_after [s] (their worker died) and optionally failed ones go back to pending
+        if stale_after is not None:
+            self.db.execute("UPDATE tasks SET status = 'pending' WHERE status = 'running' AND started < ?", (time.time() - stale_after,))
+        if failed:
+            self.db.execute("UPDATE tasks SET status = 'pending' WHERE status = 'failed'")
+
+    def counts(self):
+        return dict(self.db.execute('SELECT status, COUNT(*) FROM tasks GROUP BY status').fetchall())
+
+    def results(self):
+        return [(json.loads(k), json.loads(r)) for k, r in self.db.execute("SELECT key, result FROM tasks WHERE status = 'done' ORDER BY id")]
+
+    def close(self):
+        self.db.close()
+
+def worker(path, run_task, name=None):
+    # Runs tasks until none is pending; run_task(params) returns a JSON-serializable list of result rows
+    name = name or f'{socket.gethostname()}:{os.getpid()}'
+    queue = task_queue(path)
+    n = 0
+    while True:
+        task = queue.claim(name)
+        if task is None:
+            break
+        task_id, params = task
+        try:
+            queue.finish(task_id, run_task(params))
+        except Exception:
+            queue.finish(task_id, {'error': traceback.format_exc()}, status='failed')
+            print(f'{name}: task {params} failed')
+        n += 1
+    queue.close()
+    return n
+
+def run_pool(path, run_task, n_workers=1):
+    # Local worker processes on the queue file
+    if n_workers <= 1:
+        return worker(path, run_task)
+    ctx = mp.get_context('spawn') # TF state does not survive fork
+    processes = [ctx.Process(target=worker, args=(path, run_task)) for _ in range(n_workers)]
+    for p in processes:
+        p.start()
+    for p in processes:
+        p.join()
+
+def aggregate(path, out_path):
+    # One CSV row per result row, prefixed by the task parameters
+    queue = task_queue(path)
+    rows = [dict(params, **row) for params, result in queue.results() for row in result]
+    queue.close()
+    columns = list(dict.fromkeys(k for row in rows for k in row))
+    with open(out_path, 'w') as f:
+        f.write(','.join(columns) + '\n')
+        for row in rows:
+            f.write(','.join('' if row.get(k) is None else str(row[k]) for k in columns) + '\n')
+    return rows
@@ -0,0 +1,47 @@
+#!/usr/bin/env python
+
+import os, sys
+import numpy as np
+from common.simulator import *
+from common.distill import envelope_samples, teacher_targets, train_student, save_student, compare
+
+# Setting
+base_path = os.path.abspath(os.path.dirname(sys.argv[0]))
+max_models = 10
+efitrt = False
+n_envs = 256 # Closed-loop rollouts sampling the operating envelope
+n_ticks = 200
+epochs = 50
+distill_spread = True # Also a second student of the member spread
+student_dir = 'student/'
+test_fraction = 0.1
+seed = 0
+
+# Path of weights
+model_paths = {
+    'kstar_lstm': base_path + ('/weights/lstm/efitrt/' if efitrt else '/weights/lstm/v220505/'),
+    'bpw_nn': base_path + '/weights/bpw/v220505/',
+    'x2k': base_path + '/weights/x2k/',
+}
+
+if __name__ == '__main__':
+    models = rt_control_models(base_path, n_models=max_models, efitrt=efitrt)
+    samples = envelope_samples(models, n_envs=n_envs, n_ticks=n_ticks, seed=seed)
+    rng = np.random.default_rng(seed)
+    for name, path in model_paths.items():
+        teacher, x = models[name], samples[name]
+        idx = rng.permutation(len(x))
+        n_test = int(test_fraction * len(x))
+        x_train, x_test = x[idx[n_test:]], x[idx[:n_test]]
+        mean, std = teacher_targets(teacher, x_train)
+        print(f'{name}: {len(x_train)} training samples from {len(teacher.models)} members')
+
+        save_student(teacher, train_student(teacher, x_train, mean), path + student_dir)
+        student = type(teacher)(model_path=path + student_dir, n_models=1, ymean=teacher.ymean, ystd=teacher.ystd)
+        if distill_spread:
+            save_student(teacher, train_student(teacher, x_train, std), path + student_dir[:-1] + '_std/')
+
+        result = compare(teacher, student, x_test)
+        print(f'{name}: rmse {np.array2string(result["rmse"], precision=4)}, max {np.array2string(result["max"], precision=4)}')
+        print(f'{name}: latency {1e3 * result["teacher_latency"]:.2f} ms (ensemble) -> {1e3 * result["student_latency"]:.2f} ms (student)')
+        print(f'Saved to {path + student_dir}')
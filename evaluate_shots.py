@@ -0,0 +1,36 @@
+#!/usr/bin/env python
+
+import os, sys, glob, time
+import numpy as np
+from common.model_structure import *
+from common.shots import evaluate_shots, write_results
+from common.replay import lstm_params
+
+# Setting
+base_path = os.path.abspath(os.path.dirname(sys.argv[0]))
+shot_path = base_path + '/shots/'
+out_path = base_path + '/shots/evaluation/'
+max_models = 10
+seq_len = 10
+dt = 0.1
+batch_size = 8192
+v220505 = True # False evaluates the 21-feature kstar_lstm of ai_control_v1
+
+# Path of weights
+lstm_model_path = base_path + '/weights/lstm/v220505/' if v220505 else base_path + '/weights/lstm/'
+
+if __name__ == '__main__':
+    # Usage: python evaluate_shots.py [shot files...] (default: every csv/npz in shots/)
+    paths = sys.argv[1:] or sorted(glob.glob(shot_path + '*.csv') + glob.glob(shot_path + '*.npz'))
+    if v220505:
+        model = kstar_v220505(model_path=lstm_model_path, n_models=max_models, length=seq_len)
+    else:
+        model = kstar_lstm(model_path=lstm_model_path, n_models=max_models)
+    t0 = time.time()
+    results = evaluate_shots(model, paths, seq_len=seq_len, v220505=v220505, dt=dt, batch_size=batch_size)
+    print(f'{len(results)} shots in {time.time() - t0:.1f} s')
+    write_results(results, out_path)
+    for p in lstm_params:
+        rmse = [r['errors'][p]['rmse'] for r in results.values()]
+        print(f'{p}: median RMSE {np.median(rmse):.4g}, worst {np.max(rmse):.4g}')
+    print(f'Results saved to {out_path}')
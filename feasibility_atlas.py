@@ -0,0 +1,92 @@
+#!/usr/bin/env python
+
+import os, sys, time
+import numpy as np
+from common.simulator import *
+from common.atlas import target_grid, reached_error, save_atlas
+from common.cache import result_cache, weights_checksum, cache_key
+
+# Setting
+base_path = os.path.abspath(os.path.dirname(sys.argv[0]))
+atlas_path = base_path + '/atlas/'
+gui = 'rt_control_v3' # or 'ai_control_v1'
+max_models = 10
+n_grid = 11 # Grid points per target
+n_samples = 4 # Monte Carlo operating points per grid point
+spread = 0.1 # Perturbation of the uncontrolled inputs (Bt, GW.frac., heating) as a fraction of their range
+n_ticks = 100 # rt_control_v3: closed-loop ticks of 0.1 s
+n_designs = 3 # ai_control_v1: designer intervals (control + relaxation phases)
+interval = 20
+n_avg = 10 # Ticks averaged at the end for the reached values
+tolerance = 0.05 # Feasible if the reached error is below this fraction of the target range
+max_batch = 2048
+seed = 0
+cache_path = base_path + '/cache/' # Batches of unchanged (weights, settings, targets) are reused; None to disable
+cache_bytes = 2**30
+
+# Path of weights
+rl_model_path = base_path + '/weights/rl/rt_control/bp_q95/best_model.zip'
+rl_1s_model_path = base_path + '/weights/rl/nbi_control/interval_1s/best_model0.zip'
+rl_2s_model_path = base_path + '/weights/rl/nbi_control/interval_2s/best_model0.zip'
+weight_paths = {
+    'rt_control_v3': [base_path + '/weights/' + p for p in ['lstm/v220505/', 'nn/', 'bpw/v220505/', 'x2k/']] + [rl_model_path],
+    'ai_control_v1': [base_path + '/weights/' + p for p in ['lstm/', 'nn/', 'bpw/']] + [rl_1s_model_path if interval < 15 else rl_2s_model_path],
+}
+
+def run_rt_control(sim, targets, rng):
+    sim.reset(sample_inputs(len(targets), rt_input_init, rt_input_mins, rt_input_maxs, [1, 2, 3, 4, 5, 6, 7], spread, rng), targets)
+    outputs = []
+    for _ in range(n_ticks):
+        sim.step()
+        outputs.append(sim.output(rt_target_params))
+    return reached_error(np.array(outputs), targets, rt_low_target, rt_high_target, n_avg)
+
+def run_ai_control(sim, targets, rng):
+    sim.reset(sample_inputs(len(targets), ai_input_init, ai_input_mins, ai_input_maxs, [1, 2, 6, 7], spread, rng), targets)
+    outputs = []
+    for _ in range(n_designs):
+        sim.design()
+        outputs.append(sim.output(ai_target_params))
+    return reached_error(np.array(outputs), targets, ai_low_target, ai_high_target, 1)
+
+def make_sim():
+    if gui == 'rt_control_v3':
+        models = rt_control_models(base_path, n_models=max_models)
+        return rt_plasma(models['kstar_lstm'], models['bpw_nn'], models['kstar_nn'], models['x2k'], policy=rt_policy(rl_model_path))
+    models = ai_control_models(base_path, n_models=max_models)
+    designer = ai_designer(rl_1s_model_path if interval < 15 else rl_2s_model_path)
+    return designer_plasma(models['kstar_lstm'], models['bpw_nn'], models['kstar_nn'], designer=designer, interval=interval)
+
+if __name__ == '__main__':
+    if gui == 'rt_control_v3':
+        low, high, target_params, run = rt_low_target, rt_high_target, rt_target_params, run_rt_control
+    else:
+        low, high, target_params, run = ai_low_target, ai_high_target, ai_target_params, run_ai_control
+    cache = None if cache_path is None else result_cache(cache_path, cache_bytes)
+    config = [weights_checksum(*weight_paths[gui]), gui, max_models, n_samples, spread, n_ticks, n_designs, interval, n_avg, seed]
+
+    # Every grid point is repeated n_samples times and all runs advance in lockstep; the models load on the first cache miss
+    axes, grid = target_grid(low, high, n_grid)
+    targets = np.repeat(grid, n_samples, axis=0)
+    reached, error = np.zeros_like(targets), np.zeros(len(targets))
+    sim = None
+    t0 = time.time()
+    for i in range(0, len(targets), max_batch):
+        key = cache_key(config, targets[i:i + max_batch].tolist())
+        entry = None if cache is None else cache.get(key)
+        if entry is None:
+            sim = sim or make_sim()
+            entry = dict(zip(['reached', 'error'], run(sim, targets[i:i + max_batch], np.random.default_rng([seed, i]))))
+            if cache is not None:
+                cache.put(key, **entry)
+        reached[i:i + max_batch], error[i:i + max_batch] = entry['reached'], entry['error']
+        print(f'{min(i + max_batch, len(targets))}/{len(targets)} runs, {time.time() - t0:.1f} s')
+
+    shape = [n_grid] * len(axes)
+    success = np.mean((error < tolerance).reshape(-1, n_samples), axis=1).reshape(shape)
+    error = np.mean(error.reshape(-1, n_samples), axis=1).reshape(shape)
+    reached = np.mean(reached.reshape(-1, n_samples, len(axes)), axis=1).reshape(shape + [len(axes)])
+    os.makedirs(atlas_path, exist_ok=True)
+    save_atlas(atlas_path + gui + '.npz', axes, target_params, error, success, reached, tolerance)
+    print(f'Feasible fraction of the target box: {np.mean(success >= 0.5):.2f}')
+    print(f'Atlas saved to {atlas_path + gui}.npz')
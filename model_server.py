@@ -0,0 +1,41 @@
+#!/usr/bin/env python
+
+import os, sys, glob
+from common.model_structure import *
+from common.server import model_server, model_spec
+
+# Setting
+base_path = os.path.abspath(os.path.dirname(sys.argv[0]))
+server_address = '/tmp/kstar_model_server.sock'
+batch_window = 0.002
+max_models = 10
+max_shape_models = 4
+
+# Models used by ai_control_v0/v1 and rt_control_v2/v3, loaded before the first client connects
+preload = [
+    (kstar_nn, dict(model_path=base_path + '/weights/nn/', n_models=max_models)),
+    (kstar_lstm, dict(model_path=base_path + '/weights/lstm/', n_models=max_models)),
+    (kstar_v220505, dict(model_path=base_path + '/weights/lstm/v220505/', n_models=max_models)),
+    (kstar_v220505, dict(model_path=base_path + '/weights/lstm/efitrt/', n_models=max_models)),
+    (bpw_nn, dict(model_path=base_path + '/weights/bpw/', n_models=max_models)),
+    (tf_dense_model, dict(model_path=base_path + '/weights/bpw/v220505/', n_models=max_models)),
+    (tf_dense_model, dict(model_path=base_path + '/weights/x2k/', n_models=max_models)),
+    (k2rz, dict(model_path=base_path + '/weights/k2rz/', n_models=max_shape_models)),
+    (x2rz, dict(model_path=base_path + '/weights/x2rz/', n_models=max_shape_models)),
+    (SB2_model, dict(model_path=base_path + '/weights/rl/nf2022/best_model.zip')),
+    (SB2_model, dict(model_path=base_path + '/weights/rl/nbi_control/interval_1s/best_model0.zip')),
+    (SB2_model, dict(model_path=base_path + '/weights/rl/nbi_control/interval_2s/best_model0.zip')),
+    (SB2_model, dict(model_path=base_path + '/weights/rl/k2x/TD3_test_model_1.zip')),
+    (SB2_model, dict(model_path=base_path + '/weights/rl/rt_control/3frame_v220505/best_model.zip')),
+    (SB2_model, dict(model_path=base_path + '/weights/rl/rt_control/bp_q95/best_model.zip')),
+]
+
+if __name__ == '__main__':
+    server = model_server(server_address, batch_window=batch_window)
+    for model_class, kwargs in preload:
+        path = kwargs['model_path']
+        if not (os.path.isfile(path) or glob.glob(path + 'best_model0*')): # Weights not shipped, e.g. the plain weights/lstm/
+            print(f'Skipped {model_class.__name__}: no weights in {path}')
+            continue
+        server.load(model_class.__name__, model_spec(model_class, kwargs), kwargs.get('n_models', 1))
+    server.serve_forever()
@@ -0,0 +1,47 @@
+#!/usr/bin/env python
+
+import os, sys, time
+import numpy as np
+from common.simulator import *
+from common.jacobian import jacobian_model
+from common.planner import plan_params, arrival_schedule, trajectory_optimizer
+
+# Setting
+base_path = os.path.abspath(os.path.dirname(sys.argv[0]))
+out_path = base_path + '/plans/'
+max_models = 10
+operating_point = rt_input_init # Input panel values (input_params order)
+targets = [1.6, 5.0, 0.95] # βp, q95, li
+n_ticks = 40 # Planning horizon of 0.1 s ticks
+arrival = 20 # Tick from which the targets are tracked
+n_starts = 4 # Held action plus random initial waveforms
+smooth = 0.01 # Action-change penalty, relative to the bounds
+max_iters = 300
+time_budget = 60.
+seed = 0
+
+if __name__ == '__main__':
+    models = rt_control_models(base_path, n_models=max_models)
+    lstm, bpw, x2k = [jacobian_model(models[k]) for k in ['kstar_lstm', 'bpw_nn', 'x2k']]
+    sim = rt_plasma(models['kstar_lstm'], models['bpw_nn'], models['kstar_nn'], models['x2k'], trace=True)
+    sim.reset(np.array([operating_point]), [targets[:2]])
+    state = sim.state()
+
+    planner = trajectory_optimizer(lstm, bpw, x2k, rt_low_action, rt_high_action, ai_low_target, ai_high_target,
+                                   max_iters=max_iters, time_budget=time_budget, smooth=smooth)
+    schedule = arrival_schedule(n_ticks, targets, arrival)
+    t0 = time.time()
+    actions, planned = planner.optimize(state, schedule, n_starts=n_starts, seed=seed)
+    print(f'{planner.iterations} iterations in {time.time() - t0:.1f} s, loss {planner.losses[0]:.4g} -> {planner.losses[-1]:.4g}')
+
+    # Check the plan on the Keras ensembles with the GUI slider quantization
+    for action in actions:
+        sim.step(action)
+    replayed = sim.trajectory()['outputs'][1:, 0][:, [output_params2.index(p) for p in plan_params]]
+    for i, p in enumerate(plan_params):
+        print(f'{p:>4}: target {targets[i]:.3f}, planned {planned[-1, i]:.3f}, replayed {replayed[-1, i]:.3f}')
+
+    os.makedirs(out_path, exist_ok=True)
+    np.savez(out_path + 'trajectory.npz', time=dt * np.arange(1, n_ticks + 1), actions=actions, schedule=schedule,
+             planned=planned, replayed=replayed, plan_params=plan_params, operating_point=operating_point, losses=planner.losses)
+    print(f'Saved to {out_path}trajectory.npz')
@@ -0,0 +1,49 @@
+#!/usr/bin/env python
+
+import os, sys, glob, time
+import numpy as np
+from common.model_structure import *
+from common.recorder import load_recording
+from common.replay import replay_engine, replay_params
+
+# Setting
+base_path = os.path.abspath(os.path.dirname(sys.argv[0]))
+record_path = base_path + '/records/'
+max_models = 10
+max_shape_models = 4
+seq_len = 10
+batch_size = 4096
+free_run = False # True rolls the LSTM on its own outputs tick by tick instead of the recorded ones
+
+# Weight variants to compare
+lstm_variants = {
+    'v220505': dict(model_path=base_path + '/weights/lstm/v220505/'),
+    'efitrt': dict(model_path=base_path + '/weights/lstm/efitrt/',
+        ymean = [1.4647386, 5.3598804, 1.7585343, 1.0463847],
+        ystd = [0.71713614, 1.4992219, 0.718258, 0.21737464]
+    ),
+}
+bpw_model_path  = base_path + '/weights/bpw/v220505/'
+x2rz_model_path = base_path + '/weights/x2rz/'
+
+if __name__ == '__main__':
+    # Usage: python replay.py [recordings...] (default: every session in records/)
+    paths = sys.argv[1:] or sorted(glob.glob(record_path + '*.rec'))
+    bpw = tf_dense_model(
+        model_path = bpw_model_path,
+        n_models = max_models,
+        ymean = [1.3630552066021155, 251779.19861710534],
+        ystd = [0.6252123013157276, 123097.77805034176]
+    )
+    shape = x2rz(model_path=x2rz_model_path, n_models=max_shape_models)
+    for name, kwargs in lstm_variants.items():
+        engine = replay_engine(kstar_v220505(n_models=max_models, length=seq_len, **kwargs), bpw, shape, seq_len=seq_len, batch_size=batch_size)
+        print(f'\n{name}:')
+        for path in paths:
+            recording = load_recording(path)
+            t0 = time.time()
+            result = engine.run(recording, free_run=free_run)
+            dt = time.time() - t0
+            print(f'{os.path.basename(path)}: {len(recording["time"])} ticks in {dt:.2f} s')
+            for p, stats in result['errors'].items():
+                print(f'  {p}: ' + ', '.join(f'{k} {v:.4g}' for k, v in stats.items()))
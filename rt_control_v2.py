@@ -36,9 +36,11 @@ from scipy import interpolate
 from common.model_structure import *
 from common.wall import *
 from common.setting import *
+from common.server import model_client
+from common.simulator import rt_policy_variants, v2_bounds
+from common.registry import model_registry
 
 # Setting
-wide = True
 base_path = os.path.abspath(os.path.dirname(sys.argv[0]))
 kstar_img_path = base_path + '/images/insideKSTAR.jpg'
 max_models = 10
@@ -50,8 +52,12 @@ dpi = 1
 plot_length = 40
 t_delay = 0.05
 steady_model = False
-lookback = 3
 show_inputs = False
+server_address = None # Socket of a running model_server.py to share its models instead of loading them
+lstm_variant = 'v220505' # Initial weight variants (surrogate_variants, rt_policy_variants in common/simulator.py), switchable in the GUI
+bpw_variant = 'v0'
+policy_variant = '3frame_v220505' # Its lookback and target/action bounds (wide or not) follow the variant
+preload_variants = False # Load every variant in the background at start, so that swaps are immediate
 
 # Fixed setting
 year_in = 2021
@@ -60,27 +66,12 @@ ec_freq = 105.e9
 # Matplotlib rcParams setting
 rcParamsSetting(dpi)
 
-# Path of weights
-lstm_model_path = base_path + '/weights/lstm/v220505/'
+# Path of weights (the LSTM, bpw and RL weights come from the model registry)
 nn_model_path   = base_path + '/weights/nn/'
-bpw_model_path  = base_path + '/weights/bpw/'
 k2rz_model_path = base_path + '/weights/k2rz/'
-rl_model_path   = base_path + '/weights/rl/rt_control/3frame_v220505/best_model.zip' if wide else base_path + '/weights/rl/rt_control/3frame/best_model1.zip'
-
-# RL setting
-if wide:
-    low_target  = [0.8,4.0,0.80]
-    high_target = [2.1,7.0,1.05]
-    low_action  = [0.3, 0.0, 0.0,0.0, 1.6,0.15,0.5 ,1.265,2.14]
-    high_action = [0.8,1.75,1.75,1.5,1.95, 0.5,0.85, 1.36, 2.3]
-else:
-    low_target  = [1.1,3.8,0.84]
-    high_target = [2.1,6.2,1.06]
-    low_action  = [0.35, 0.0, 0.0,0.0,1.65,0.15, 0.5,1.265,2.18]
-    high_action = [0.75,1.75,1.75,1.5,1.95, 0.5,0.85, 1.36,2.29]
-
-low_state  = (low_action + low_target) * lookback + low_target
-high_state = (high_action + high_target) * lookback + high_target
+
+# RL setting (wide or narrow bounds of the initial policy variant)
+low_action, high_action, low_target, high_target = v2_bounds(rt_policy_variants[policy_variant][3])
 
 # Inputs
 input_params = ['Ip [MA]','Bt [T]','GW.frac. [-]',\
@@ -99,14 +90,8 @@ dummy_params = ['Ip [MA]', 'Elon. [-]', 'Up.Tri. [-]', 'Lo.Tri. [-]', 'In.Mid. [
 
 # Targets
 target_params = ['βp','q95','li']
-if wide:
-    target_mins   = [0.8, 4.0,0.80 ]
-    target_maxs   = [2.1, 7.0,1.05 ]
-    target_init   = [1.45,5.5,0.925]
-else:
-    target_mins   = [1.1,3.8,0.84]
-    target_maxs   = [2.1,6.2,1.06]
-    target_init   = [1.6,5.0,0.95]
+target_mins, target_maxs = low_target, high_target
+target_init = np.mean([target_mins, target_maxs], axis=0)
 
 def i2f(i,decimals=decimals):
     return float(i/10**decimals)
@@ -132,30 +117,28 @@ class KSTARWidget(QDialog):
         for i,target_param in enumerate(target_params):
             self.targets[target_param] = [target_init[i], target_init[i]]
         self.new_action = np.array(low_action)
-        self.histories = [list(low_action) + list(target_init)] * lookback
+        self.lookback = rt_policy_variants[policy_variant][2]
+        self.target_mins, self.target_maxs = target_mins, target_maxs
+        self.histories = [list(low_action) + list(target_init)] * self.lookback
         self.img = plt.imread(kstar_img_path)
 
         # Load models
+        load = model_client(server_address).load if server_address is not None else lambda cls, **kwargs: cls(**kwargs)
         if steady_model:
-            self.kstar_nn = kstar_nn(model_path=nn_model_path, n_models=max_models)
+            self.kstar_nn = load(kstar_nn, model_path=nn_model_path, n_models=max_models)
         else:
-            self.kstar_nn = kstar_nn(model_path=nn_model_path, n_models=1)
-            self.kstar_lstm = kstar_v220505(model_path=lstm_model_path, n_models=max_models)
-        self.k2rz = k2rz(model_path=k2rz_model_path, n_models=max_shape_models)
-        self.bpw_nn = bpw_nn(model_path=bpw_model_path, n_models=max_models)
-        
-        # Load agents
-        self.rl_model = SB2_model(
-            model_path = rl_model_path, 
-            low_state = low_state, 
-            high_state = high_state, 
-            low_action = low_action, 
-            high_action = high_action, 
-            activation='relu', 
-            last_actv='tanh', 
-            norm=True, 
-            bavg=0.0
-        )
+            self.kstar_nn = load(kstar_nn, model_path=nn_model_path, n_models=1)
+        self.k2rz = load(k2rz, model_path=k2rz_model_path, n_models=max_shape_models)
+        self.registry = model_registry(base_path, n_models=max_models, load=load)
+        self.variants = {'kstar_lstm': lstm_variant, 'bpw_nn': bpw_variant, 'policy': policy_variant}
+        if steady_model:
+            del self.variants['kstar_lstm']
+        for kind, name in self.variants.items():
+            setattr(self, 'rl_model' if kind == 'policy' else kind, self.registry.get(kind, name))
+        self.choices = {kind: self.registry.variants[kind] for kind in self.variants}
+        self.choices['policy'] = [v for v in self.choices['policy'] if rt_policy_variants[v][1] == 'v2'] # 9 actions on βp, q95, li
+        if preload_variants:
+            self.registry.preload(self.choices)
 
         # Top layout
         topLayout = QHBoxLayout()
@@ -175,6 +158,14 @@ class KSTARWidget(QDialog):
         self.dampBox.setValue(0.0)
         self.dampBox.valueChanged.connect(self.resetDampFactor)
 
+        self.variantBoxes = {}
+        variantLabels = {'kstar_lstm': 'LSTM:', 'bpw_nn': 'βp-W:', 'policy': 'RL:'}
+        for kind in self.variants:
+            self.variantBoxes[kind] = QComboBox()
+            self.variantBoxes[kind].addItems(self.choices[kind])
+            self.variantBoxes[kind].setCurrentText(self.variants[kind])
+            self.variantBoxes[kind].currentTextChanged.connect(lambda name, kind=kind: self.swapVariant(kind, name))
+
         self.rtRunPushButton = QPushButton('Run')
         self.rtRunPushButton.setCheckable(True)
         self.rtRunPushButton.setChecked(True)
@@ -203,6 +194,9 @@ class KSTARWidget(QDialog):
         topLayout.addWidget(self.nModelBox)
         topLayout.addWidget(dampLabel)
         topLayout.addWidget(self.dampBox)
+        for kind, box in self.variantBoxes.items():
+            topLayout.addWidget(QLabel(variantLabels[kind]))
+            topLayout.addWidget(box)
         #topLayout.addWidget(self.rtRunPushButton)
         topLayout.addWidget(self.shuffleModelPushButton)
         topLayout.addWidget(self.plotHeatingCheckBox)
@@ -260,10 +254,42 @@ class KSTARWidget(QDialog):
         if steady_model:
             self.kstar_nn.nmodels = self.nModelBox.value()
         else:
-            self.kstar_lstm.nmodels = self.nModelBox.value()
-        self.bpw_nn.nmodels = self.nModelBox.value()
+            self.kstar_lstm.nmodels = min(self.nModelBox.value(), len(self.kstar_lstm.models))
+        self.bpw_nn.nmodels = min(self.nModelBox.value(), len(self.bpw_nn.models))
         #self.k2rz.nmodels = self.nModelBox.value()
 
+    def swapVariant(self, kind, name):
+        # Immediate if the variant is loaded (no tick runs meanwhile), otherwise after the first tick once it is
+        self.registry.swap(kind, name)
+        self.applySwaps()
+
+    def applySwaps(self):
+        swaps = self.registry.apply()
+        for kind, (name, model) in swaps.items():
+            if kind == 'policy':
+                model.bavg = self.dampBox.value()
+                self.rl_model = model
+                lookback = rt_policy_variants[name][2]
+                self.histories = [self.histories[0]] * (lookback - len(self.histories)) + self.histories[-lookback:]
+                self.lookback = lookback
+                self.resetTargetRanges(*v2_bounds(rt_policy_variants[name][3])[2:])
+            else:
+                setattr(self, kind, model)
+            self.variants[kind] = name
+            print(f'Swapped {kind} to {name}')
+        if swaps:
+            self.resetModelNumber()
+
+    def resetTargetRanges(self, mins, maxs):
+        # Target sliders of wide and narrow policies, without a control tick from the clipped values
+        self.target_mins, self.target_maxs = mins, maxs
+        for i, target_param in enumerate(target_params):
+            self.targetSliderDict[target_param].blockSignals(True)
+            self.targetSliderDict[target_param].setMinimum(f2i(mins[i]))
+            self.targetSliderDict[target_param].setMaximum(f2i(maxs[i]))
+            self.targetSliderDict[target_param].blockSignals(False)
+            self.targetValueLabelDict[target_param].setText(f'{self.targetSliderDict[target_param].value()/10**decimals:.3f}')
+
     def resetDampFactor(self):
         self.rl_model.bavg = self.dampBox.value()
 
@@ -379,14 +405,31 @@ class KSTARWidget(QDialog):
             self.predict0d(steady = self.first or steady_model)
 
     def autoControl(self):
-        observation = np.zeros_like(low_state)
-        for i in range(lookback):
+        observation = np.zeros(self.lookback * len(self.histories[0]) + len(target_params))
+        for i in range(self.lookback):
             observation[i * len(self.histories[0]) : (i + 1) * len(self.histories[0])] = self.histories[i]
-        observation[lookback * len(self.histories[0]) :] = [i2f(self.targetSliderDict[target_params[i]].value()) for i in [0, 1, 2]]
+        observation[self.lookback * len(self.histories[0]) :] = [i2f(self.targetSliderDict[target_params[i]].value()) for i in [0, 1, 2]]
         self.new_action = self.rl_model.predict(observation, yold=self.new_action)
         idx_convert = [0, 3, 4, 5, 12, 13, 14, 10, 11]
-        for i, idx in enumerate(idx_convert):
-            self.inputSliderDict[input_params[idx]].setValue(f2i(self.new_action[i]))
+        self.setInputs({input_params[idx]: self.new_action[i] for i, idx in enumerate(idx_convert)})
+
+    def setSliders(self, sliders, values):
+        # valueChanged is blocked while the sliders are written, so that a vector lands as one update
+        for slider, value in zip(sliders, values):
+            slider.blockSignals(True)
+            slider.setValue(f2i(value))
+            slider.blockSignals(False)
+
+    def setInputs(self, values):
+        # {input_param: value} at once, then one label refresh
+        self.setSliders([self.inputSliderDict[p] for p in values], values.values())
+        self.updateInputs()
+
+    def setTargets(self, values, update=True):
+        # {target_param: value} at once, then one control tick and render (unless update is False)
+        self.setSliders([self.targetSliderDict[p] for p in values], values.values())
+        if update:
+            self.updateTargets()
 
     def plotPlasma(self,predict=True):
         # Predict plasma
@@ -454,7 +497,7 @@ class KSTARWidget(QDialog):
 
         # Plot 0D evolution
         alpha = 0.5
-        gaps = 0.5 * np.subtract(target_maxs, target_mins)
+        gaps = 0.5 * np.subtract(self.target_maxs, self.target_mins)
         
         plt.subplot(3,3,3)
         plt.title('Response and target')
@@ -463,7 +506,7 @@ class KSTARWidget(QDialog):
         plt.grid(linewidth=0.5*(100/dpi))
         plt.legend(loc='upper left',fontsize=7.5*(100/dpi),frameon=False)
         plt.xlim([-0.1 * plot_length - 0.2, 0.2])
-        plt.ylim([target_mins[0] - gaps[0], target_maxs[0] + gaps[0]])
+        plt.ylim([self.target_mins[0] - gaps[0], self.target_maxs[0] + gaps[0]])
         plt.xticks(color='w')
 
         plt.subplot(3,3,6)
@@ -472,7 +515,7 @@ class KSTARWidget(QDialog):
         plt.grid(linewidth=0.5*(100/dpi))
         plt.legend(loc='upper left',fontsize=7.5*(100/dpi),frameon=False)
         plt.xlim([-0.1 * plot_length - 0.2, 0.2])
-        plt.ylim([target_mins[1] - gaps[1], target_maxs[1] + gaps[1]])
+        plt.ylim([self.target_mins[1] - gaps[1], self.target_maxs[1] + gaps[1]])
         plt.xticks(color='w')
 
         plt.subplot(3,3,9)
@@ -481,7 +524,7 @@ class KSTARWidget(QDialog):
         plt.grid(linewidth=0.5*(100/dpi))
         plt.legend(loc='upper left',fontsize=7.5*(100/dpi),frameon=False)
         plt.xlim([-0.1 * plot_length - 0.2, 0.2])
-        plt.ylim([target_mins[2] - gaps[2], target_maxs[2] + gaps[2]])
+        plt.ylim([self.target_mins[2] - gaps[2], self.target_maxs[2] + gaps[2]])
 
         plt.xlabel('Relative time [s]')
         plt.tight_layout(h_pad=0., rect=(0.05,0.05,0.95,0.95))
@@ -684,6 +727,7 @@ class KSTARWidget(QDialog):
 
         self.outputs['h89'].append(h89)
         self.outputs['h98'].append(h98)
+        self.applySwaps()
 
     def shuffleModels(self):
         np.random.shuffle(self.k2rz.models)
@@ -711,8 +755,8 @@ class KSTARWidget(QDialog):
         self.plotRT = False
         for i, target_param in enumerate(target_params):
             for level in [0.667, 0.833, 1.0, 0.833, 0.667, 0.5, 0.333, 0.167, 0.0, 0.167, 0.333, 0.5]:
-                target_value = target_mins[i] + level * (target_maxs[i] - target_mins[i])
-                self.targetSliderDict[target_param].setValue(f2i(target_value))
+                target_value = self.target_mins[i] + level * (self.target_maxs[i] - self.target_mins[i])
+                self.setTargets({target_param: target_value})
         self.reCreateOutputBox(predict=False)
         self.plotRT = True
 
@@ -1,6 +1,6 @@
 #!/usr/bin/env python
 
-import os, sys, time
+import os, sys, time, threading
 import numpy as np
 from scipy import interpolate
 import matplotlib.pyplot as plt
@@ -35,22 +35,56 @@ from PyQt5.QtWidgets import QApplication,\
 from common.model_structure import *
 from common.wall import *
 from common.setting import *
+from common.parallel import sharded_ensemble
+from common.server import model_client
+from common.runtime import *
+from common.recorder import trajectory_recorder
+from common.atlas import load_atlas, infeasible_spans
+from common.simulator import rt_plasma, rt_policy_variants
+from common.registry import model_registry
+from common.mpc import mpc_controller
+from common.metrics import staircase_metrics, metrics_table
+from common.features import h_factors
+from common.history import trace_history
 
 # Setting
 base_path = os.path.abspath(os.path.dirname(sys.argv[0]))
 kstar_img_path = base_path + '/images/insideKSTAR.jpg'
+record_path = base_path + '/records/'
+atlas_path = base_path + '/atlas/rt_control_v3.npz' # Made by feasibility_atlas.py, shades unreachable targets
 max_models = 10
 init_models = 1
 max_shape_models = 4
 seq_len = 10
 decimals = np.log10(1000)
 dpi = 1
-plot_length = 50
+plot_length = 50 # Ticks kept in the live lists (metrics, dump); the trace panels draw the unbounded history
+history_span = 5. # [s] of history shown by the trace panels at start, zoomable in the GUI
+history_points = 200 # Drawn points per trace, whatever the span
+history_method = 'minmax' # Decimation of long spans: 'minmax' (every peak) or 'lttb' (largest-triangle-three-buckets)
 t_delay = 0.05
 steady_model = False
-lookback = 3
 show_inputs = False
-efitrt = False
+lstm_variant = 'v220505' # Initial weight variants (surrogate_variants, rt_policy_variants in common/simulator.py), switchable in the GUI.
+bpw_variant = 'v220505' # e.g. 'efitrt' for the LSTM, or '<variant>/student' for the one-network students of distill.py
+x2k_variant = 'v0'
+policy_variant = 'bp_q95'
+preload_variants = False # Load every variant in the background at start, so that swaps are immediate
+n_workers = 0 # >0 shards the LSTM, bpw and x2k ensembles over worker processes
+server_address = None # Socket of a running model_server.py to share its models instead of loading them
+warmup_models = True
+warmup_background = False
+tf_intra_threads = None # None keeps the library defaults
+tf_inter_threads = None
+blas_threads = None
+control_cores = None # e.g. {0} for the Qt/control thread
+inference_cores = None # e.g. {1, 2, 3} for TF pools and shard workers
+report_jitter = False
+tick_threads = 1 # Pool threads for the independent stages of a tick (x2rz boundary next to the 0D prediction); 0 runs them in sequence
+record_boundary = True # Record the LCFS of every tick, predicted for the recorder on ticks that are not rendered; False records the 0D traces only
+mpc_samples = 64 # Candidate action sequences of the MPC mode
+mpc_horizon = 5
+mpc_time_budget = 0.08 # [s] within the 0.1 s control period
 
 # Fixed setting
 year_in = 2021
@@ -59,22 +93,16 @@ ec_freq = 105.e9
 # Matplotlib rcParams setting
 rcParamsSetting(dpi)
 
-# Path of weights
-lstm_model_path = base_path + '/weights/lstm/efitrt/' if efitrt else base_path + '/weights/lstm/v220505/'
+# Path of weights (the LSTM, bpw, x2k and RL weights come from the model registry)
 nn_model_path   = base_path + '/weights/nn/'
-bpw_model_path  = base_path + '/weights/bpw/v220505/'
 k2rz_model_path = base_path + '/weights/k2rz/'
 x2rz_model_path = base_path + '/weights/x2rz/'
-x2k_model_path  = base_path + '/weights/x2k/'
-rl_model_path   = base_path + '/weights/rl/rt_control/bp_q95/best_model.zip'
 
 # RL setting
 low_action  = [0.3, 1.36, 0.78, -0.050, 1.27, 2.18]
 high_action = [0.8, 1.54, 1.01, -0.005, 1.34, 2.30]
 low_target  = [1.0, 4.0]
 high_target = [2.0, 7.0]
-low_state   = (low_action + low_target) * lookback + low_target
-high_state  = (high_action + high_target) * lookback + high_target
 
 # Inputs
 input_params = ['Ip [MA]','Bt [T]','GW.frac. [-]',\
@@ -96,6 +124,9 @@ target_params = ['βp','q95']
 target_mins, target_maxs = low_target, high_target
 target_init = np.mean([target_mins, target_maxs], axis=0)
 
+# Channels of the trace panels
+history_params = ['Ip [MA]', 'Pnb [MW]', 'Elon. [-]', 'Up.Tri. [-]', 'Lo.Tri. [-]', 'In.Mid. [m]', 'Out.Mid. [m]', 'βp', 'q95', 'βp target', 'q95 target']
+
 def i2f(i,decimals=decimals):
     return float(i/10**decimals)
 
@@ -109,7 +140,6 @@ class KSTARWidget(QDialog):
         
         # Initial condition
         self.first = True
-        self.update = True
         self.time = np.linspace(-0.1 * (plot_length - 1), 0, plot_length)
         self.outputs, self.dummy, self.targets = {}, {}, {}
         for p in output_params2:
@@ -120,48 +150,54 @@ class KSTARWidget(QDialog):
             self.targets[p] = [target_init[i], target_init[i]]
         self.x = np.zeros([seq_len, 18])
         self.new_action = np.array(low_action)
-        self.histories = [list(low_action) + list(target_init)] * lookback
+        self.lookback = rt_policy_variants[policy_variant][2]
+        self.histories = [list(low_action) + list(target_init)] * self.lookback
+        self.h_pending = [] # (inputs, wmhd) of the ticks whose H factors nobody has read yet
+        self.history = trace_history(history_params)
         self.img = plt.imread(kstar_img_path)
+        self.recorder, self.tick = None, 0
+        self.atlas = load_atlas(atlas_path) if os.path.exists(atlas_path) else None
+
+        # Runtime threading (TF pools inherit the affinity of the thread that creates them)
+        configure_threads(tf_intra=tf_intra_threads, tf_inter=tf_inter_threads, blas=blas_threads)
+        original_cores = os.sched_getaffinity(0) if hasattr(os, 'sched_getaffinity') else None
+        pin_thread(inference_cores)
+        self.tick_timer = tick_timer()
 
         # Load NN models
+        if server_address is not None:
+            load = load_ensemble = model_client(server_address).load
+        else:
+            load = lambda cls, **kwargs: cls(**kwargs)
+            load_ensemble = lambda cls, **kwargs: sharded_ensemble(cls, n_workers=n_workers, cores=inference_cores, **kwargs) if n_workers > 0 else cls(**kwargs)
+        self.registry = model_registry(base_path, n_models=max_models, load=load, load_ensemble=load_ensemble)
+        self.variants = {'kstar_lstm': lstm_variant, 'bpw_nn': bpw_variant, 'x2k': x2k_variant}
         if steady_model:
-            self.kstar_nn = kstar_nn(model_path=nn_model_path, n_models=max_models)
+            self.kstar_nn = load(kstar_nn, model_path=nn_model_path, n_models=max_models)
+            del self.variants['kstar_lstm']
         else:
-            self.kstar_nn = kstar_nn(model_path=nn_model_path, n_models=1)
-            if efitrt:
-                self.kstar_lstm = kstar_v220505(model_path=lstm_model_path, n_models=max_models,
-                    ymean = [1.4647386, 5.3598804, 1.7585343, 1.0463847],
-                    ystd = [0.71713614, 1.4992219, 0.718258, 0.21737464]
-                )
-            else:
-                self.kstar_lstm = kstar_v220505(model_path=lstm_model_path, n_models=max_models)
-        self.k2rz = k2rz(model_path=k2rz_model_path, n_models=max_shape_models)
-        self.x2rz = x2rz(model_path=x2rz_model_path, n_models=max_shape_models)
-        self.bpw_nn = tf_dense_model(
-            model_path = bpw_model_path,
-            n_models = max_models,
-            ymean = [1.3630552066021155, 251779.19861710534],
-            ystd = [0.6252123013157276, 123097.77805034176]
-        )
-        self.x2k = tf_dense_model(
-            model_path = x2k_model_path,
-            n_models = max_models,
-            ymean = [1.7393100417827367, 0.42079321602827713, 0.7240443011421216],
-            ystd = [0.07815663915772043, 0.16808615658503132, 0.16303934837604867]
-        )
+            self.kstar_nn = load(kstar_nn, model_path=nn_model_path, n_models=1)
+        for kind, name in self.variants.items():
+            setattr(self, kind, self.registry.get(kind, name))
+        self.k2rz = load(k2rz, model_path=k2rz_model_path, n_models=max_shape_models)
+        self.x2rz = load(x2rz, model_path=x2rz_model_path, n_models=max_shape_models)
         
+        # Warm up the surrogates before the first interactive tick
+        self.warmup_time = {}
+        if warmup_models:
+            if warmup_background:
+                threading.Thread(target=self.warmupModels, daemon=True).start()
+            else:
+                self.warmupModels()
+
         # Load RL agents
-        self.rl_model = SB2_model(
-            model_path = rl_model_path, 
-            low_state = low_state, 
-            high_state = high_state, 
-            low_action = low_action, 
-            high_action = high_action, 
-            activation='relu', 
-            last_actv='tanh', 
-            norm=True, 
-            bavg=0.0
-        )
+        self.rl_model = self.registry.get('policy', policy_variant)
+        self.variants['policy'] = policy_variant
+        self.choices = {kind: self.registry.variants[kind] for kind in self.variants}
+        self.choices['policy'] = [v for v in self.choices['policy'] if rt_policy_variants[v][1] == 'v3'] # 6 actions on βp, q95
+        self.registry.warm = warmup_models # Variants loaded from now on
+        if preload_variants:
+            self.registry.preload(self.choices)
         '''
         self.rl_model = SB2_ensemble(
             model_list = [
@@ -182,6 +218,43 @@ class KSTARWidget(QDialog):
         )
         '''
 
+        # MPC on the same surrogates, as an alternative to the RL policy
+        if not steady_model:
+            self.mpc = mpc_controller(rt_plasma(self.kstar_lstm, self.bpw_nn, self.kstar_nn, self.x2k, lookback=self.lookback),
+                low_action, high_action, low_target, high_target, target_params,
+                n_samples=mpc_samples, horizon=mpc_horizon, time_budget=mpc_time_budget
+            )
+
+        # Derived quantities of the 2D view, computed only while a panel or the recorder subscribes to them
+        # and reused while their inputs stay the same (a paused plasma, a re-plot)
+        self.lazy = lazy_values()
+        self.lazy.add('boundary', self.boundary, ['boundary_inputs'])
+        self.lazy.add('heat_loads', self.heatLoads, ['boundary'])
+        self.lazy.add('heating', self.heating, ['heating_inputs'])
+        self.lazy.subscribe('boundary', 'panel') # The LCFS is always drawn
+
+        # One tick as a dataflow graph: policy -> x2k -> {x2rz boundary on the previous βp, LSTM -> bpw} -> record,
+        # then the render; the boundary runs on the pool next to the 0D prediction, if anything wants it
+        self.tick_graph = tick_graph(n_threads=tick_threads, cores=inference_cores)
+        self.tick_graph.add('policy', lambda r: self.policyAction())
+        self.tick_graph.add('x2k', lambda r: self.shapeAction(), ['policy'])
+        self.tick_graph.add('inputs', lambda r: self.lazy.set(boundary_inputs=self.boundaryInputs()), ['x2k'])
+        self.tick_graph.add('boundary', lambda r: self.lazy.get('boundary'), ['inputs'], pool=True)
+        self.tick_graph.add('0d', lambda r: self.predict0d(steady=self.first or steady_model, record=False), ['inputs'])
+        self.tick_graph.add('record', lambda r: self.recordTick(r.get('boundary')), ['boundary', '0d'])
+
+        # Move the control loop to its own cores, with the inference tick jitter of the Qt thread on the original
+        # affinity mask and on its pinned cores. The models and TF pools keep the inference_cores they were made on
+        # either way (a baseline with nothing pinned needs inference_cores = control_cores = None).
+        if report_jitter:
+            print(f'Threads: TF intra {tf_intra_threads}, TF inter {tf_inter_threads}, BLAS {blas_threads}')
+            pin_thread(original_cores)
+            print(f'Tick, Qt thread unpinned: {format_stats(measure_jitter(self.benchTick))}')
+            pin_thread(inference_cores)
+        pin_thread(control_cores)
+        if report_jitter and (control_cores is not None or inference_cores is not None):
+            print(f'Tick, Qt thread pinned:   {format_stats(measure_jitter(self.benchTick))}')
+
         # Top layout
         topLayout = QHBoxLayout()
         
@@ -193,6 +266,14 @@ class KSTARWidget(QDialog):
         self.resetModelNumber()
         self.nModelBox.valueChanged.connect(self.resetModelNumber)
         
+        spanLabel = QLabel('History [s]:')
+        self.spanBox = QDoubleSpinBox()
+        self.spanBox.setDecimals(0)
+        self.spanBox.setMinimum(2)
+        self.spanBox.setMaximum(3600)
+        self.spanBox.setValue(history_span)
+        self.spanBox.valueChanged.connect(self.rePlotOutputBox)
+
         dampLabel = QLabel('Damp factor:')
         self.dampBox = QDoubleSpinBox()
         self.dampBox.setMinimum(0)
@@ -200,6 +281,14 @@ class KSTARWidget(QDialog):
         self.dampBox.setValue(0.0)
         self.dampBox.valueChanged.connect(self.resetDampFactor)
 
+        self.variantBoxes = {}
+        variantLabels = {'kstar_lstm': 'LSTM:', 'bpw_nn': 'βp-W:', 'x2k': 'x2k:', 'policy': 'RL:'}
+        for kind in self.variants:
+            self.variantBoxes[kind] = QComboBox()
+            self.variantBoxes[kind].addItems(self.choices[kind])
+            self.variantBoxes[kind].setCurrentText(self.variants[kind])
+            self.variantBoxes[kind].currentTextChanged.connect(lambda name, kind=kind: self.swapVariant(kind, name))
+
         self.rtRunPushButton = QPushButton('Run')
         self.rtRunPushButton.setCheckable(True)
         self.rtRunPushButton.setChecked(True)
@@ -210,16 +299,28 @@ class KSTARWidget(QDialog):
 
         self.plotHeatingCheckBox = QCheckBox('Plot NBI/EC')
         self.plotHeatingCheckBox.setChecked(True)
-        self.plotHeatingCheckBox.stateChanged.connect(self.rePlotOutputBox)
+        self.plotHeatingCheckBox.stateChanged.connect(lambda: self.togglePanel('heating', self.plotHeatingCheckBox))
+        self.lazy.subscribe('heating', 'panel')
 
         self.plotHeatLoadCheckBox = QCheckBox('Plot heat load')
         self.plotHeatLoadCheckBox.setChecked(True)
-        self.plotHeatLoadCheckBox.stateChanged.connect(self.rePlotOutputBox)
+        self.plotHeatLoadCheckBox.stateChanged.connect(lambda: self.togglePanel('heat_loads', self.plotHeatLoadCheckBox))
+        self.lazy.subscribe('heat_loads', 'panel')
 
         self.overplotCheckBox = QCheckBox('Overlap device')
         self.overplotCheckBox.setChecked(True)
         self.overplotCheckBox.stateChanged.connect(self.rePlotOutputBox)
 
+        self.mpcCheckBox = QCheckBox('MPC')
+        self.mpcCheckBox.setChecked(False)
+        self.mpcCheckBox.setEnabled(not steady_model)
+        self.mpcCheckBox.stateChanged.connect(self.resetController)
+
+        self.recordPushButton = QPushButton('Record')
+        self.recordPushButton.setCheckable(True)
+        self.recordPushButton.setChecked(False)
+        self.recordPushButton.clicked.connect(self.toggleRecording)
+
         self.testButton1 = QPushButton('Test ctrl 1')
         self.testButton1.setFixedWidth(100)
         self.testButton1.clicked.connect(self.test1)
@@ -232,11 +333,18 @@ class KSTARWidget(QDialog):
         topLayout.addWidget(self.nModelBox)
         topLayout.addWidget(dampLabel)
         topLayout.addWidget(self.dampBox)
+        topLayout.addWidget(spanLabel)
+        topLayout.addWidget(self.spanBox)
+        for kind, box in self.variantBoxes.items():
+            topLayout.addWidget(QLabel(variantLabels[kind]))
+            topLayout.addWidget(box)
         #topLayout.addWidget(self.rtRunPushButton)
         topLayout.addWidget(self.shuffleModelPushButton)
         topLayout.addWidget(self.plotHeatingCheckBox)
         topLayout.addWidget(self.plotHeatLoadCheckBox)
         topLayout.addWidget(self.overplotCheckBox)
+        topLayout.addWidget(self.mpcCheckBox)
+        topLayout.addWidget(self.recordPushButton)
         topLayout.addWidget(self.testButton1)
         topLayout.addWidget(self.testButton2)
 
@@ -286,14 +394,70 @@ class KSTARWidget(QDialog):
         self.updateTargets()
 
     def resetModelNumber(self):
+        # Students have a single member
         if steady_model:
             self.kstar_nn.nmodels = self.nModelBox.value()
         else:
-            self.kstar_lstm.nmodels = self.nModelBox.value()
-        self.bpw_nn.nmodels = self.nModelBox.value()
-        self.x2k.nmodels = self.nModelBox.value()
+            self.kstar_lstm.nmodels = min(self.nModelBox.value(), len(self.kstar_lstm.models))
+        self.bpw_nn.nmodels = min(self.nModelBox.value(), len(self.bpw_nn.models))
+        self.x2k.nmodels = min(self.nModelBox.value(), len(self.x2k.models))
         #self.k2rz.nmodels = self.nModelBox.value()
 
+    def swapVariant(self, kind, name):
+        # Immediate if the variant is loaded (no tick runs meanwhile), otherwise after the first tick once it is
+        self.registry.swap(kind, name)
+        self.applySwaps()
+
+    def applySwaps(self):
+        swaps = self.registry.apply()
+        for kind, (name, model) in swaps.items():
+            if kind == 'policy':
+                model.bavg = self.dampBox.value()
+                self.rl_model = model
+                lookback = rt_policy_variants[name][2]
+                self.histories = [self.histories[0]] * (lookback - len(self.histories)) + self.histories[-lookback:]
+                self.lookback = lookback
+            else:
+                setattr(self, kind, model)
+            self.variants[kind] = name
+            print(f'Swapped {kind} to {name}')
+        if swaps:
+            self.resetModelNumber()
+            if not steady_model:
+                plasma = self.mpc.plasma
+                plasma.kstar_lstm, plasma.bpw_nn, plasma.x2k, plasma.lookback = self.kstar_lstm, self.bpw_nn, self.x2k, self.lookback
+
+    def warmupModels(self):
+        surrogates = ['kstar_nn', 'kstar_lstm', 'k2rz', 'x2rz', 'bpw_nn', 'x2k']
+        for name in surrogates:
+            if hasattr(self, name):
+                self.warmup_time[name] = warmup(getattr(self, name))
+        print('Warm-up [s]: ' + ', '.join(f'{name} {t:.2f}' for name, t in self.warmup_time.items()))
+
+    def benchTick(self):
+        if steady_model:
+            self.kstar_nn.predict_batch(np.zeros(17))
+        else:
+            self.kstar_lstm.predict_batch(self.x)
+        self.bpw_nn.predict_batch(np.zeros(8))
+        self.x2k.predict_batch(np.zeros(10))
+        self.rl_model.predict_batch(np.concatenate([np.ravel(self.histories), target_init]))
+
+    def resetController(self):
+        self.mpc.reset()
+
+    def controlState(self, targets):
+        self.estimateHFactors()
+        return {
+            'x': self.x,
+            'u': [i2f(self.inputSliderDict[p].value()) for p in input_params],
+            'outputs': {p: self.outputs[p][-1] for p in output_params2},
+            'targets': targets,
+            'time': 0.,
+            'action': self.new_action,
+            'histories': self.histories,
+        }
+
     def resetDampFactor(self):
         self.rl_model.bavg = self.dampBox.value()
 
@@ -355,11 +519,11 @@ class KSTARWidget(QDialog):
 
         self.outputBox.setLayout(self.layout)
 
-    def reCreateOutputBox(self,predict=True):
+    def reCreateOutputBox(self,predict=True,control=False):
         self.outputBox = QGroupBox(' ')
 
         plt.clf()
-        self.plotPlasma(predict=predict)
+        self.plotPlasma(predict=predict,control=control)
         self.canvas = FigureCanvas(self.fig)
 
         self.layout = QGridLayout()
@@ -372,6 +536,14 @@ class KSTARWidget(QDialog):
     def rePlotOutputBox(self):
         self.reCreateOutputBox(predict=False)
 
+    def togglePanel(self, name, checkBox):
+        # A check box subscribes the 2D view to a lazy value while it is checked
+        if checkBox.isChecked():
+            self.lazy.subscribe(name, 'panel')
+        else:
+            self.lazy.unsubscribe(name, 'panel')
+        self.rePlotOutputBox()
+
     def createAutonomousBox(self):
         self.autonomousBox = QGroupBox('Target setting')
         layout = QGridLayout()
@@ -399,27 +571,53 @@ class KSTARWidget(QDialog):
         self.autonomousBox.setMaximumWidth(120)
 
     def changeTargets(self):
-        if self.update:
+        self.updateTargets()
+
+    def setSliders(self, sliders, values):
+        # valueChanged is blocked while the sliders are written, so that a vector lands as one update
+        for slider, value in zip(sliders, values):
+            slider.blockSignals(True)
+            slider.setValue(f2i(value))
+            slider.blockSignals(False)
+
+    def setInputs(self, values):
+        # {input_param: value} at once, then one label refresh
+        self.setSliders([self.inputSliderDict[p] for p in values], values.values())
+        self.updateInputs()
+
+    def setTargets(self, values, update=True):
+        # {target_param: value} at once, then one control tick and render (unless update is False)
+        self.setSliders([self.targetSliderDict[p] for p in values], values.values())
+        if update:
             self.updateTargets()
 
     def updateTargets(self):
         for target_param in target_params:
             self.targetValueLabelDict[target_param].setText(f'{self.targetSliderDict[target_param].value()/10**decimals:.3f}')
-        self.autoControl()
         if (time.time() - self.tmp > self.t_delay) & self.rtRunPushButton.isChecked():
-            self.reCreateOutputBox()
+            self.reCreateOutputBox(control=True)
             self.tmp = time.time()
-        elif not self.rtRunPushButton.isChecked():
-            self.predict0d(steady = self.first or steady_model)
+        else:
+            self.autoControl()
+            if not self.rtRunPushButton.isChecked():
+                self.predict0d(steady = self.first or steady_model)
 
     def autoControl(self):
+        self.policyAction()
+        self.shapeAction()
+
+    def policyAction(self):
         # Produce action from observation
-        observation = np.zeros_like(low_state)
-        for i in range(lookback):
+        observation = np.zeros(self.lookback * len(self.histories[0]) + len(target_params))
+        for i in range(self.lookback):
             observation[i * len(self.histories[0]) : (i + 1) * len(self.histories[0])] = self.histories[i]
-        observation[lookback * len(self.histories[0]) :] = [i2f(self.targetSliderDict[target_params[i]].value()) for i in [0, 1]]
-        self.new_action = self.rl_model.predict(observation, yold=self.new_action)
+        observation[self.lookback * len(self.histories[0]) :] = [i2f(self.targetSliderDict[target_params[i]].value()) for i in [0, 1]]
+        if self.mpcCheckBox.isChecked() and not self.first:
+            self.new_action = self.mpc.predict(self.controlState(observation[self.lookback * len(self.histories[0]) :]))
+        else:
+            self.new_action = self.rl_model.predict(observation, yold=self.new_action)
 
+    def shapeAction(self):
         # Convert X to KD
         x = [
             self.new_action[0], # ip
@@ -436,22 +634,22 @@ class KSTARWidget(QDialog):
         k, du, dl = self.x2k.predict(x)
         
         # Update inputs
-        self.inputSliderDict['Ip [MA]'].setValue(f2i(self.new_action[0]))
-        self.inputSliderDict['In.Mid. [m]'].setValue(f2i(self.new_action[4]))
-        self.inputSliderDict['Out.Mid. [m]'].setValue(f2i(self.new_action[5]))
-        self.inputSliderDict['Elon. [-]'].setValue(f2i(k))
-        self.inputSliderDict['Up.Tri. [-]'].setValue(f2i(du))
-        self.inputSliderDict['Lo.Tri. [-]'].setValue(f2i(dl))
-
-    def plotPlasma(self,predict=True):
-        # Predict plasma
+        self.setInputs({
+            'Ip [MA]': self.new_action[0],
+            'In.Mid. [m]': self.new_action[4],
+            'Out.Mid. [m]': self.new_action[5],
+            'Elon. [-]': k,
+            'Up.Tri. [-]': du,
+            'Lo.Tri. [-]': dl,
+        })
+
+    def plotPlasma(self,predict=True,control=False):
+        # Predict plasma (and control first if asked) through the tick graph
         if predict:
-            self.predictBoundary()
-            if self.first or steady_model:
-                self.predict0d(steady=True)
-            else:
-                self.predict0d(steady=False)
-        ts = self.time[-len(self.outputs['βn']):]
+            skip = [] if control else ['policy', 'x2k']
+            self.tick_graph.run(skip=skip + ['boundary'] * (not self.lazy.wanted('boundary')))
+        span = self.spanBox.value()
+        lines = self.history.lines(span, history_points, history_method) # Finer levels as the span shrinks
         
         # Plot 2D view
         plt.subplot(1,3,1)
@@ -461,9 +659,9 @@ class KSTARWidget(QDialog):
             plt.fill_between(self.rbdry,self.zbdry,color='b',alpha=0.2,linewidth=0.0)
         plt.plot(Rwalls,Zwalls,'k',linewidth=1.5*(100/dpi),label='Wall')
         plt.plot(self.rbdry,self.zbdry,'b',linewidth=2*(100/dpi),label='LCFS')
-        if self.plotHeatingCheckBox.isChecked():
+        if self.lazy.wanted('heating'):
             self.plotHeating()
-        if self.plotHeatLoadCheckBox.isChecked():
+        if self.lazy.wanted('heat_loads'):
             self.plotHeatLoads()
         plt.xlabel('R [m]')
         plt.ylabel('Z [m]')
@@ -478,35 +676,34 @@ class KSTARWidget(QDialog):
         
         # Plot operation trajectory
         plt.subplot(3,3,2)
-        pnb = np.sum([self.dummy['Pnb1a [MW]'], self.dummy['Pnb1b [MW]'], self.dummy['Pnb1c [MW]']], axis=0)
         plt.title('AI operation trajectory')
-        plt.plot(ts,self.dummy['Ip [MA]'],'k',linewidth=2*(100/dpi),label='Ip [MA]')
-        plt.step(ts,0.1*pnb,'grey',linewidth=2*(100/dpi),label='0.1*Pnb [MW]',where='mid')
+        plt.plot(*lines['Ip [MA]'],'k',linewidth=2*(100/dpi),label='Ip [MA]')
+        plt.step(lines['Pnb [MW]'][0],0.1*lines['Pnb [MW]'][1],'grey',linewidth=2*(100/dpi),label='0.1*Pnb [MW]',where='mid')
         plt.grid(linewidth=0.5*(100/dpi))
         plt.legend(loc='upper left',fontsize=7.5*(100/dpi),frameon=False)
         plt.legend(fontsize=7.5*(100/dpi),frameon=False)
-        plt.xlim([-0.1 * plot_length - 0.2, 0.2])
+        plt.xlim([-span - 0.2, 0.2])
         plt.ylim([0.1, 0.75])
         plt.xticks(color='w')
 
         plt.subplot(3,3,5)
-        plt.plot(ts,np.array(self.dummy['Elon. [-]']) - 1,'k',linewidth=2*(100/dpi),label='Elon.-1')
-        plt.plot(ts,self.dummy['Up.Tri. [-]'],'lightgrey',linewidth=2*(100/dpi),label='Up.Tri.')
-        plt.plot(ts,self.dummy['Lo.Tri. [-]'],'grey',linewidth=2*(100/dpi),label='Lo.Tri.')
+        plt.plot(lines['Elon. [-]'][0],lines['Elon. [-]'][1] - 1,'k',linewidth=2*(100/dpi),label='Elon.-1')
+        plt.plot(*lines['Up.Tri. [-]'],'lightgrey',linewidth=2*(100/dpi),label='Up.Tri.')
+        plt.plot(*lines['Lo.Tri. [-]'],'grey',linewidth=2*(100/dpi),label='Lo.Tri.')
         plt.grid(linewidth=0.5*(100/dpi))
         plt.legend(loc='upper left',fontsize=7.5*(100/dpi),frameon=False)
         plt.legend(fontsize=7.5*(100/dpi),frameon=False)
-        plt.xlim([-0.1 * plot_length - 0.2, 0.2])
+        plt.xlim([-span - 0.2, 0.2])
         plt.ylim([0.15, 1])
         plt.xticks(color='w')
 
         plt.subplot(3,3,8)
-        plt.plot(ts,np.array(self.dummy['In.Mid. [m]']) - 1.265,'k',linewidth=2*(100/dpi),label='In.Gap [m]')
-        plt.plot(ts,2.316 - np.array(self.dummy['Out.Mid. [m]']),'grey',linewidth=2*(100/dpi),label='Out.Gap [m]')
+        plt.plot(lines['In.Mid. [m]'][0],lines['In.Mid. [m]'][1] - 1.265,'k',linewidth=2*(100/dpi),label='In.Gap [m]')
+        plt.plot(lines['Out.Mid. [m]'][0],2.316 - lines['Out.Mid. [m]'][1],'grey',linewidth=2*(100/dpi),label='Out.Gap [m]')
         plt.grid(linewidth=0.5*(100/dpi))
         plt.legend(loc='upper left',fontsize=7.5*(100/dpi),frameon=False)
         plt.legend(fontsize=7.5*(100/dpi),frameon=False)
-        plt.xlim([-0.1 * plot_length - 0.2, 0.2])
+        plt.xlim([-span - 0.2, 0.2])
         plt.ylim([0, 0.14])
         plt.xlabel('Relative time [s]')
 
@@ -516,22 +713,24 @@ class KSTARWidget(QDialog):
         
         plt.subplot(3,3,3)
         plt.title('Response and target')
-        plt.plot(ts,self.outputs['βp'],'k',linewidth=2*(100/dpi),label='βp')
-        plt.plot(ts,self.targets['βp'],'b',alpha=alpha,linestyle='-',linewidth=4*(100/dpi),label='Target')
+        plt.plot(*lines['βp'],'k',linewidth=2*(100/dpi),label='βp')
+        plt.plot(*lines['βp target'],'b',alpha=alpha,linestyle='-',linewidth=4*(100/dpi),label='Target')
+        self.shadeInfeasible(target_params.index('βp'))
         plt.grid(linewidth=0.5*(100/dpi))
         plt.legend(loc='upper left',fontsize=7.5*(100/dpi),frameon=False)
         plt.legend(fontsize=7.5*(100/dpi),frameon=False)
-        plt.xlim([-0.1 * plot_length - 0.2, 0.2])
+        plt.xlim([-span - 0.2, 0.2])
         plt.ylim([target_mins[0] - gaps[0], target_maxs[0] + gaps[0]])
         plt.xticks(color='w')
 
         plt.subplot(3,3,6)
-        plt.plot(ts,self.outputs['q95'],'k',linewidth=2*(100/dpi),label='q95')
-        plt.plot(ts,self.targets['q95'],'b',alpha=alpha,linestyle='-',linewidth=4*(100/dpi),label='Target')
+        plt.plot(*lines['q95'],'k',linewidth=2*(100/dpi),label='q95')
+        plt.plot(*lines['q95 target'],'b',alpha=alpha,linestyle='-',linewidth=4*(100/dpi),label='Target')
+        self.shadeInfeasible(target_params.index('q95'))
         plt.grid(linewidth=0.5*(100/dpi))
         plt.legend(loc='upper left',fontsize=7.5*(100/dpi),frameon=False)
         plt.legend(fontsize=7.5*(100/dpi),frameon=False)
-        plt.xlim([-0.1 * plot_length - 0.2, 0.2])
+        plt.xlim([-span - 0.2, 0.2])
         plt.ylim([target_mins[1] - gaps[1], target_maxs[1] + gaps[1]])
         '''plt.xticks(color='w')
 
@@ -556,7 +755,18 @@ class KSTARWidget(QDialog):
         plt.tight_layout(h_pad=0., rect=(0.05,0.05,0.95,0.95))
         self.first = False
 
+    def shadeInfeasible(self, i):
+        if self.atlas is None:
+            return
+        targets = [i2f(self.targetSliderDict[p].value()) for p in target_params]
+        for j, (lo, hi) in enumerate(infeasible_spans(self.atlas, i, targets)):
+            plt.axhspan(lo, hi, color='r', alpha=0.1, linewidth=0, label='Infeasible' if j == 0 else None)
+
     def predictBoundary(self):
+        self.lazy.set(boundary_inputs=self.boundaryInputs())
+        self.rbdry, self.zbdry = self.lazy.get('boundary')
+
+    def boundaryInputs(self):
         ip = self.inputSliderDict[input_params[0]].value()/10**decimals
         bt = self.inputSliderDict[input_params[1]].value()/10**decimals
         bp = self.outputs['βp'][-1]
@@ -574,8 +784,12 @@ class KSTARWidget(QDialog):
         self.rx1, self.zx1 = self.new_action[1], -self.new_action[2]
         self.rx2, self.zx2 = self.rx1, -self.zx1
         drsep = self.new_action[3]
-        self.x2rz.set_inputs(ip, bt, bp, self.rx1, self.zx1, self.rx2, self.zx2, drsep, rin, rout)
-        self.rbdry, self.zbdry = self.x2rz.predict(post = True)
+        return ip, bt, bp, self.rx1, self.zx1, self.rx2, self.zx2, drsep, rin, rout
+
+    def boundary(self, inputs):
+        # Stateless, as it runs on the tick graph pool
+        rbdry, zbdry = self.x2rz.predict_batch(np.array([inputs]), post = True)
+        return rbdry[0], zbdry[0]
 
     def plotXpoints(self, method=1, zorder=100):
         if method == 0:
@@ -586,63 +800,71 @@ class KSTARWidget(QDialog):
             self.rx2, self.zx2 = self.rx1, -self.zx1
         plt.scatter([self.rx1,self.rx2],[self.zx1,self.zx2],marker='x',color='w',s=100*(100/dpi)**2,linewidths=2*(100/dpi),label='X-points',zorder=zorder)
 
-    def plotHeatLoads(self, n=10, both_side=True):
+    def plotHeatLoads(self):
+        for r, z, color, width, alpha in self.lazy.get('heat_loads'):
+            plt.plot(r,z,color,linewidth=width*(100/dpi),alpha=alpha)
+        plt.plot([self.rx1],[self.zx1],'r',linewidth=1*(100/dpi),label='Heat load')
+
+    def heatLoads(self, boundary, n=10, both_side=True):
+        # SOL legs from the lower X-point to the wall, as (r, z, color, linewidth, alpha) lines
+        rbdry, zbdry = boundary
+        lines = []
         kinds = ['linear','quadratic'] #,'cubic']
         wallPath = Path(np.array([Rwalls,Zwalls]).T)
-        idx1 = np.argmin(self.zbdry)
+        idx1 = np.argmin(zbdry)
         for kind in kinds:
-            f = interpolate.interp1d(self.rbdry[idx1-5:idx1],self.zbdry[idx1-5:idx1],kind=kind,fill_value='extrapolate')
-            rsol1 = np.linspace(self.rbdry[idx1],np.min(Rwalls)+1.e-4,n)
+            f = interpolate.interp1d(rbdry[idx1-5:idx1],zbdry[idx1-5:idx1],kind=kind,fill_value='extrapolate')
+            rsol1 = np.linspace(rbdry[idx1],np.min(Rwalls)+1.e-4,n)
             zsol1 = np.array([f(r) for r in rsol1])
             is_inside1 = wallPath.contains_points(np.array([rsol1,zsol1]).T)
             
-            f = interpolate.interp1d(self.zbdry[idx1+5:idx1:-1],self.rbdry[idx1+5:idx1:-1],kind=kind,fill_value='extrapolate')
-            zsol2 = np.linspace(self.zbdry[idx1],np.min(Zwalls)+1.e-4,n)
+            f = interpolate.interp1d(zbdry[idx1+5:idx1:-1],rbdry[idx1+5:idx1:-1],kind=kind,fill_value='extrapolate')
+            zsol2 = np.linspace(zbdry[idx1],np.min(Zwalls)+1.e-4,n)
             rsol2 = np.array([f(z) for z in zsol2])
             is_inside2 = wallPath.contains_points(np.array([rsol2,zsol2]).T)
-            if not np.all(zsol1[is_inside1]>self.zbdry[idx1+1]):
-                plt.plot(rsol1[is_inside1],zsol1[is_inside1],'r',linewidth=1.5*(100/dpi))
-            plt.plot(rsol2[is_inside2],zsol2[is_inside2],'r',linewidth=1.5*(100/dpi))
+            if not np.all(zsol1[is_inside1]>zbdry[idx1+1]):
+                lines.append((rsol1[is_inside1],zsol1[is_inside1],'r',1.5,1.))
+            lines.append((rsol2[is_inside2],zsol2[is_inside2],'r',1.5,1.))
             if both_side:
-                plt.plot(self.rbdry[idx1-4:idx1+4],-self.zbdry[idx1-4:idx1+4],'b',linewidth=2*(100/dpi),alpha=0.1)
-                plt.plot(rsol1[is_inside1],-zsol1[is_inside1],'r',linewidth=1.5*(100/dpi),alpha=0.2)
-                plt.plot(rsol2[is_inside2],-zsol2[is_inside2],'r',linewidth=1.5*(100/dpi),alpha=0.2)
+                lines.append((rbdry[idx1-4:idx1+4],-zbdry[idx1-4:idx1+4],'b',2,0.1))
+                lines.append((rsol1[is_inside1],-zsol1[is_inside1],'r',1.5,0.2))
+                lines.append((rsol2[is_inside2],-zsol2[is_inside2],'r',1.5,0.2))
         for kind in kinds:
-            f = interpolate.interp1d(self.rbdry[idx1-5:idx1+1],self.zbdry[idx1-5:idx1+1],kind=kind,fill_value='extrapolate')
-            rsol1 = np.linspace(self.rbdry[idx1],np.min(Rwalls)+1.e-4,n)
+            f = interpolate.interp1d(rbdry[idx1-5:idx1+1],zbdry[idx1-5:idx1+1],kind=kind,fill_value='extrapolate')
+            rsol1 = np.linspace(rbdry[idx1],np.min(Rwalls)+1.e-4,n)
             zsol1 = np.array([f(r) for r in rsol1])
             is_inside1 = wallPath.contains_points(np.array([rsol1,zsol1]).T)
 
-            f = interpolate.interp1d(self.zbdry[idx1+5:idx1-1:-1],self.rbdry[idx1+5:idx1-1:-1],kind=kind,fill_value='extrapolate')
-            zsol2 = np.linspace(self.zbdry[idx1],np.min(Zwalls)+1.e-4,n)
+            f = interpolate.interp1d(zbdry[idx1+5:idx1-1:-1],rbdry[idx1+5:idx1-1:-1],kind=kind,fill_value='extrapolate')
+            zsol2 = np.linspace(zbdry[idx1],np.min(Zwalls)+1.e-4,n)
             rsol2 = np.array([f(z) for z in zsol2])
             is_inside2 = wallPath.contains_points(np.array([rsol2,zsol2]).T)
-            if not np.all(zsol1[is_inside1]>self.zbdry[idx1+1]):
-                plt.plot(rsol1[is_inside1],zsol1[is_inside1],'r',linewidth=1.5*(100/dpi))
-            plt.plot(rsol2[is_inside2],zsol2[is_inside2],'r',linewidth=1.5*(100/dpi))
+            if not np.all(zsol1[is_inside1]>zbdry[idx1+1]):
+                lines.append((rsol1[is_inside1],zsol1[is_inside1],'r',1.5,1.))
+            lines.append((rsol2[is_inside2],zsol2[is_inside2],'r',1.5,1.))
             if both_side:
-                plt.plot(rsol1[is_inside1],-zsol1[is_inside1],'r',linewidth=1.5*(100/dpi),alpha=0.2)
-                plt.plot(rsol2[is_inside2],-zsol2[is_inside2],'r',linewidth=1.5*(100/dpi),alpha=0.2)
-        plt.plot([self.rx1],[self.zx1],'r',linewidth=1*(100/dpi),label='Heat load')
+                lines.append((rsol1[is_inside1],-zsol1[is_inside1],'r',1.5,0.2))
+                lines.append((rsol2[is_inside2],-zsol2[is_inside2],'r',1.5,0.2))
+        return lines
 
     def plotBackground(self):
         plt.imshow(self.img,extent=[-1.6,2.45,-1.5,1.35])
 
     def plotHeating(self):
-        pnb1a = self.inputSliderDict['Pnb1a [MW]'].value()/10**decimals
-        pnb1b = self.inputSliderDict['Pnb1b [MW]'].value()/10**decimals
-        pnb1c = self.inputSliderDict['Pnb1c [MW]'].value()/10**decimals
-        pec2 = self.inputSliderDict['Pec2 [MW]'].value()/10**decimals
-        pec3 = self.inputSliderDict['Pec3 [MW]'].value()/10**decimals
-        zec2 = self.inputSliderDict['Zec2 [cm]'].value()/10**decimals
-        zec3 = self.inputSliderDict['Zec3 [cm]'].value()/10**decimals
-        bt = self.inputSliderDict['Bt [T]'].value()/10**decimals
+        self.lazy.set(heating_inputs=[i2f(self.inputSliderDict[p].value()) for p in ['Pnb1a [MW]','Pnb1b [MW]','Pnb1c [MW]','Pec2 [MW]','Pec3 [MW]','Zec2 [cm]','Zec3 [cm]','Bt [T]']])
+        for r, lower, upper, color, alpha, label in self.lazy.get('heating'):
+            plt.fill_between(r,lower,upper,color=color,alpha=alpha,label=label)
+
+    def heating(self, inputs):
+        # NBI ports and EC beams to the resonance, as (r, lower z, upper z, color, alpha, label) patches
+        pnb1a, pnb1b, pnb1c, pec2, pec3, zec2, zec3, bt = inputs
+        patches = []
         
         rt1,rt2,rt3 = 1.486,1.720,1.245
         w,h = 0.13,0.45
-        plt.fill_between([rt1-w/2,rt1+w/2],[-h/2,-h/2],[h/2,h/2],color='g',alpha=0.9 if pnb1a>=0.5 else 0.3)
-        plt.fill_between([rt2-w/2,rt2+w/2],[-h/2,-h/2],[h/2,h/2],color='g',alpha=0.9 if pnb1b>=0.5 else 0.3)
-        plt.fill_between([rt3-w/2,rt3+w/2],[-h/2,-h/2],[h/2,h/2],color='g',alpha=0.9 if pnb1c>=0.5 else 0.3,label='NBI')
+        patches.append(([rt1-w/2,rt1+w/2],[-h/2,-h/2],[h/2,h/2],'g',0.9 if pnb1a>=0.5 else 0.3,None))
+        patches.append(([rt2-w/2,rt2+w/2],[-h/2,-h/2],[h/2,h/2],'g',0.9 if pnb1b>=0.5 else 0.3,None))
+        patches.append(([rt3-w/2,rt3+w/2],[-h/2,-h/2],[h/2,h/2],'g',0.9 if pnb1c>=0.5 else 0.3,'NBI'))
 
         for ns in [1,2,3]:
             rs = 1.60219e-19*1.8*bt/(2*np.pi*9.10938e-31*ec_freq)*ns
@@ -651,12 +873,16 @@ class KSTARWidget(QDialog):
         dz = 0.05
         rpos,zpos = 2.449,0.35
         zres = zpos + (zec2/100-zpos)*(rs-rpos)/(1.8-rpos)
-        plt.fill_between([rs,rpos],[zres-dz,zpos],[zres+dz,zpos],color='orange',alpha=0.9 if pec2>0.2 else 0.3)
+        patches.append(([rs,rpos],[zres-dz,zpos],[zres+dz,zpos],'orange',0.9 if pec2>0.2 else 0.3,None))
         rpos,zpos = 2.451,-0.35
         zres = zpos + (zec3/100-zpos)*(rs-rpos)/(1.8-rpos)
-        plt.fill_between([rs,rpos],[zres-dz,zpos],[zres+dz,zpos],color='orange',alpha=0.9 if pec3>0.2 else 0.3,label='ECH')
+        patches.append(([rs,rpos],[zres-dz,zpos],[zres+dz,zpos],'orange',0.9 if pec3>0.2 else 0.3,'ECH'))
+        return patches
+
+    def predict0d(self,steady=True,record=True):
+        self.tick_timer.start()
+        self.tick_boundary_inputs = self.boundaryInputs() # On the previous βp, as the tick graph and replay have it
 
-    def predict0d(self,steady=True):
         # Predict output_params0 (βn, q95, q0, li)
         if steady:
             x = np.zeros(17)
@@ -733,35 +959,55 @@ class KSTARWidget(QDialog):
         self.histories[:-1] = self.histories[1:]
         self.histories[-1] = list(self.new_action) + list([self.outputs['βp'][-1], self.outputs['q95'][-1]])
 
-        # Estimate H factors (h89, h98)
-        ip = self.inputSliderDict['Ip [MA]'].value()/10**decimals
-        bt = self.inputSliderDict['Bt [T]'].value()/10**decimals
-        fgw = self.inputSliderDict['GW.frac. [-]'].value()/10**decimals
-        ptot = max(self.inputSliderDict['Pnb1a [MW]'].value()/10**decimals \
-               + self.inputSliderDict['Pnb1b [MW]'].value()/10**decimals \
-               + self.inputSliderDict['Pnb1c [MW]'].value()/10**decimals \
-               + self.inputSliderDict['Pec2 [MW]'].value()/10**decimals \
-               + self.inputSliderDict['Pec3 [MW]'].value()/10**decimals \
-               , 1.e-1) # Not to diverge
-        rin = self.inputSliderDict['In.Mid. [m]'].value()/10**decimals
-        rout = self.inputSliderDict['Out.Mid. [m]'].value()/10**decimals
-        k = self.inputSliderDict['Elon. [-]'].value()/10**decimals
-        rgeo, amin = 0.5*(rin+rout), 0.5*(rout-rin)
-        ne = fgw*10*(ip/(np.pi*amin**2))
-        m = 2.0 # Mass number
-
-        tau89 = 0.038*ip**0.85*bt**0.2*ne**0.1*ptot**-0.5*rgeo**1.5*k**0.5*(amin/rgeo)**0.3*m**0.5
-        tau98 = 0.0562*ip**0.93*bt**0.15*ne**0.41*ptot**-0.69*rgeo**1.97*k**0.78*(amin/rgeo)**0.58*m**0.19
-        h89 = 1.e-6*self.outputs['wmhd'][-1]/ptot/tau89
-        h98 = 1.e-6*self.outputs['wmhd'][-1]/ptot/tau98
-
-        if len(self.outputs['h89']) >= plot_length:
-            del self.outputs['h89'][0], self.outputs['h98'][0]
-        elif len(self.outputs['h89']) == 1:
-            self.outputs['h89'][0], self.outputs['h98'][0] = h89, h98
-
-        self.outputs['h89'].append(h89)
-        self.outputs['h98'].append(h98)
+        # Append this tick to the trace history
+        u = {p: i2f(self.inputSliderDict[p].value()) for p in input_params}
+        u['Pnb [MW]'] = u['Pnb1a [MW]'] + u['Pnb1b [MW]'] + u['Pnb1c [MW]']
+        u.update({p: self.outputs[p][-1] for p in target_params})
+        u.update({p + ' target': i2f(self.targetSliderDict[p].value()) for p in target_params})
+        self.history.append([u[p] for p in history_params])
+
+        # H factors (h89, h98) are estimated when read, in one batch over the ticks since the last read
+        self.h_pending.append(([i2f(self.inputSliderDict[p].value()) for p in input_params], self.outputs['wmhd'][-1]))
+        del self.h_pending[:-plot_length]
+        self.tick_timer.stop()
+        if record:
+            self.recordTick()
+
+    def estimateHFactors(self):
+        # Fill the h89/h98 histories up to this tick
+        if not self.h_pending:
+            return
+        u, wmhd = [np.array(v) for v in zip(*self.h_pending)]
+        h89, h98 = h_factors(u, wmhd)
+        for p, h in [('h89', h89), ('h98', h98)]:
+            if len(self.outputs[p]) == 1:
+                self.outputs[p][0] = h[0]
+            self.outputs[p] += list(h)
+            del self.outputs[p][:-plot_length]
+        self.h_pending = []
+
+    def recordTick(self, boundary=None):
+        # Stream this tick to the recorder, with the boundary predicted alongside it if given
+        if boundary is not None:
+            self.rbdry, self.zbdry = boundary
+        if self.recorder is not None:
+            self.estimateHFactors()
+            row = {}
+            if record_boundary:
+                if boundary is None: # Not rendered on this tick
+                    self.lazy.set(boundary_inputs=self.tick_boundary_inputs)
+                    self.rbdry, self.zbdry = self.lazy.get('boundary')
+                row = {'rbdry': self.rbdry, 'zbdry': self.zbdry}
+            self.recorder.record(
+                time = 0.1 * self.tick,
+                inputs = [i2f(self.inputSliderDict[p].value()) for p in input_params],
+                actions = self.new_action,
+                outputs = [self.outputs[p][-1] for p in output_params2],
+                targets = [i2f(self.targetSliderDict[p].value()) for p in target_params],
+                **row
+            )
+        self.tick += 1
+        self.applySwaps()
 
     def shuffleModels(self):
         np.random.shuffle(self.k2rz.models)
@@ -790,7 +1036,7 @@ class KSTARWidget(QDialog):
         for i, target_param in enumerate(target_params):
             for level in [0.6, 0.7, 0.8, 0.9, 1.0, 0.9, 0.8, 0.7, 0.6, 0.5, 0.4, 0.3, 0.2, 0.1, 0.0, 0.1, 0.2, 0.3, 0.4, 0.5]:
                 target_value = target_mins[i] + level * (target_maxs[i] - target_mins[i])
-                self.targetSliderDict[target_param].setValue(f2i(target_value))
+                self.setTargets({target_param: target_value})
         self.predictBoundary()
         self.reCreateOutputBox(predict = False)
         self.rtRunPushButton.setChecked(True)
@@ -798,21 +1044,64 @@ class KSTARWidget(QDialog):
     def test2(self):
         steps = 10
         self.rtRunPushButton.setChecked(False)
+        start = len(self.history)
         for levels in [[0.0, 0.667], [0.5, 0.333], [1.0, 0.667]]:
             targets = np.array(target_mins) + np.array(levels) * np.subtract(target_maxs, target_mins)
             dtargets = np.subtract(targets, [i2f(self.targetSliderDict[p].value()) for p in target_params]) / steps
             for _ in range(steps):
-                for i, p in enumerate(target_params):
-                    self.update = (i == len(target_params) - 1)
-                    self.targetSliderDict[p].setValue(f2i(i2f(self.targetSliderDict[p].value()) + dtargets[i]))
+                self.setTargets({p: i2f(self.targetSliderDict[p].value()) + dtargets[i] for i, p in enumerate(target_params)})
             for _ in range(steps):
                 self.autoControl()
                 self.predict0d(steady = steady_model)
         self.predictBoundary()
         self.reCreateOutputBox(predict = False)
+        self.reportMetrics(start)
         self.rtRunPushButton.setChecked(True)
 
+    def reportMetrics(self, start):
+        # Tracking metrics of the ticks of the trace history from tick start on, one row per target change.
+        # The tick before start is read as the reference of a change on the first tick, then dropped.
+        first = max(start - 1, 0)
+        outputs = self.history.samples(first, target_params)[:, None]
+        targets = self.history.samples(first, [p + ' target' for p in target_params])[:, None]
+        n_ticks = len(outputs)
+        starts, metrics = staircase_metrics(outputs, targets, scale=np.subtract(target_maxs, target_mins))
+        if first < start and len(starts) > 1 and starts[1] == 1:
+            starts, metrics = starts[1:], {k: v[1:] for k, v in metrics.items()}
+        print(metrics_table(metrics, target_params, rows=[f'{0.1 * (i - n_ticks):.1f} s' for i in starts]))
+
+    def toggleRecording(self):
+        if self.recordPushButton.isChecked():
+            os.makedirs(record_path, exist_ok=True)
+            path = record_path + time.strftime('session_%Y%m%d_%H%M%S.rec')
+            meta = {
+                'input_params': input_params,
+                'action_params': ['Ip [MA]', 'Rx [m]', '|Zx| [m]', 'dRsep [m]', 'In.Mid. [m]', 'Out.Mid. [m]'],
+                'output_params': output_params2,
+                'target_params': target_params,
+                'variants': dict(self.variants),
+                'seq_len': seq_len,
+                'x0': self.x.tolist(), # LSTM window of the last tick, which seeds the replay windows of the first ones
+                'year_in': year_in,
+            }
+            self.recorder = trajectory_recorder(path, meta=meta)
+            if record_boundary:
+                self.lazy.subscribe('boundary', 'recorder')
+            print(f'Recording to {path}')
+        elif self.recorder is not None:
+            self.recorder.close()
+            print(f'Recording saved to {self.recorder.path}')
+            self.recorder = None
+            self.lazy.unsubscribe('boundary', 'recorder')
+
+    def closeEvent(self, event):
+        if self.recorder is not None:
+            self.recordPushButton.setChecked(False)
+            self.toggleRecording()
+        super(KSTARWidget, self).closeEvent(event)
+
     def dumpOutput(self):
+        self.estimateHFactors()
         print('\nTrajectories:')
         print(f"Time [s]: {self.time[-len(self.outputs['βn']):]}")
         for dummy in dummy_params:
@@ -824,6 +1113,10 @@ class KSTARWidget(QDialog):
             print(f'{input_param}: {i2f(self.inputSliderDict[input_param].value())}')
         for i, p in enumerate(['Rx [m]', 'Zx [m]', 'dRsep [m]']):
             print(f'{p}: {self.new_action[i + 1]}')
+        print(f'\nTick: {format_stats(self.tick_timer.stats())}')
+        for name, stats in self.tick_graph.stats().items():
+            print(f'  {name}: {format_stats(stats)}')
+        print(f'Lazy values: {self.lazy.computed} computed, {self.lazy.reused} reused')
 
 
 if __name__ == '__main__':
@@ -0,0 +1,37 @@
+#!/usr/bin/env python
+
+import os, sys, glob, time
+import numpy as np
+from common.simulator import *
+from common.scenario import load_scenario, run_scenarios
+from common.metrics import metric_names, metrics_table
+
+# Setting
+base_path = os.path.abspath(os.path.dirname(sys.argv[0]))
+scenario_path = base_path + '/scenarios/'
+out_path = base_path + '/scenarios/results/'
+max_models = 10
+policy = 'bp_q95' # Variant of weights/rl/rt_control (rt_policy_variants in common/simulator.py)
+record = True # One .rec per scenario in out_path, readable by replay.py
+
+if __name__ == '__main__':
+    paths = sys.argv[1:] or sorted(glob.glob(scenario_path + '*.json') + glob.glob(scenario_path + '*.y*ml'))
+    scenarios = [load_scenario(p) for p in paths]
+    models = rt_control_models(base_path, n_models=max_models)
+    sim = variant_plasma(policy, models, base_path)
+
+    os.makedirs(out_path, exist_ok=True)
+    t0 = time.time()
+    results = run_scenarios(sim, scenarios, record_path=out_path if record else None, meta={'policy': policy})
+    print(f'{len(scenarios)} scenarios in {time.time() - t0:.1f} s')
+
+    lines = ['scenario,start,signal,' + ','.join(metric_names)]
+    for r in results:
+        rows = [f'{dt * i:.1f} s' for i in r['starts']]
+        print(f'\n{r["name"]}\n' + metrics_table(r['metrics'], sim.target_params, rows=rows))
+        for i, start in enumerate(r['starts']):
+            for j, p in enumerate(sim.target_params):
+                lines.append(f'{r["name"]},{dt * start:.1f},{p},' + ','.join(f'{r["metrics"][k][i, 0, j]:.6g}' for k in metric_names))
+    with open(out_path + 'summary.csv', 'w') as f:
+        f.write('\n'.join(lines) + '\n')
+    print(f'\nSaved to {out_path}')
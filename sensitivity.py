@@ -0,0 +1,34 @@
+#!/usr/bin/env python
+
+import os, sys
+import numpy as np
+from common.simulator import *
+from common.jacobian import jacobian_model, steady_sensitivity, lstm_sensitivity
+
+# Setting
+base_path = os.path.abspath(os.path.dirname(sys.argv[0]))
+max_models = 10
+operating_point = rt_input_init # Input panel values (input_params order)
+out_path = base_path + '/sensitivity.npz'
+steady_params = output_params0 + output_params1
+
+if __name__ == '__main__':
+    models = rt_control_models(base_path, n_models=max_models)
+    models['kstar_nn'] = kstar_nn(model_path=base_path + '/weights/nn/', n_models=max_models)
+    nn, bpw, lstm = [jacobian_model(models[k]) for k in ['kstar_nn', 'bpw_nn', 'kstar_lstm']]
+
+    # Steady state: kstar_nn -> bpw
+    u = np.array([operating_point])
+    y, j = steady_sensitivity(nn, bpw, u)
+    print('Steady-state sensitivity d(output)/d(input):')
+    print(' ' * 14 + ''.join(f'{p:>10}' for p in steady_params))
+    for i, p in enumerate(input_params):
+        print(f'{p:<14}' + ''.join(f'{v:10.3g}' for v in j[0, :, i]))
+
+    # LSTM one tick after a window of the steady state, for a step held over the window
+    sim = batched_plasma(models['kstar_lstm'], models['bpw_nn'], models['kstar_nn'])
+    sim.reset(u, [[0., 0.]])
+    y_lstm, j_window, j_step = lstm_sensitivity(lstm, sim.x)
+    np.savez(out_path, input_params=input_params, steady_params=steady_params, steady=j[0], lstm_params=output_params0,
+             lstm_window=j_window[0], lstm_step=j_step[0], operating_point=operating_point)
+    print(f'Saved to {out_path}')
@@ -0,0 +1,71 @@
+#!/usr/bin/env python
+
+import os, sys, time
+import numpy as np
+from common.simulator import *
+from common.scenario import load_scenario, run_scenarios, run_cached
+from common.cache import result_cache, weights_checksum
+from common.metrics import metric_names
+from common.sweep import expand_grid, task_queue, run_pool, aggregate
+
+# Setting
+base_path = os.path.abspath(os.path.dirname(sys.argv[0]))
+sweep_path = base_path + '/sweeps/'
+queue_path = sweep_path + 'sweep.sqlite' # Shared file for workers on other hosts
+table_path = sweep_path + 'sweep.csv'
+scenario_files = ['test1.json', 'test2.json'] # In scenarios/
+n_workers = 4
+stale_after = 3600. # [s] Running tasks older than this are requeued at start (their worker died)
+cache_path = base_path + '/cache/' # Results of unchanged (weights, settings, scenario) cells are reused; None to disable
+cache_bytes = 2**30
+grid = {
+    'policy': ['bp_q95', '3frame', '3frame_v220505', '3frame_wide', 'single', 'single_wide'], # Weight variant, which fixes the lookback
+    'bavg': [0.0, 0.3, 0.6], # Damp factor of the action
+    'n_models': [1, 5, 10], # Ensemble size of the surrogates
+    'efitrt': [False, True], # LSTM variant
+}
+
+# Usage: sweep.py (queue the grid, run local workers, write the table) | sweep.py worker (join from another host) | sweep.py aggregate
+
+models_cache = {}
+
+def make_sim(params):
+    key = (params['n_models'], params['efitrt'])
+    if key not in models_cache:
+        models_cache[key] = rt_control_models(base_path, n_models=params['n_models'], efitrt=params['efitrt'])
+    return variant_plasma(params['policy'], models_cache[key], base_path, bavg=params['bavg'])
+
+def run_task(params):
+    # Every scenario in one batch; one row per scenario and target with the metrics averaged over its target changes
+    path, family, lookback, wide = rt_policy_variants[params['policy']]
+    scenarios = [load_scenario(base_path + '/scenarios/' + f) for f in scenario_files]
+    if cache_path is None:
+        results = run_scenarios(make_sim(params), scenarios)
+    else:
+        weights = weights_checksum(*[base_path + '/weights/' + p for p in ['lstm/efitrt/' if params['efitrt'] else 'lstm/v220505/',
+                                     'nn/', 'bpw/v220505/', 'x2k/', 'rl/rt_control/' + path]])
+        results = run_cached(lambda: make_sim(params), scenarios, result_cache(cache_path, cache_bytes), [weights, params])
+    rows = []
+    for r in results:
+        for j, p in enumerate(rt_target_params if family == 'v3' else v2_target_params):
+            row = {'lookback': lookback, 'scenario': r['name'], 'signal': p}
+            row.update({k: float(np.nanmean(r['metrics'][k][:, 0, j])) if np.any(~np.isnan(r['metrics'][k][:, 0, j])) else None
+                        for k in metric_names})
+            row['iae'] = float(np.sum(r['metrics']['iae'][:, 0, j]))
+            rows.append(row)
+    return rows
+
+if __name__ == '__main__':
+    mode = sys.argv[1] if len(sys.argv) > 1 else 'run'
+    os.makedirs(sweep_path, exist_ok=True)
+    queue = task_queue(queue_path)
+    if mode == 'run':
+        queue.add(expand_grid(grid))
+        queue.requeue(stale_after=stale_after)
+        print(f'Tasks: {queue.counts()}')
+    if mode in ['run', 'worker']:
+        t0 = time.time()
+        run_pool(queue_path, run_task, n_workers)
+        print(f'Workers done in {time.time() - t0:.1f} s, tasks: {queue.counts()}')
+    rows = aggregate(queue_path, table_path)
+    print(f'{len(rows)} rows saved to {table_path}')